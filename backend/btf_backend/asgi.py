@@ -12,6 +12,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
 from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
 from django.core.asgi import get_asgi_application  # noqa: E402
 
+from chat.drain import RejectWhileDraining, install_drain_signal  # noqa: E402
 from core.websockets import JWTAuthMiddlewareStack  # noqa: E402
 from .routing import websocket_urlpatterns  # noqa: E402
 
@@ -20,8 +21,13 @@ django_asgi_app = get_asgi_application()
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
-        "websocket": AllowedHostsOriginValidator(
-            JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        # Refuse handshakes before the JWT lookup while this server drains.
+        "websocket": RejectWhileDraining(
+            AllowedHostsOriginValidator(
+                JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+            )
         ),
     }
 )
+
+install_drain_signal()
@@ -217,6 +217,60 @@ if CHANNEL_REDIS_URL:
         },
     }
 
+# Number of rendered messages kept per group in the Redis hot-tail cache
+CHAT_HOT_TAIL_SIZE = int(os.getenv('CHAT_HOT_TAIL_SIZE', '100'))
+
+# Per-socket outbound queue bound and what to do when a slow client fills it
+# ("coalesce", "resync" or "disconnect")
+CHAT_SEND_QUEUE_SIZE = int(os.getenv('CHAT_SEND_QUEUE_SIZE', '256'))
+CHAT_SEND_OVERFLOW_POLICY = os.getenv('CHAT_SEND_OVERFLOW_POLICY', 'resync')
+
+# Bounded per-group event log used to replay missed events on reconnect
+CHAT_EVENT_LOG_SIZE = int(os.getenv('CHAT_EVENT_LOG_SIZE', '500'))
+CHAT_EVENT_LOG_TTL_SECONDS = int(os.getenv('CHAT_EVENT_LOG_TTL_SECONDS', str(24 * 60 * 60)))
+
+# Interval at which buffered WebSocket read markers are written to the database
+CHAT_READ_MARKER_FLUSH_SECONDS = float(os.getenv('CHAT_READ_MARKER_FLUSH_SECONDS', '2'))
+
+# Interval at which buffered reaction deltas are applied to message counts
+CHAT_REACTION_FLUSH_SECONDS = float(os.getenv('CHAT_REACTION_FLUSH_SECONDS', '1'))
+
+# Distinct emoji a single message can collect as reactions
+CHAT_MAX_REACTION_EMOJI = int(os.getenv('CHAT_MAX_REACTION_EMOJI', '20'))
+
+# Lifetime of the per-user Redis set of accessible chat groups (rebuilt lazily)
+CHAT_ACL_TTL_SECONDS = int(os.getenv('CHAT_ACL_TTL_SECONDS', str(24 * 60 * 60)))
+
+# Maximum number of groups one multiplexed chat socket (ws/chat/) may subscribe to
+CHAT_MULTIPLEX_MAX_GROUPS = int(os.getenv('CHAT_MULTIPLEX_MAX_GROUPS', '200'))
+
+# Chat presence heartbeat lifetime (clients ping more often than this) and the
+# minimum interval between typing notifications per user and group
+CHAT_PRESENCE_TTL_SECONDS = int(os.getenv('CHAT_PRESENCE_TTL_SECONDS', '60'))
+CHAT_TYPING_THROTTLE_SECONDS = int(os.getenv('CHAT_TYPING_THROTTLE_SECONDS', '3'))
+
+# Chat sockets silent for longer than this are closed (0 disables), and the
+# maximum number of concurrent chat sockets per user; the oldest is closed
+CHAT_HEARTBEAT_DEADLINE_SECONDS = int(os.getenv('CHAT_HEARTBEAT_DEADLINE_SECONDS', '150'))
+CHAT_MAX_SOCKETS_PER_USER = int(os.getenv('CHAT_MAX_SOCKETS_PER_USER', '10'))
+
+# Deploy drain (SIGUSR1 from scripts/docker-entrypoint.sh): window over which
+# open chat sockets are closed and the upper bound of the random reconnect delay
+CHAT_DRAIN_WINDOW_SECONDS = int(os.getenv('CHAT_DRAIN_WINDOW_SECONDS', '20'))
+CHAT_DRAIN_RECONNECT_JITTER_SECONDS = int(os.getenv('CHAT_DRAIN_RECONNECT_JITTER_SECONDS', '30'))
+
+# Comma-separated chat blocklist; matching messages are held as pending for review
+CHAT_BLOCKLIST = [
+    term.strip()
+    for term in os.getenv('CHAT_BLOCKLIST', '').split(',')
+    if term.strip()
+]
+
+# Offline chat digest emails (`manage.py send_chat_digests`, run from cron):
+# how far back a digest may reach and how many emails share one SMTP batch
+CHAT_DIGEST_LOOKBACK_HOURS = int(os.getenv('CHAT_DIGEST_LOOKBACK_HOURS', '24'))
+CHAT_DIGEST_BATCH_SIZE = int(os.getenv('CHAT_DIGEST_BATCH_SIZE', '100'))
+
 # File upload scanning defaults
 FILE_UPLOAD_MAX_BYTES = int(os.getenv('FILE_UPLOAD_MAX_BYTES', str(25 * 1024 * 1024)))
 FILE_UPLOAD_ALLOWED_MIME_TYPES = [
@@ -0,0 +1,193 @@
+"""
+Redis-backed index of the chat groups each user may access.
+
+Each user owns a Redis set of accessible group ids (memberships plus mentored
+groups) so WebSocket connects can be authorised with one Redis lookup
+instead of loading the group and its members. The set is built lazily from
+the database and kept current by the `GroupMember` / `Group.mentor` signal
+handlers in `chat.signals`, which also push a control message that closes any
+socket whose access was revoked.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Q
+from redis.exceptions import RedisError, WatchError
+
+from core.redis_client import get_redis_client
+from groups.models import Group
+
+from .permissions import has_role_based_access, user_has_group_access
+
+logger = logging.getLogger(__name__)
+
+ACL_TTL_SECONDS = getattr(settings, "CHAT_ACL_TTL_SECONDS", 24 * 60 * 60)
+
+# Marks a fully built set; a user with no groups still has a one-member set.
+_BUILT_MARKER = "~built"
+
+
+def membership_key(user_id) -> str:
+    return f"chat:acl:user:{user_id}"
+
+
+def membership_version_key(user_id) -> str:
+    return f"chat:acl:user:{user_id}:version"
+
+
+def get_user_channel_name(user_id) -> str:
+    """Channel-layer group every chat socket of a user joins for control messages."""
+
+    return f"chat_user_{user_id}"
+
+
+def user_can_access_group(user, group_id) -> bool:
+    """
+    Return whether `user` may open the chat of `group_id`. Admins, supervisors
+    and staff are answered from the user row alone; everybody else with one
+    Redis round trip once their set is built.
+    """
+
+    if not getattr(user, "is_authenticated", False):
+        return False
+    if has_role_based_access(user):
+        return True
+
+    client = get_redis_client()
+    if client is None:
+        return _user_has_access_in_db(user, group_id)
+
+    key = membership_key(user.pk)
+    try:
+        built, allowed = client.smismember(key, [_BUILT_MARKER, str(group_id)])
+        if built:
+            return bool(allowed)
+        group_ids = _build(client, user.pk)
+    except RedisError:
+        logger.warning("Chat ACL cache unavailable for user %s", user.pk, exc_info=True)
+        return _user_has_access_in_db(user, group_id)
+
+    if group_ids is None:
+        # Membership changed while building; answer from the database.
+        return _user_has_access_in_db(user, group_id)
+    return str(group_id) in group_ids
+
+
+def accessible_group_ids(user, group_ids) -> set[str]:
+    """
+    Return the subset of `group_ids` that `user` may open, using one Redis
+    round trip (or one query) however many groups are asked about. Unlike
+    `user_can_access_group`, unknown group ids are never returned.
+    """
+
+    group_ids = list(dict.fromkeys(str(group_id) for group_id in group_ids))
+    if not group_ids or not getattr(user, "is_authenticated", False):
+        return set()
+    if has_role_based_access(user):
+        return {str(pk) for pk in Group.objects.filter(pk__in=group_ids).values_list("id", flat=True)}
+
+    client = get_redis_client()
+    if client is None:
+        return _accessible_in_db(user, group_ids)
+
+    try:
+        built, *allowed = client.smismember(membership_key(user.pk), [_BUILT_MARKER, *group_ids])
+        if built:
+            return {group_id for group_id, flag in zip(group_ids, allowed) if flag}
+        built_ids = _build(client, user.pk)
+    except RedisError:
+        logger.warning("Chat ACL cache unavailable for user %s", user.pk, exc_info=True)
+        return _accessible_in_db(user, group_ids)
+
+    if built_ids is None:
+        return _accessible_in_db(user, group_ids)
+    return set(group_ids) & built_ids
+
+
+def grant_group_access(user_id, group_id) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    key = membership_key(user_id)
+    try:
+        # SADD on an unbuilt set leaves it unbuilt (no marker), which is fine.
+        client.pipeline().incr(membership_version_key(user_id)).sadd(key, str(group_id)).execute()
+    except RedisError:
+        _invalidate(client, user_id)
+
+
+def revoke_group_access(user_id, group_id) -> None:
+    """Drop `group_id` from the user's set and close their open sockets on it."""
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            client.pipeline().incr(membership_version_key(user_id)).srem(
+                membership_key(user_id), str(group_id)
+            ).execute()
+        except RedisError:
+            _invalidate(client, user_id)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        get_user_channel_name(user_id),
+        {
+            "type": "chat.access_revoked",
+            "group_id": str(group_id),
+        },
+    )
+
+
+def _build(client, user_id) -> set[str] | None:
+    """
+    Load the user's groups from the database into Redis. The version key is
+    watched so a grant or revocation racing with the read aborts the write.
+    """
+
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(membership_version_key(user_id))
+            group_ids = {
+                str(group_id)
+                for group_id in Group.objects.filter(Q(members__user_id=user_id) | Q(mentor_id=user_id))
+                .values_list("id", flat=True)
+                .distinct()
+            }
+            key = membership_key(user_id)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(key, _BUILT_MARKER, *group_ids)
+            pipe.expire(key, ACL_TTL_SECONDS)
+            pipe.execute()
+        except WatchError:
+            return None
+    return group_ids
+
+
+def _invalidate(client, user_id) -> None:
+    try:
+        client.pipeline().incr(membership_version_key(user_id)).delete(membership_key(user_id)).execute()
+    except RedisError:
+        logger.warning("Failed to invalidate chat ACL for user %s", user_id, exc_info=True)
+
+
+def _user_has_access_in_db(user, group_id) -> bool:
+    group = Group.objects.filter(pk=group_id).only("id", "mentor_id").first()
+    return group is not None and user_has_group_access(user, group)
+
+
+def _accessible_in_db(user, group_ids) -> set[str]:
+    return {
+        str(pk)
+        for pk in Group.objects.filter(pk__in=group_ids)
+        .filter(Q(members__user=user) | Q(mentor=user))
+        .values_list("id", flat=True)
+        .distinct()
+    }
@@ -0,0 +1,67 @@
+"""
+Denormalised per-group chat activity (`Group.message_count`,
+`last_message_at`, `last_message_preview`, `last_message_author`).
+
+New messages bump the summary with a single conditional UPDATE inside the
+send transaction; messages held for review are skipped. Moderation can
+hide, restore or release any message, so moderated groups are recomputed
+from their visible messages instead; the same recomputation backs the
+`rebuild_chat_activity` repair command. Visible means what members see:
+approved and not deleted.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Left
+
+from groups.models import Group
+
+from .models import Message
+
+PREVIEW_LENGTH = Group._meta.get_field("last_message_preview").max_length
+
+
+def record_new_message(message: Message) -> None:
+    """Count a freshly created message and make it the group's last message."""
+
+    newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.created_at)
+    Group.objects.filter(pk=message.group_id).update(
+        message_count=F("message_count") + 1,
+        # Concurrent sends may commit out of order; only move forward.
+        last_message_at=Case(When(newer, then=Value(message.created_at)), default=F("last_message_at")),
+        last_message_preview=Case(
+            When(newer, then=Value(message.text[:PREVIEW_LENGTH])),
+            default=F("last_message_preview"),
+        ),
+        last_message_author=Case(
+            When(newer, then=Value(message.author_id)),
+            default=F("last_message_author"),
+            output_field=Group._meta.get_field("last_message_author").target_field,
+        ),
+    )
+
+
+def refresh_group_activity(group_ids: Iterable | None = None) -> int:
+    """
+    Recompute the summary of the given groups (all groups when `None`) with
+    one UPDATE. Returns the number of groups updated.
+    """
+
+    visible = Message.objects.filter(
+        group=OuterRef("pk"), is_deleted=False, moderation_status=Message.ModerationStatus.APPROVED
+    )
+    count = visible.order_by().values("group").annotate(total=Count("id")).values("total")
+    latest = visible.order_by("-created_at", "-id")
+
+    queryset = Group.objects.all()
+    if group_ids is not None:
+        queryset = queryset.filter(pk__in=list(group_ids))
+    return queryset.update(
+        message_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+        last_message_at=Subquery(latest.values("created_at")[:1]),
+        last_message_preview=Coalesce(Left(Subquery(latest.values("text")[:1]), PREVIEW_LENGTH), Value("")),
+        last_message_author=Subquery(latest.values("author_id")[:1]),
+    )
@@ -0,0 +1,113 @@
+"""
+Keyword pre-moderation for new chat messages.
+
+The blocklist (`CHAT_BLOCKLIST`) is compiled into an Aho-Corasick automaton,
+so a message is scanned in a single pass regardless of how many terms are
+configured. The automaton is cached and only rebuilt when the configured
+list changes. Terms match case-insensitively on whole words; multi-word
+terms are supported.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Sequence
+
+from django.conf import settings
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over casefolded terms."""
+
+    def __init__(self, terms: Sequence[str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Terms ending at each state (own and via failure links).
+        self._output: list[tuple[str, ...]] = [()]
+
+        for term in dict.fromkeys(" ".join(term.casefold().split()) for term in terms):
+            if term:
+                self._add(term)
+        self._link()
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def find(self, text: str) -> list[str]:
+        """Return the distinct blocklisted terms in `text`, in order of appearance."""
+
+        text = " ".join(text.casefold().split())
+        goto, fail, output = self._goto, self._fail, self._output
+        found: dict[str, None] = {}
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term in output[state]:
+                start = index - len(term) + 1
+                if _is_boundary(text, start - 1) and _is_boundary(text, index + 1):
+                    found.setdefault(term)
+        return list(found)
+
+    def _add(self, term: str) -> None:
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = (term,)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[child] = link if link != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+_lock = threading.Lock()
+_cached_source: object = None
+_cached_terms: tuple[str, ...] = ()
+_cached_matcher = KeywordMatcher(())
+
+
+def get_matcher() -> KeywordMatcher:
+    """
+    Return the automaton for the current blocklist. The common path is a
+    single identity check; the list is only compared (and the automaton only
+    rebuilt) when the setting object is replaced.
+    """
+
+    global _cached_source, _cached_terms, _cached_matcher
+    source = getattr(settings, "CHAT_BLOCKLIST", ())
+    if source is not _cached_source:
+        with _lock:
+            if source is not _cached_source:
+                terms = tuple(source)
+                if terms != _cached_terms:
+                    _cached_matcher = KeywordMatcher(terms)
+                    _cached_terms = terms
+                _cached_source = source
+    return _cached_matcher
+
+
+def find_blocked_terms(text: str) -> list[str]:
+    matcher = get_matcher()
+    return matcher.find(text) if matcher else []
@@ -0,0 +1,307 @@
+"""
+Redis-backed hot-tail cache holding the newest rendered messages per group.
+
+Each group owns a Redis list of JSON payloads (newest first) rendered with
+moderator visibility. Viewer-specific rules from `MessageSerializer` are then
+applied on read, so moderators and regular members share the same entries.
+A trailing end marker records that the list covers the group's entire
+history, which lets short conversations be served without a database query.
+
+Held (pending) messages never enter the tail. A hash next to it maps the
+group's newest held top-level messages to their authors; while it is not empty,
+moderators and those authors read the first page from the database instead.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Callable, Iterable
+
+from django.conf import settings
+from redis.exceptions import RedisError, WatchError
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.redis_client import get_redis_client
+
+from .models import Message
+from .permissions import ChatViewer
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+HOT_TAIL_SIZE = getattr(settings, "CHAT_HOT_TAIL_SIZE", 100)
+
+_END_MARKER = "~end"
+
+# KEYS: tail, version. ARGV: message id, payload, tail size. Prepends the
+# payload unless the tail already holds the message, which happens when a
+# concurrent prime read it from the database before this push ran. The tail
+# is newest first, so only the entries at least as new as the message are
+# checked. Returns 1 when pushed.
+PUSH_MESSAGE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+local id = tonumber(ARGV[1])
+for _, raw in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+  if raw == '~end' then
+    break
+  end
+  local cached = cjson.decode(raw)['id']
+  if cached == id then
+    return 0
+  end
+  if cached < id then
+    break
+  end
+end
+redis.call('LPUSH', KEYS[1], ARGV[2])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+
+def tail_key(group_id) -> str:
+    return f"chat:tail:{group_id}"
+
+
+def version_key(group_id) -> str:
+    return f"chat:tail:{group_id}:version"
+
+
+def pending_key(group_id) -> str:
+    return f"chat:tail:{group_id}:pending"
+
+
+def render_cached_payload(message: Message) -> str:
+    payload = MessageSerializer(message, context={"viewer": ChatViewer(can_moderate=True)}).data
+    return json.dumps(payload, cls=JSONEncoder)
+
+
+def get_recent_messages(group, *, limit: int, viewer: ChatViewer) -> tuple[list[dict], bool] | None:
+    """
+    Return the newest `limit` messages visible to the viewer plus a `hasMore`
+    flag, or `None` when the cache cannot answer and the caller should query
+    the database instead.
+    """
+
+    client = get_redis_client()
+    if client is None or limit > HOT_TAIL_SIZE:
+        return None
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.lrange(tail_key(group.pk), 0, -1)
+        pipe.hvals(pending_key(group.pk))
+        entries, held_by = pipe.execute()
+        if not entries:
+            primed = _prime(client, group)
+            if primed is None:
+                return None
+            entries, held_by = primed
+    except RedisError:
+        logger.warning("Chat hot-tail cache unavailable for group %s", group.pk, exc_info=True)
+        return None
+
+    if held_by and (viewer.can_moderate or str(viewer.user_id) in {_decode(author) for author in held_by}):
+        # The viewer may see held messages the tail leaves out.
+        return None
+
+    complete = bool(entries) and _decode(entries[-1]) == _END_MARKER
+    visible: list[dict] = []
+    for raw in entries:
+        decoded = _decode(raw)
+        if decoded == _END_MARKER:
+            continue
+        payload = json.loads(decoded)
+        if not viewer.can_moderate and payload.get("isDeleted"):
+            continue
+        if not viewer.can_moderate and (payload.get("author") or {}).get("id") != viewer.user_id:
+            payload.get("moderation", {}).pop("note", None)
+        visible.append(payload)
+        if len(visible) > limit:
+            return visible[:limit], True
+
+    if not complete:
+        # Hidden rows may have pushed the page past the cached window.
+        return None
+    return visible, False
+
+
+def push_message(message: Message) -> None:
+    """Prepend a freshly created message to its group's tail, if cached and not already in it."""
+
+    client = get_redis_client()
+    if client is None or message.parent_id is not None:
+        # The tail mirrors the main timeline, which only lists top-level messages.
+        return
+    if message.moderation_status == Message.ModerationStatus.PENDING:
+        # Held messages join the tail once released (`replace_messages`).
+        return
+
+    try:
+        client.register_script(PUSH_MESSAGE_SCRIPT)(
+            keys=[tail_key(message.group_id), version_key(message.group_id)],
+            args=[message.pk, render_cached_payload(message), HOT_TAIL_SIZE],
+        )
+    except RedisError:
+        logger.warning("Failed to push message %s to hot-tail cache", message.pk, exc_info=True)
+        invalidate_group(message.group_id)
+
+
+def hold_message(message: Message) -> None:
+    """Record a held top-level message so the viewers allowed to see it bypass the tail."""
+
+    client = get_redis_client()
+    if client is None or message.parent_id is not None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.incr(version_key(message.group_id))
+        pipe.hset(pending_key(message.group_id), message.pk, message.author_id)
+        pipe.execute()
+    except RedisError:
+        logger.warning("Failed to record held message %s in hot-tail cache", message.pk, exc_info=True)
+        invalidate_group(message.group_id)
+
+
+def replace_messages(messages: Iterable[Message]) -> None:
+    """
+    Swap updated messages into the cached tail in place. Messages that were
+    held or released by moderation change the tail's membership, so their
+    group is dropped and primed again instead.
+    """
+
+    client = get_redis_client()
+    if client is None:
+        return
+
+    by_group: dict[object, list[Message]] = {}
+    for message in messages:
+        by_group.setdefault(message.group_id, []).append(message)
+
+    for group_id, group_messages in by_group.items():
+        top_level = [message for message in group_messages if message.parent_id is None]
+        if any(message.moderation_status == Message.ModerationStatus.PENDING for message in top_level):
+            invalidate_group(group_id)
+            continue
+        rendered = {message.pk: render_cached_payload(message) for message in group_messages}
+        key = tail_key(group_id)
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(key)
+                entries = pipe.lrange(key, 0, -1)
+                cached: dict[int, int] = {}
+                for index, raw in enumerate(entries):
+                    decoded = _decode(raw)
+                    if decoded != _END_MARKER:
+                        cached[json.loads(decoded).get("id")] = index
+                if entries and _released_into_window(top_level, cached, complete=_decode(entries[-1]) == _END_MARKER):
+                    pipe.reset()
+                    invalidate_group(group_id)
+                    continue
+                pipe.multi()
+                pipe.incr(version_key(group_id))
+                pipe.hdel(pending_key(group_id), *rendered)
+                for message_id, index in cached.items():
+                    if message_id in rendered:
+                        pipe.lset(key, index, rendered[message_id])
+                pipe.execute()
+        except (WatchError, RedisError):
+            # A concurrent writer moved the list; dropping it is always safe.
+            invalidate_group(group_id)
+
+
+def _released_into_window(messages: list[Message], cached: dict[int, int], *, complete: bool) -> bool:
+    """Whether a top-level message missing from the tail (i.e. just released from review) belongs in it."""
+
+    missing = [message.pk for message in messages if message.pk not in cached]
+    if not missing:
+        return False
+    return complete or (bool(cached) and max(missing) > min(cached))
+
+
+def patch_messages(group_id, patches: dict[int, Callable[[dict], None]]) -> None:
+    """
+    Apply in-place edits to cached payloads (e.g. thread counters) without
+    re-rendering the messages.
+    """
+
+    client = get_redis_client()
+    if client is None or not patches:
+        return
+
+    key = tail_key(group_id)
+    try:
+        with client.pipeline() as pipe:
+            pipe.watch(key)
+            entries = pipe.lrange(key, 0, -1)
+            pipe.multi()
+            pipe.incr(version_key(group_id))
+            for index, raw in enumerate(entries):
+                decoded = _decode(raw)
+                if decoded == _END_MARKER:
+                    continue
+                payload = json.loads(decoded)
+                patch = patches.get(payload.get("id"))
+                if patch is not None:
+                    patch(payload)
+                    pipe.lset(key, index, json.dumps(payload, cls=JSONEncoder))
+            pipe.execute()
+    except (WatchError, RedisError):
+        invalidate_group(group_id)
+
+
+def invalidate_group(group_id) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.pipeline().incr(version_key(group_id)).delete(tail_key(group_id), pending_key(group_id)).execute()
+    except RedisError:
+        logger.warning("Failed to invalidate hot-tail cache for group %s", group_id, exc_info=True)
+
+
+def _prime(client, group) -> tuple[list, list] | None:
+    """
+    Load the newest messages from the database into Redis and return the
+    entries and the authors of held messages. The version key is watched so
+    a message committed while we were reading aborts the write instead of
+    leaving a tail that silently misses it.
+    """
+
+    key = tail_key(group.pk)
+    top_level = Message.objects.filter(group=group, parent__isnull=True)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(version_key(group.pk))
+            # Only held messages that could fall in the cached window matter.
+            held = dict(
+                top_level.filter(moderation_status=Message.ModerationStatus.PENDING)
+                .order_by("-created_at", "-id")
+                .values_list("id", "author_id")[:HOT_TAIL_SIZE]
+            )
+            messages = list(
+                top_level.exclude(moderation_status=Message.ModerationStatus.PENDING)
+                .select_related("author", "deleted_by", "moderated_by")
+                .prefetch_related("attachments")
+                .order_by("-created_at", "-id")[:HOT_TAIL_SIZE]
+            )
+            entries = [render_cached_payload(message) for message in messages]
+            if len(messages) < HOT_TAIL_SIZE:
+                entries.append(_END_MARKER)
+            pipe.multi()
+            pipe.delete(key, pending_key(group.pk))
+            pipe.rpush(key, *entries)
+            if held:
+                pipe.hset(pending_key(group.pk), mapping=held)
+            pipe.execute()
+        except WatchError:
+            return None
+    return entries, [str(author_id) for author_id in held.values()]
+
+
+def _decode(raw) -> str:
+    return raw.decode("utf-8") if isinstance(raw, bytes) else raw
@@ -0,0 +1,192 @@
+"""
+Liveness, per-user limits and drain hooks for chat WebSockets.
+
+Idle sockets: every received frame (clients ping at least every
+`CHAT_PRESENCE_TTL_SECONDS`) refreshes an in-memory timestamp. One
+`IdleSweeper` task per process (event loop) closes sockets that stayed silent
+for `HEARTBEAT_DEADLINE_SECONDS` with `4408`, so half-open connections stop
+receiving fan-out long before TCP gives up on them.
+
+Socket caps: each user has a Redis sorted set of their open sockets
+(`chat:sockets:<user_id>`, channel names scored by connect time) whose size
+is the user's socket count. Registering a socket adds it and trims the set
+to `MAX_SOCKETS_PER_USER` in one transaction; the trimmed (oldest) sockets
+are told over the channel layer to close with `4409`, wherever they run.
+Entries left behind by a crashed process are simply the oldest and go first.
+
+Guarded sockets are also the ones `chat/drain.py` announces the drain to
+and closes; consumers report their resume state via `resume_sequences`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from core.redis_client import get_redis_client
+
+from . import drain, metrics
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_DEADLINE_SECONDS = getattr(settings, "CHAT_HEARTBEAT_DEADLINE_SECONDS", 150)
+MAX_SOCKETS_PER_USER = getattr(settings, "CHAT_MAX_SOCKETS_PER_USER", 10)
+# Refreshed on every connect; only bounds how long a crashed process's
+# entries can linger for a user who never reconnects.
+SOCKETS_TTL_SECONDS = 24 * 60 * 60
+
+IDLE_CLOSE_CODE = 4408
+LIMIT_CLOSE_CODE = 4409
+INTERNAL_ERROR = 1011
+
+_sweepers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, IdleSweeper]" = weakref.WeakKeyDictionary()
+
+
+def sockets_key(user_id) -> str:
+    return f"chat:sockets:{user_id}"
+
+
+def register_socket(user_id, channel_name: str) -> list[str]:
+    """Record a new socket and return the channel names of the user's sockets over the cap."""
+
+    client = get_redis_client()
+    if client is None or MAX_SOCKETS_PER_USER <= 0:
+        return []
+
+    key = sockets_key(user_id)
+    keep = -(MAX_SOCKETS_PER_USER + 1)
+    try:
+        pipe = client.pipeline()
+        pipe.zadd(key, {channel_name: time.time()})
+        pipe.zrange(key, 0, keep)
+        pipe.zremrangebyrank(key, 0, keep)
+        pipe.expire(key, SOCKETS_TTL_SECONDS)
+        _, excess, _, _ = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to register chat socket for user %s", user_id, exc_info=True)
+        return []
+    return [member.decode() if isinstance(member, bytes) else member for member in excess]
+
+
+def unregister_socket(user_id, channel_name: str) -> None:
+    client = get_redis_client()
+    if client is None or MAX_SOCKETS_PER_USER <= 0:
+        return
+    try:
+        client.zrem(sockets_key(user_id), channel_name)
+    except RedisError:
+        logger.warning("Failed to unregister chat socket for user %s", user_id, exc_info=True)
+
+
+def get_sweeper() -> "IdleSweeper":
+    """Return the sweeper of the running event loop, creating it on first use."""
+
+    loop = asyncio.get_running_loop()
+    sweeper = _sweepers.get(loop)
+    if sweeper is None:
+        sweeper = _sweepers[loop] = IdleSweeper()
+    return sweeper
+
+
+class IdleSweeper:
+    """Closes local sockets that received nothing for `HEARTBEAT_DEADLINE_SECONDS`."""
+
+    def __init__(self) -> None:
+        self._last_seen: dict[Any, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def watch(self, consumer) -> None:
+        if HEARTBEAT_DEADLINE_SECONDS <= 0:
+            return
+        self._last_seen[consumer] = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def touch(self, consumer) -> None:
+        if consumer in self._last_seen:
+            self._last_seen[consumer] = time.monotonic()
+
+    def forget(self, consumer) -> None:
+        # No cancel: the task may be halfway through an eviction; it stops on
+        # its own once nothing is left to watch.
+        self._last_seen.pop(consumer, None)
+
+    async def _run(self) -> None:
+        while self._last_seen:
+            await asyncio.sleep(HEARTBEAT_DEADLINE_SECONDS / 4)
+            deadline = time.monotonic() - HEARTBEAT_DEADLINE_SECONDS
+            idle = [consumer for consumer, seen in self._last_seen.items() if seen < deadline]
+            for consumer in idle:
+                # Sockets can disconnect while an earlier one is being evicted.
+                if self._last_seen.pop(consumer, None) is None:
+                    continue
+                metrics.increment("connections.idle_evicted")
+                try:
+                    await consumer.evict("idle", IDLE_CLOSE_CODE)
+                except Exception:
+                    logger.exception("Failed to close idle chat socket %s", getattr(consumer, "channel_name", consumer))
+        self._task = None
+
+
+class ConnectionGuardMixin:
+    """
+    Consumer side: `guard_connection` right after `accept`,
+    `release_connection` on disconnect.
+    """
+
+    async def guard_connection(self) -> None:
+        drain.track(self)
+        self.sweeper = get_sweeper()
+        self.sweeper.watch(self)
+        user_id = self.scope["user"].pk
+        for channel_name in await sync_to_async(register_socket)(user_id, self.channel_name):
+            metrics.increment("connections.limit_evicted")
+            await self.channel_layer.send(channel_name, {"type": "chat.evicted", "reason": "socket_limit"})
+
+    async def release_connection(self) -> None:
+        if not hasattr(self, "sweeper"):
+            return
+        self.sweeper.forget(self)
+        drain.untrack(self)
+        await sync_to_async(unregister_socket)(self.scope["user"].pk, self.channel_name)
+
+    async def receive(self, text_data: str | None = None, bytes_data: bytes | None = None, **kwargs: Any) -> None:
+        if hasattr(self, "sweeper"):
+            self.sweeper.touch(self)
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def chat_evicted(self, event: dict[str, Any]) -> None:
+        await self.evict(event.get("reason") or "socket_limit", LIMIT_CLOSE_CODE)
+
+    async def announce_drain(self, reconnect_in: float) -> None:
+        """Queue the `server.draining` frame; it follows every event already queued."""
+
+        sequences = self.resume_sequences()
+        self.outbound.put(
+            {
+                "type": "server.draining",
+                "reconnectInMs": round(reconnect_in * 1000),
+                "resume": None if sequences is None else drain.make_resume_token(self.scope["user"].pk, sequences),
+            }
+        )
+
+    def resume_sequences(self) -> dict[str, int] | None:
+        """Last queued sequence per group, for the drain resume token (`None`: not resumable)."""
+
+        return None
+
+    async def close_after_send_error(self) -> None:
+        """`OutboundQueue.on_send_error` hook: a frame could not be written."""
+
+        await self.close(code=INTERNAL_ERROR)
+
+    async def evict(self, reason: str, code: int) -> None:
+        await self.send_json({"type": "connection.evicted", "reason": reason})
+        await self.close(code=code)
@@ -2,25 +2,47 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
 from typing import Any
+from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from rest_framework.exceptions import APIException, ValidationError
 
 from groups.models import Group
 
-from .permissions import user_has_group_access
-from .services import (
-    create_message,
-    get_group_channel_name,
-    serialize_message,
-)
+from . import presence
+from .acl import accessible_group_ids, get_user_channel_name, user_can_access_group
+from .connections import ConnectionGuardMixin
+from .drain import read_resume_token
+from .events import current_sequence, current_sequences, replay_group_events
+from .fanout import FIREHOSE, LocalFanoutMixin, get_group_channel_name, get_hub, publish_group_event
+from .firehose import FirehoseFilter
+from .moderation import MODERATORS_CHANNEL
+from .normalize import NORMALIZED, SentUsers
+from .outbound import OutboundQueue
+from .permissions import has_role_based_access
+from .reactions import schedule_flush as schedule_reaction_flush
+from .reactions import set_reaction
+from .read_state import mark_read, schedule_flush
+from .services import post_message
+from .wire import WireFormatMixin, shared_frame
 
+logger = logging.getLogger(__name__)
 
-class GroupChatConsumer(AsyncJsonWebsocketConsumer):
+MULTIPLEX_MAX_GROUPS = getattr(settings, "CHAT_MULTIPLEX_MAX_GROUPS", 200)
+
+
+class GroupChatConsumer(LocalFanoutMixin, ConnectionGuardMixin, WireFormatMixin, AsyncJsonWebsocketConsumer):
     """Provide a JWT-authenticated WebSocket endpoint per group."""
 
+    last_seq: int | None = None
+
     async def connect(self) -> None:
         user = self.scope.get("user")
         if not user or not getattr(user, "is_authenticated", False):
@@ -29,33 +51,79 @@ class GroupChatConsumer(AsyncJsonWebsocketConsumer):
 
         self.group_id = str(self.scope["url_route"]["kwargs"].get("group_id"))
 
-        try:
-            group = await self._fetch_group()
-        except Group.DoesNotExist:
-            await self.close(code=4404)
+        close_code = await self._check_access(user)
+        if close_code is not None:
+            await self.close(code=close_code)
             return
 
-        has_access = await self._user_has_access(user, group)
-        if not has_access:
-            await self.close(code=4403)
-            return
-
-        self.group = group
+        # Access is settled for the life of the socket (revocations close it),
+        # so sends reuse this pk-only reference instead of re-loading the group.
+        self.group = Group(pk=self.group_id)
         self.room_group_name = get_group_channel_name(self.group_id)
+        self.user_group_name = get_user_channel_name(user.pk)
+
+        # Group events arrive through the process hub; they are held until
+        # the handshake and any replay below have been queued.
+        self.fanout = get_hub(self.channel_layer)
+        self.hold_local()
+        await self.fanout.subscribe(self.group_id, self)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept(subprotocol=self.select_subprotocol())
+
+        self.sent_users = SentUsers() if _query_value(self.scope, "format") == NORMALIZED else None
+        self.outbound = OutboundQueue(
+            self.send_json,
+            on_overflow_disconnect=self._close_overloaded,
+            on_drop=self.sent_users.reset if self.sent_users else None,
+            on_send_error=self.close_after_send_error,
+        )
+        await self.guard_connection()
+        self.replayed_seqs: set[int] = set()
+        since_seq = self._query_int("since_seq")
+        if since_seq is None:
+            # Reconnecting after a drain: the resume token stands in for `since_seq`.
+            since_seq = (read_resume_token(_query_value(self.scope, "resume"), user.pk) or {}).get(self.group_id)
+        if since_seq is None:
+            current_seq = await sync_to_async(current_sequence)(self.group_id)
+            self.last_seq = current_seq
+            await self.send_json(
+                {"type": "connection.established", "groupId": self.group_id, "seq": current_seq}
+            )
+        else:
+            await self._resume(since_seq)
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-        await self.send_json({"type": "connection.established", "groupId": self.group_id})
+        self._typing_sent_at = 0.0
+        await self._heartbeat()
+        online = await sync_to_async(presence.online_user_ids)(self.group_id)
+        await self.send_json({"type": "presence.snapshot", "groupId": self.group_id, "userIds": online})
+        await self.release_local()
+        self.outbound.start()
 
     async def disconnect(self, code: int) -> None:  # noqa: D401 - inherited docstring
-        if hasattr(self, "room_group_name"):
-            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.release_connection()
+        if hasattr(self, "outbound"):
+            await self.outbound.stop()
+            user_id = self.scope["user"].pk
+            if await sync_to_async(presence.leave)(self.group_id, user_id, self.channel_name):
+                await self._broadcast_presence("presence.changed", {"userId": user_id, "online": False})
+        if hasattr(self, "fanout"):
+            await self.fanout.unsubscribe(self.group_id, self)
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
 
     async def receive_json(self, content: dict[str, Any], **kwargs: Any) -> None:
         action = content.get("action") or content.get("type")
         if action == "send_message":
             await self._handle_send_message(content)
+        elif action == "mark_read":
+            await self._handle_mark_read(content)
+        elif action in ("react", "unreact"):
+            await _handle_reaction(self, self.group_id, content, add=action == "react")
+        elif action == "typing":
+            await self._handle_typing()
         elif action == "ping":
+            # Pings double as the presence heartbeat.
+            await self._heartbeat()
             await self.send_json({"type": "pong"})
         else:
             await self.send_json({"type": "error", "error": "unknown_action"})
@@ -70,7 +138,9 @@ class GroupChatConsumer(AsyncJsonWebsocketConsumer):
         attachments = payload.get("attachments") or []
 
         try:
-            message = await self._create_message(user, text, attachments)
+            _, _, event = await database_sync_to_async(post_message)(
+                self.group, user, text, attachments, payload.get("parentId")
+            )
         except ValidationError as exc:
             await self.send_json(
                 {
@@ -81,48 +151,514 @@ class GroupChatConsumer(AsyncJsonWebsocketConsumer):
             )
             return
 
-        serialized = await self._serialize_message(message)
+        if event is not None:
+            await publish_group_event(self.channel_layer, self.group_id, event)
 
+    async def _handle_mark_read(self, payload: dict[str, Any]) -> None:
+        try:
+            message_id = int(payload.get("messageId"))
+        except (TypeError, ValueError):
+            await self.send_json(
+                {"type": "error", "error": "validation_error", "detail": "messageId is required."}
+            )
+            return
+        mark_read(self.scope["user"].pk, self.group_id, message_id)
+        await schedule_flush()
+
+    async def _handle_typing(self) -> None:
+        # Repeated keystrokes are dropped locally; the Redis throttle key then
+        # coalesces them across this user's other sockets and processes.
+        now = time.monotonic()
+        if now - self._typing_sent_at < presence.TYPING_THROTTLE_SECONDS:
+            return
+        self._typing_sent_at = now
+        user_id = self.scope["user"].pk
+        if await sync_to_async(presence.start_typing)(self.group_id, user_id):
+            await self._broadcast_presence("typing", {"userId": user_id})
+
+    async def _heartbeat(self) -> None:
+        user_id = self.scope["user"].pk
+        came_online, gone = await sync_to_async(presence.touch)(self.group_id, user_id, self.channel_name)
+        if came_online:
+            await self._broadcast_presence("presence.changed", {"userId": user_id, "online": True})
+        for gone_id in gone:
+            # Connections that expired without disconnecting (e.g. a crashed process).
+            await self._broadcast_presence("presence.changed", {"userId": gone_id, "online": False})
+
+    async def _broadcast_presence(self, event_type: str, payload: dict[str, Any]) -> None:
+        # Presence is ephemeral: it is neither sequenced nor kept for replay.
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat.message",
-                "event": "message.created",
-                "payload": serialized,
-            },
+            {"type": "chat.presence", "group_id": self.group_id, "event": event_type, "payload": payload},
         )
 
+    async def chat_presence(self, event: dict[str, Any]) -> None:
+        payload = event.get("payload") or {}
+        if payload.get("userId") == self.scope["user"].pk:
+            return
+        self.outbound.put(shared_frame(event, {"type": event.get("event"), "payload": payload}))
+
     async def chat_message(self, event: dict[str, Any]) -> None:
-        await self.send_json({"type": event.get("event"), "payload": event.get("payload")})
+        seq = event.get("seq")
+        if seq in self.replayed_seqs:
+            # Already delivered from the replay log during connect.
+            return
+        self._enqueue_event(event.get("event"), event.get("payload"), seq, source=event)
+
+    async def chat_held(self, event: dict[str, Any]) -> None:
+        # The author's own held message; it has no sequence number.
+        if event.get("group_id") == self.group_id:
+            self._enqueue_event(event.get("event"), event.get("payload"), None)
+
+    async def _resume(self, since_seq: int) -> None:
+        """
+        Replay events newer than `since_seq` before live delivery starts. The
+        socket already belongs to the channel group, so nothing published in
+        the meantime is lost; duplicates are skipped by `chat_message`.
+        """
+
+        events, current_seq = await sync_to_async(replay_group_events)(self.group_id, since_seq)
+        self.last_seq = current_seq
+        await self.send_json(
+            {
+                "type": "connection.established",
+                "groupId": self.group_id,
+                "seq": current_seq,
+                "resumed": events is not None,
+            }
+        )
+        if events is None:
+            await self.send_json({"type": "sync.required", "reason": "resume_unavailable", "after": None})
+            return
+        for event in events:
+            self.replayed_seqs.add(event["seq"])
+            self._enqueue_event(event["event"], event["payload"], event["seq"])
+
+    def _enqueue_event(
+        self, event_type: str | None, payload: Any, seq: int | None, *, source: dict[str, Any] | None = None
+    ) -> None:
+        key = payload.get("id") if isinstance(payload, dict) else None
+        frame = {"type": event_type, "payload": payload, "seq": seq}
+        if self.sent_users is not None:
+            frame["payload"], users = self.sent_users.compact(payload)
+            if users:
+                frame["users"] = users
+        elif source is not None:
+            # Live event: every plain socket on this process sends the same frame.
+            frame = shared_frame(source, frame)
+        if seq is not None:
+            self.last_seq = max(seq, self.last_seq or 0)
+        self.outbound.put(frame, key=key)
+
+    def resume_sequences(self) -> dict[str, int] | None:
+        return {self.group_id: self.last_seq} if self.last_seq is not None else None
+
+    def _query_int(self, name: str) -> int | None:
+        return _as_int(_query_value(self.scope, name))
+
+    async def _close_overloaded(self, resume_cursor: str | None) -> None:
+        await self.send_json({"type": "connection.overloaded", "after": resume_cursor})
+        await self.close(code=4429)
+
+    async def chat_access_revoked(self, event: dict[str, Any]) -> None:
+        if event.get("group_id") != self.group_id:
+            return
+        await self.send_json({"type": "access.revoked", "groupId": self.group_id})
+        await self.close(code=4403)
 
     # --- Database helpers -------------------------------------------------
 
     @database_sync_to_async
-    def _fetch_group(self) -> Group:
-        return (
-            Group.objects.select_related("mentor")
-            .prefetch_related("members__user")
-            .get(pk=self.group_id)
+    def _check_access(self, user) -> int | None:
+        """Return a close code when the user may not join, else `None`."""
+
+        group_exists = Group.objects.filter(pk=self.group_id).exists
+        if user_can_access_group(user, self.group_id):
+            # Cached membership implies the group exists; role-based access does not.
+            if not has_role_based_access(user) or group_exists():
+                return None
+            return 4404
+        return 4403 if group_exists() else 4404
+
+
+class MultiplexChatConsumer(LocalFanoutMixin, ConnectionGuardMixin, WireFormatMixin, AsyncJsonWebsocketConsumer):
+    """
+    One authenticated socket subscribed to many groups. Clients send
+    `subscribe` / `unsubscribe` frames carrying `groupIds` and receive every
+    group event tagged with its `groupId`, so staff watching many groups keep
+    a single connection and a single handshake.
+    """
+
+    async def connect(self) -> None:
+        user = self.scope.get("user")
+        if not user or not getattr(user, "is_authenticated", False):
+            await self.close(code=4401)
+            return
+
+        self.subscriptions: set[str] = set()
+        self.sequences: dict[str, int] = {}
+        self.replayed_seqs: set[tuple[str, int]] = set()
+        self.fanout = get_hub(self.channel_layer)
+        self.user_group_name = get_user_channel_name(user.pk)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        self.is_moderator = has_role_based_access(user)
+        if self.is_moderator:
+            await self.channel_layer.group_add(MODERATORS_CHANNEL, self.channel_name)
+        await self.accept(subprotocol=self.select_subprotocol())
+
+        self.sent_users = SentUsers() if _query_value(self.scope, "format") == NORMALIZED else None
+        self.outbound = OutboundQueue(
+            self.send_json,
+            on_overflow_disconnect=self._close_overloaded,
+            on_drop=self.sent_users.reset if self.sent_users else None,
+            on_send_error=self.close_after_send_error,
         )
+        await self.guard_connection()
+        await self.send_json({"type": "connection.established", "groups": []})
+        resume = read_resume_token(_query_value(self.scope, "resume"), user.pk)
+        if resume:
+            # Reconnecting after a drain: restore the subscriptions it recorded.
+            await self._handle_subscribe({"groupIds": list(resume), "sinceSeq": resume})
+        self.outbound.start()
 
-    @database_sync_to_async
-    def _user_has_access(self, user, group) -> bool:
-        return user_has_group_access(user, group)
+    async def disconnect(self, code: int) -> None:  # noqa: D401 - inherited docstring
+        await self.release_connection()
+        if hasattr(self, "outbound"):
+            await self.outbound.stop()
+        for group_id in getattr(self, "subscriptions", ()):
+            await self.fanout.unsubscribe(group_id, self)
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        if getattr(self, "is_moderator", False):
+            await self.channel_layer.group_discard(MODERATORS_CHANNEL, self.channel_name)
 
-    @database_sync_to_async
-    def _create_message(self, user, text: str, attachments) -> Any:
-        # Fetch the latest state from the database before creation.
-        group = (
-            Group.objects.select_related("mentor")
-            .prefetch_related("members__user")
-            .get(pk=self.group_id)
+    async def receive_json(self, content: dict[str, Any], **kwargs: Any) -> None:
+        action = content.get("action") or content.get("type")
+        if action == "subscribe":
+            await self._handle_subscribe(content)
+        elif action == "unsubscribe":
+            await self._handle_unsubscribe(content)
+        elif action == "mark_read":
+            await self._handle_mark_read(content)
+        elif action in ("react", "unreact"):
+            group_id = str(content.get("groupId"))
+            if group_id not in self.subscriptions:
+                await self.send_json(
+                    {
+                        "type": "error",
+                        "error": "validation_error",
+                        "detail": "groupId of a subscribed group is required.",
+                    }
+                )
+                return
+            await _handle_reaction(self, group_id, content, add=action == "react")
+        elif action == "ping":
+            await self.send_json({"type": "pong"})
+        else:
+            await self.send_json({"type": "error", "error": "unknown_action"})
+
+    async def _handle_subscribe(self, payload: dict[str, Any]) -> None:
+        group_ids = _group_ids(payload)
+        since = payload.get("sinceSeq") or {}
+        if group_ids is None or not isinstance(since, dict):
+            await self.send_json(
+                {"type": "error", "error": "validation_error", "detail": "groupIds must be a list of group ids."}
+            )
+            return
+
+        requested = [group_id for group_id in group_ids if group_id not in self.subscriptions]
+        if len(self.subscriptions) + len(requested) > MULTIPLEX_MAX_GROUPS:
+            await self.send_json({"type": "error", "error": "too_many_subscriptions", "limit": MULTIPLEX_MAX_GROUPS})
+            return
+
+        allowed = await database_sync_to_async(accessible_group_ids)(self.scope["user"], requested)
+        granted = [group_id for group_id in requested if group_id in allowed]
+        self.hold_local()
+        for group_id in granted:
+            await self.fanout.subscribe(group_id, self)
+            self.subscriptions.add(group_id)
+
+        sequences = await sync_to_async(current_sequences)(granted)
+        replays: dict[str, list[dict[str, Any]] | None] = {}
+        for group_id in granted:
+            since_seq = _as_int(since.get(group_id))
+            if since_seq is not None:
+                replays[group_id], sequences[group_id] = await sync_to_async(replay_group_events)(
+                    group_id, since_seq
+                )
+        self.sequences.update(sequences)
+
+        await self.send_json(
+            {
+                "type": "subscribed",
+                "groups": [
+                    {
+                        "groupId": group_id,
+                        "seq": sequences[group_id],
+                        **({"resumed": replays[group_id] is not None} if group_id in replays else {}),
+                    }
+                    for group_id in granted
+                ],
+                "denied": [group_id for group_id in requested if group_id not in allowed],
+            }
         )
-        return create_message(group, user, text, attachments)
+        for group_id, events in replays.items():
+            if events is None:
+                await self.send_json(
+                    {"type": "sync.required", "reason": "resume_unavailable", "groupId": group_id, "after": None}
+                )
+                continue
+            for event in events:
+                self.replayed_seqs.add((group_id, event["seq"]))
+                self._enqueue_event(group_id, event["event"], event["payload"], event["seq"])
+        await self.release_local()
 
-    @database_sync_to_async
-    def _serialize_message(self, message) -> dict[str, Any]:
-        # Use moderator context so the payload is complete; clients enforce visibility.
-        return serialize_message(message, for_user=None)
+    async def _handle_unsubscribe(self, payload: dict[str, Any]) -> None:
+        group_ids = _group_ids(payload)
+        if group_ids is None:
+            await self.send_json(
+                {"type": "error", "error": "validation_error", "detail": "groupIds must be a list of group ids."}
+            )
+            return
+        removed = [group_id for group_id in group_ids if group_id in self.subscriptions]
+        for group_id in removed:
+            await self._drop_subscription(group_id)
+        await self.send_json({"type": "unsubscribed", "groupIds": removed})
+
+    async def _handle_mark_read(self, payload: dict[str, Any]) -> None:
+        group_id = str(payload.get("groupId"))
+        message_id = _as_int(payload.get("messageId"))
+        if group_id not in self.subscriptions or message_id is None:
+            await self.send_json(
+                {
+                    "type": "error",
+                    "error": "validation_error",
+                    "detail": "groupId of a subscribed group and messageId are required.",
+                }
+            )
+            return
+        mark_read(self.scope["user"].pk, group_id, message_id)
+        await schedule_flush()
+
+    async def chat_message(self, event: dict[str, Any]) -> None:
+        group_id = event.get("group_id")
+        seq = event.get("seq")
+        if group_id not in self.subscriptions or (group_id, seq) in self.replayed_seqs:
+            # Unsubscribed meanwhile, or already delivered from the replay log.
+            return
+        self._enqueue_event(group_id, event.get("event"), event.get("payload"), seq, source=event)
+
+    async def chat_held(self, event: dict[str, Any]) -> None:
+        group_id = event.get("group_id")
+        if group_id in self.subscriptions:
+            self._enqueue_event(group_id, event.get("event"), event.get("payload"), None)
+
+    async def chat_access_revoked(self, event: dict[str, Any]) -> None:
+        group_id = event.get("group_id")
+        if group_id not in self.subscriptions:
+            return
+        await self._drop_subscription(group_id)
+        # Only the revoked subscription ends; the socket stays open.
+        await self.send_json({"type": "access.revoked", "groupId": group_id})
+
+    async def chat_moderation_queue(self, event: dict[str, Any]) -> None:
+        self.outbound.put(
+            {"type": "moderation.queue", "payload": {"pending": event.get("pending")}},
+            key="moderation.queue",
+        )
+
+    async def _drop_subscription(self, group_id: str) -> None:
+        self.subscriptions.discard(group_id)
+        self.sequences.pop(group_id, None)
+        self.replayed_seqs = {key for key in self.replayed_seqs if key[0] != group_id}
+        await self.fanout.unsubscribe(group_id, self)
+
+    def _enqueue_event(
+        self,
+        group_id: str,
+        event_type: str | None,
+        payload: Any,
+        seq: int | None,
+        *,
+        source: dict[str, Any] | None = None,
+    ) -> None:
+        key = (group_id, payload.get("id")) if isinstance(payload, dict) else None
+        frame = {"type": event_type, "groupId": group_id, "payload": payload, "seq": seq}
+        if self.sent_users is not None:
+            frame["payload"], users = self.sent_users.compact(payload)
+            if users:
+                frame["users"] = users
+        elif source is not None:
+            frame = shared_frame(source, frame)
+        if seq is not None:
+            self.sequences[group_id] = max(seq, self.sequences.get(group_id, 0))
+        self.outbound.put(frame, key=key)
+
+    def resume_sequences(self) -> dict[str, int] | None:
+        return dict(self.sequences)
+
+    async def _close_overloaded(self, resume_cursor: str | None) -> None:
+        await self.send_json(
+            {"type": "connection.overloaded", "after": resume_cursor, "groups": dict(self.outbound.group_cursors)}
+        )
+        await self.close(code=4429)
+
+
+class FirehoseChatConsumer(LocalFanoutMixin, ConnectionGuardMixin, WireFormatMixin, AsyncJsonWebsocketConsumer):
+    """
+    Moderation firehose: every group event across all groups on one socket,
+    for staff only. The socket joins the process hub's single `FIREHOSE`
+    stream instead of one subscription per group, and drops events that do
+    not match its `FirehoseFilter` before they are queued.
+
+    Group tracks are loaded at connect. Events of a group created later wait
+    (only while a track filter is set) for a lookup that runs in its own
+    task, so the hub loop never waits on the database.
+    """
+
+    async def connect(self) -> None:
+        user = self.scope.get("user")
+        if not user or not getattr(user, "is_authenticated", False):
+            await self.close(code=4401)
+            return
+        if not has_role_based_access(user):
+            await self.close(code=4403)
+            return
+
+        try:
+            self.filter = FirehoseFilter.parse(
+                {name: _query_value(self.scope, name) for name in ("track", "groupIds", "status", "keyword")}
+            )
+        except ValidationError:
+            await self.close(code=4400)
+            return
+
+        self.tracks: dict[str, str | None] = await database_sync_to_async(_group_tracks)()
+        self.awaiting_track: dict[str, list[dict[str, Any]]] = {}
+        self.track_lookups: set[asyncio.Task] = set()
+        self.fanout = get_hub(self.channel_layer)
+        await self.fanout.subscribe(FIREHOSE, self)
+        await self.accept(subprotocol=self.select_subprotocol())
+
+        self.outbound = OutboundQueue(
+            self.send_json,
+            on_overflow_disconnect=self._close_overloaded,
+            on_send_error=self.close_after_send_error,
+        )
+        await self.guard_connection()
+        await self.send_json({"type": "connection.established", "filter": self.filter.describe()})
+        self.outbound.start()
+
+    async def disconnect(self, code: int) -> None:  # noqa: D401 - inherited docstring
+        await self.release_connection()
+        if hasattr(self, "outbound"):
+            await self.outbound.stop()
+        if hasattr(self, "fanout"):
+            await self.fanout.unsubscribe(FIREHOSE, self)
+        for task in getattr(self, "track_lookups", ()):
+            task.cancel()
+
+    async def receive_json(self, content: dict[str, Any], **kwargs: Any) -> None:
+        action = content.get("action") or content.get("type")
+        if action == "filter":
+            try:
+                self.filter = FirehoseFilter.parse(content)
+            except ValidationError as exc:
+                await self.send_json(
+                    {"type": "error", "error": "validation_error", "detail": _first_validation_message(exc.detail)}
+                )
+                return
+            await self.send_json({"type": "filter.updated", "filter": self.filter.describe()})
+        elif action == "ping":
+            await self.send_json({"type": "pong"})
+        else:
+            await self.send_json({"type": "error", "error": "unknown_action"})
+
+    async def chat_firehose(self, event: dict[str, Any]) -> None:
+        group_id = event.get("group_id")
+        if self.filter.tracks and (group_id not in self.tracks or group_id in self.awaiting_track):
+            # Created after this socket connected: look the track up off the hub loop.
+            waiting = self.awaiting_track.setdefault(group_id, [])
+            waiting.append(event)
+            if len(waiting) == 1:
+                task = asyncio.ensure_future(self._resolve_track(group_id))
+                self.track_lookups.add(task)
+                task.add_done_callback(self.track_lookups.discard)
+            return
+        self._forward(event)
+
+    async def _resolve_track(self, group_id: str) -> None:
+        try:
+            tracks = await database_sync_to_async(_group_tracks)([group_id])
+        except Exception:
+            logger.exception("Failed to look up the track of chat group %s", group_id)
+            tracks = {}
+        # Unknown groups are remembered too, so they are looked up only once.
+        self.tracks[group_id] = tracks.get(group_id)
+        for event in self.awaiting_track.pop(group_id, []):
+            self._forward(event)
+
+    def _forward(self, event: dict[str, Any]) -> None:
+        group_id = event.get("group_id")
+        payload = self.filter.apply(group_id, self.tracks.get(group_id), event.get("payload"))
+        if payload is None:
+            return
+        key = (group_id, payload.get("id")) if isinstance(payload, dict) else None
+        frame = {"type": event.get("event"), "groupId": group_id, "payload": payload, "seq": event.get("seq")}
+        if payload is event.get("payload"):
+            # Not narrowed by this socket's filter.
+            frame = shared_frame(event, frame)
+        self.outbound.put(frame, key=key)
+
+    async def _close_overloaded(self, resume_cursor: str | None) -> None:
+        await self.send_json({"type": "connection.overloaded", "after": resume_cursor})
+        await self.close(code=4429)
+
+
+async def _handle_reaction(consumer, group_id: str, payload: dict[str, Any], *, add: bool) -> None:
+    """Shared `react`/`unreact` handling for both chat consumers."""
+
+    message_id = _as_int(payload.get("messageId"))
+    if message_id is None:
+        await consumer.send_json({"type": "error", "error": "validation_error", "detail": "messageId is required."})
+        return
+    try:
+        event = await database_sync_to_async(set_reaction)(
+            group_id, message_id, consumer.scope["user"], payload.get("emoji"), add=add
+        )
+    except APIException as exc:
+        await consumer.send_json(
+            {"type": "error", "error": "validation_error", "detail": _first_validation_message(exc.detail)}
+        )
+        return
+    if event is not None:
+        await publish_group_event(consumer.channel_layer, group_id, event)
+    await schedule_reaction_flush()
+
+
+def _group_tracks(group_ids: list[str] | None = None) -> dict[str, str]:
+    groups = Group.objects.all() if group_ids is None else Group.objects.filter(pk__in=group_ids)
+    return {str(pk): track for pk, track in groups.values_list("pk", "track")}
+
+
+def _group_ids(payload: dict[str, Any]) -> list[str] | None:
+    group_ids = payload.get("groupIds")
+    if not isinstance(group_ids, list) or not all(isinstance(item, (str, int)) for item in group_ids):
+        return None
+    return list(dict.fromkeys(str(item) for item in group_ids))
+
+
+def _query_value(scope, name: str) -> str | None:
+    params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    values = params.get(name)
+    return values[0] if values else None
+
+
+def _as_int(value: Any) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 def _first_validation_message(detail) -> str:
@@ -0,0 +1,175 @@
+"""
+Offline chat digest emails.
+
+`send_digests` is run periodically by `manage.py send_chat_digests` (cron or
+a scheduler container), never from a request worker. A single query lists
+every (recipient, group) pair with new visible messages since the
+recipient's last digest and read marker, with the unread count and latest
+preview per pair. Pairs whose user is currently connected to the group are
+dropped, and the remaining digests are sent over one SMTP connection in
+batches of `BATCH_SIZE`. Each batch advances its recipients' `DigestState`
+with a single upsert once it has been handed to the mail server.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, DateTimeField, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from groups.models import Group, GroupMember
+
+from . import presence
+from .activity import PREVIEW_LENGTH
+from .models import DigestState, Message, ReadMarker
+
+LOOKBACK_HOURS = getattr(settings, "CHAT_DIGEST_LOOKBACK_HOURS", 24)
+BATCH_SIZE = getattr(settings, "CHAT_DIGEST_BATCH_SIZE", 100)
+
+_COLUMNS = ("recipient", "email", "group_ref", "group_name", "unread", "preview")
+
+
+@dataclass
+class GroupActivity:
+    group_id: str
+    group_name: str
+    unread: int
+    preview: str
+
+
+@dataclass
+class Digest:
+    user_id: int
+    email: str
+    groups: list[GroupActivity] = field(default_factory=list)
+
+
+def collect_digests(now: datetime) -> list[Digest]:
+    floor = now - timedelta(hours=LOOKBACK_HOURS)
+    # Only groups with recent activity can contribute; served by the
+    # indexed `Group.last_message_at` column.
+    active = Group.objects.filter(last_message_at__gt=floor).values("pk")
+
+    members = GroupMember.objects.filter(group__in=active, user__is_active=True).annotate(
+        recipient=F("user_id"),
+        email=F("user__email"),
+        group_ref=F("group_id"),
+        group_name=F("group__name"),
+    )
+    mentors = Group.objects.filter(pk__in=active, mentor__is_active=True).annotate(
+        recipient=F("mentor_id"),
+        email=F("mentor__email"),
+        group_ref=F("pk"),
+        group_name=F("name"),
+    )
+    rows = (
+        _with_unread(members, floor, now)
+        .union(_with_unread(mentors, floor, now))
+        .order_by("recipient", "group_ref")
+    )
+
+    digests: dict[int, Digest] = {}
+    for row in rows:
+        digest = digests.setdefault(row["recipient"], Digest(user_id=row["recipient"], email=row["email"]))
+        digest.groups.append(
+            GroupActivity(
+                group_id=row["group_ref"],
+                group_name=row["group_name"],
+                unread=row["unread"],
+                preview=(row["preview"] or "")[:PREVIEW_LENGTH],
+            )
+        )
+
+    group_ids = {activity.group_id for digest in digests.values() for activity in digest.groups}
+    online = presence.online_user_ids_by_group(group_ids)
+    for digest in digests.values():
+        digest.groups = [
+            activity for activity in digest.groups if digest.user_id not in online.get(activity.group_id, ())
+        ]
+    return [digest for digest in digests.values() if digest.groups]
+
+
+def _with_unread(recipients, floor: datetime, now: datetime):
+    last_digest = DigestState.objects.filter(user=OuterRef("recipient")).values("last_sent_at")[:1]
+    last_read = ReadMarker.objects.filter(user=OuterRef("recipient"), group=OuterRef("group_ref")).values(
+        "last_read_message_id"
+    )[:1]
+    recipients = recipients.annotate(
+        since=Coalesce(Subquery(last_digest), Value(floor), output_field=DateTimeField()),
+        read_upto=Coalesce(Subquery(last_read), Value(0)),
+    )
+
+    new = (
+        Message.objects.filter(
+            group=OuterRef("group_ref"),
+            is_deleted=False,
+            moderation_status=Message.ModerationStatus.APPROVED,
+            created_at__gt=OuterRef("since"),
+            id__gt=OuterRef("read_upto"),
+        )
+        .filter(created_at__gt=floor, created_at__lte=now)
+        .exclude(author=OuterRef("recipient"))
+    )
+    unread = new.order_by().values("group").annotate(total=Count("id")).values("total")
+    latest = new.order_by("-created_at", "-id").values("text")[:1]
+    return (
+        recipients.annotate(
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+            preview=Subquery(latest),
+        )
+        .filter(unread__gt=0)
+        .order_by()
+        .values(*_COLUMNS)
+    )
+
+
+def render_digest(digest: Digest) -> EmailMessage:
+    total = sum(activity.unread for activity in digest.groups)
+    base_url = getattr(settings, "FRONTEND_BASE_URL", "https://yourdomain.com").rstrip("/")
+    lines = [f"You have {total} unread chat message{'s' if total != 1 else ''} in BIOTech Futures Hub.", ""]
+    for activity in digest.groups:
+        lines.append(f"{activity.group_name}: {activity.unread} new")
+        lines.append(f"  Latest: {activity.preview}")
+        lines.append(f"  {base_url}/groups/{activity.group_id}")
+        lines.append("")
+    return EmailMessage(
+        subject="Unread messages in BIOTech Futures Hub",
+        body="\n".join(lines).rstrip() + "\n",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[digest.email],
+    )
+
+
+def send_digests(*, now: datetime | None = None, batch_size: int = BATCH_SIZE, connection=None) -> int:
+    """Send pending digests and return how many were handed to the mail server."""
+
+    now = now or timezone.now()
+    digests = collect_digests(now)
+    if not digests:
+        return 0
+
+    batch_size = max(1, batch_size)
+    sent = 0
+    # One connection for the whole run; the context manager opens it once
+    # and closes it even if a batch fails.
+    with (connection or get_connection()) as mail:
+        for start in range(0, len(digests), batch_size):
+            batch = digests[start : start + batch_size]
+            mail.send_messages([render_digest(digest) for digest in batch])
+            _mark_sent([digest.user_id for digest in batch], now)
+            sent += len(batch)
+    return sent
+
+
+def _mark_sent(user_ids: list[int], now: datetime) -> None:
+    DigestState.objects.bulk_create(
+        [DigestState(user_id=user_id, last_sent_at=now) for user_id in user_ids],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["last_sent_at"],
+    )
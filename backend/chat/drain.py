@@ -0,0 +1,148 @@
+"""
+Graceful drain of chat WebSockets for deploys.
+
+`scripts/docker-entrypoint.sh` forwards the container's SIGTERM to the ASGI
+server as `DRAIN_SIGNAL` (SIGUSR1) and only sends SIGTERM after
+`CHAT_DRAIN_WINDOW_SECONDS`. On the drain signal this process:
+
+* refuses new WebSocket handshakes (`RejectWhileDraining`, in front of the
+  JWT lookup), so reconnects land on the replacement server;
+* sends every open chat socket a `server.draining` frame with a random
+  reconnect delay (up to `CHAT_DRAIN_RECONNECT_JITTER_SECONDS`) and a signed
+  resume token carrying the socket's groups and sequence numbers;
+* closes the sockets one by one, spread evenly over the window, with `1012`
+  (service restart).
+
+Clients therefore reconnect over the window plus jitter instead of all at
+once, and resume where they left off without a full reload.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import signal
+from typing import Any
+
+from django.conf import settings
+from django.core import signing
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DRAIN_WINDOW_SECONDS = getattr(settings, "CHAT_DRAIN_WINDOW_SECONDS", 20)
+RECONNECT_JITTER_SECONDS = getattr(settings, "CHAT_DRAIN_RECONNECT_JITTER_SECONDS", 30)
+DRAIN_SIGNAL = signal.SIGUSR1
+SERVICE_RESTART = 1012
+
+RESUME_SALT = "chat.resume"
+# Covers the drain window, the reconnect delay and a slow reconnect.
+RESUME_MAX_AGE_SECONDS = 10 * 60
+
+_draining = False
+# Open chat sockets per event loop, in connect order.
+_sockets: dict[asyncio.AbstractEventLoop, dict[Any, None]] = {}
+
+
+def is_draining() -> bool:
+    return _draining
+
+
+def track(consumer) -> None:
+    _sockets.setdefault(asyncio.get_running_loop(), {})[consumer] = None
+
+
+def untrack(consumer) -> None:
+    loop = asyncio.get_running_loop()
+    sockets = _sockets.get(loop)
+    if sockets is not None:
+        sockets.pop(consumer, None)
+        if not sockets:
+            del _sockets[loop]
+
+
+def make_resume_token(user_id, sequences: dict[str, int]) -> str:
+    return signing.dumps({"u": user_id, "g": sequences}, salt=RESUME_SALT, compress=True)
+
+
+def read_resume_token(token: str | None, user_id) -> dict[str, int] | None:
+    """Return the `{group_id: seq}` map of a valid token issued to the user, else `None`."""
+
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=RESUME_SALT, max_age=RESUME_MAX_AGE_SECONDS)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get("u") != user_id or not isinstance(data.get("g"), dict):
+        return None
+    return {str(group_id): seq for group_id, seq in data["g"].items() if isinstance(seq, int)}
+
+
+def install_drain_signal() -> None:
+    """Start draining when the process receives `DRAIN_SIGNAL`; call once at ASGI startup."""
+
+    try:
+        signal.signal(DRAIN_SIGNAL, _on_drain_signal)
+    except ValueError:
+        # Not the main thread (e.g. imported by a test runner worker).
+        logger.debug("Chat drain signal not installed outside the main thread")
+
+
+def _on_drain_signal(signum, frame) -> None:
+    begin_drain()
+
+
+def begin_drain() -> None:
+    """Enter drain mode and start draining the sockets of every event loop."""
+
+    global _draining
+    if _draining:
+        return
+    _draining = True
+    logger.info("Draining chat sockets over %ss", DRAIN_WINDOW_SECONDS)
+    for loop in list(_sockets):
+        loop.call_soon_threadsafe(asyncio.ensure_future, drain_local_sockets())
+
+
+async def drain_local_sockets() -> int:
+    """
+    Announce the drain to the sockets of the running loop and close them
+    gradually over `DRAIN_WINDOW_SECONDS`. Returns the number of sockets.
+    """
+
+    sockets = list(_sockets.get(asyncio.get_running_loop(), ()))
+    if not sockets:
+        return 0
+    for consumer in sockets:
+        try:
+            await consumer.announce_drain(random.uniform(0, RECONNECT_JITTER_SECONDS))
+        except Exception:
+            # The socket is still closed below, just without a resume token.
+            logger.exception("Failed to announce drain to chat socket %s", getattr(consumer, "channel_name", consumer))
+    step = DRAIN_WINDOW_SECONDS / len(sockets)
+    for consumer in sockets:
+        await asyncio.sleep(step)
+        metrics.increment("connections.drained")
+        try:
+            await consumer.close(code=SERVICE_RESTART)
+        except Exception:
+            logger.exception("Failed to close draining chat socket %s", getattr(consumer, "channel_name", consumer))
+    return len(sockets)
+
+
+class RejectWhileDraining:
+    """ASGI middleware refusing WebSocket handshakes while this process drains."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket" and _draining:
+            metrics.increment("connections.refused_draining")
+            await receive()  # websocket.connect
+            await send({"type": "websocket.close", "code": SERVICE_RESTART})
+            return None
+        return await self.app(scope, receive, send)
@@ -0,0 +1,139 @@
+"""
+Per-group event sequencing and a bounded replay log for chat WebSockets.
+
+Every chat event broadcast to a group is stamped with a per-group sequence
+number taken from a Redis counter and appended to a Redis sorted set scored
+by that number. Reconnecting sockets pass the last sequence they processed
+(`?since_seq=`) and receive the missed events from the log before live
+delivery resumes, so clients can detect gaps locally instead of refetching.
+
+Numbering and logging happen in one Lua script, so a number is never taken
+without its log entry. Publishing happens afterwards, from whichever process
+sent the event, so concurrent senders can deliver neighbouring numbers out
+of order; clients hold a frame that skips ahead for `REORDER_WINDOW_SECONDS`
+before treating the missing numbers as a gap.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_SIZE = getattr(settings, "CHAT_EVENT_LOG_SIZE", 500)
+EVENT_LOG_TTL_SECONDS = getattr(settings, "CHAT_EVENT_LOG_TTL_SECONDS", 24 * 60 * 60)
+# Documented client behaviour (docs/API.md); not enforced by the server.
+REORDER_WINDOW_SECONDS = 2
+
+# KEYS: sequence counter, event log. ARGV: JSON-encoded event type, JSON
+# payload, log size, log TTL. Returns the event's sequence number.
+RECORD_EVENT_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+local entry = '{"seq": ' .. seq .. ', "event": ' .. ARGV[1] .. ', "payload": ' .. ARGV[2] .. '}'
+redis.call('ZADD', KEYS[2], seq, entry)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[3]) + 1))
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return seq
+"""
+
+
+def sequence_key(group_id) -> str:
+    return f"chat:seq:{group_id}"
+
+
+def event_log_key(group_id) -> str:
+    return f"chat:events:{group_id}"
+
+
+def record_group_event(group_id, event_type: str, payload: Any) -> int | None:
+    """
+    Atomically assign the next sequence number for the group and append the
+    event to its replay log. Returns `None` when Redis is unavailable; the
+    event is then delivered unsequenced.
+    """
+
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    try:
+        seq = client.register_script(RECORD_EVENT_SCRIPT)(
+            keys=[sequence_key(group_id), event_log_key(group_id)],
+            args=[
+                json.dumps(event_type),
+                json.dumps(payload, cls=JSONEncoder),
+                EVENT_LOG_SIZE,
+                EVENT_LOG_TTL_SECONDS,
+            ],
+        )
+    except RedisError:
+        logger.warning("Failed to sequence chat event for group %s", group_id, exc_info=True)
+        return None
+    return seq
+
+
+def current_sequence(group_id) -> int | None:
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        return int(client.get(sequence_key(group_id)) or 0)
+    except RedisError:
+        logger.warning("Failed to read chat sequence for group %s", group_id, exc_info=True)
+        return None
+
+
+def current_sequences(group_ids) -> dict[str, int | None]:
+    """Current sequence number of several groups in one round trip."""
+
+    group_ids = [str(group_id) for group_id in group_ids]
+    client = get_redis_client()
+    if client is None or not group_ids:
+        return {group_id: None for group_id in group_ids}
+    try:
+        values = client.mget([sequence_key(group_id) for group_id in group_ids])
+    except RedisError:
+        logger.warning("Failed to read chat sequences", exc_info=True)
+        return {group_id: None for group_id in group_ids}
+    return {group_id: int(value or 0) for group_id, value in zip(group_ids, values)}
+
+
+def replay_group_events(group_id, since_seq: int) -> tuple[list[dict[str, Any]] | None, int | None]:
+    """
+    Return `(events, current_seq)` for events newer than `since_seq`, oldest
+    first. `events` is `None` when the log can no longer prove completeness
+    (the gap is older than the log, or `since_seq` is ahead of the server) and
+    the client has to resynchronise over HTTP instead.
+    """
+
+    client = get_redis_client()
+    if client is None:
+        return None, None
+
+    key = event_log_key(group_id)
+    try:
+        pipe = client.pipeline()
+        pipe.get(sequence_key(group_id))
+        pipe.zrangebyscore(key, f"({since_seq}", "+inf")
+        pipe.zrange(key, 0, 0, withscores=True)
+        raw_current, raw_events, oldest = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to replay chat events for group %s", group_id, exc_info=True)
+        return None, None
+
+    current = int(raw_current or 0)
+    if since_seq > current:
+        return None, current
+    if since_seq < current:
+        oldest_seq = int(oldest[0][1]) if oldest else None
+        if oldest_seq is None or oldest_seq > since_seq + 1:
+            return None, current
+    return [json.loads(raw) for raw in raw_events], current
@@ -0,0 +1,207 @@
+"""
+Streaming transcript export for a group's chat history.
+
+Rows are read through a server-side cursor (`QuerySet.iterator`) in chunks
+and written straight to a `StreamingHttpResponse`, so memory use does not
+grow with the size of the history. Attachments are inlined per message; a
+separate attachment manifest can be bundled with the transcript in a ZIP
+archive that is also produced incrementally.
+
+The generators are blocking, so under ASGI they are handed to the response
+wrapped in `async_stream`: Django would otherwise buffer a sync iterator
+completely before sending it. Each step pulls one chunk of rows in the
+sync thread, keeping the server-side cursor on a single connection.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import zipfile
+from itertools import islice
+from typing import Any, AsyncIterator, Iterator, TypeVar
+
+from asgiref.sync import sync_to_async
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Message, MessageAttachment
+
+CHUNK_SIZE = 2000
+
+MESSAGE_COLUMNS = [
+    "id",
+    "created_at",
+    "author_id",
+    "author_email",
+    "parent_id",
+    "text",
+    "moderation_status",
+    "moderation_note",
+    "moderated_at",
+    "moderated_by_id",
+    "is_deleted",
+    "deleted_at",
+    "deleted_by_id",
+    "attachments",
+]
+
+ATTACHMENT_COLUMNS = ["message_id", "file_url", "filename", "file_size", "mime_type"]
+
+Chunk = TypeVar("Chunk", str, bytes)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        # Only used for error responses; exports stream their own body.
+        return (json.dumps(data, cls=JSONEncoder) + "\n").encode("utf-8")
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        detail = data.get("detail", data) if isinstance(data, dict) else data
+        return f"{detail}\n".encode("utf-8")
+
+
+def export_messages(group) -> Iterator[Message]:
+    return (
+        Message.objects.filter(group=group)
+        .select_related("author")
+        .prefetch_related("attachments")
+        .order_by("created_at", "id")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def export_attachments(group) -> Iterator[MessageAttachment]:
+    return (
+        MessageAttachment.objects.filter(message__group=group)
+        .order_by("message__created_at", "message_id", "id")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def message_record(message: Message) -> dict[str, Any]:
+    return {
+        "id": message.pk,
+        "created_at": message.created_at,
+        "author_id": message.author_id,
+        "author_email": message.author.email,
+        "parent_id": message.parent_id,
+        "text": message.text,
+        "moderation_status": message.moderation_status,
+        "moderation_note": message.moderation_note,
+        "moderated_at": message.moderated_at,
+        "moderated_by_id": message.moderated_by_id,
+        "is_deleted": message.is_deleted,
+        "deleted_at": message.deleted_at,
+        "deleted_by_id": message.deleted_by_id,
+        "attachments": [attachment_record(attachment) for attachment in message.attachments.all()],
+    }
+
+
+def attachment_record(attachment: MessageAttachment) -> dict[str, Any]:
+    return {
+        "message_id": attachment.message_id,
+        "file_url": attachment.file_url,
+        "filename": attachment.filename,
+        "file_size": attachment.file_size,
+        "mime_type": attachment.mime_type,
+    }
+
+
+def stream_ndjson(group) -> Iterator[str]:
+    for message in export_messages(group):
+        yield json.dumps(message_record(message), cls=JSONEncoder) + "\n"
+
+
+def stream_csv(group) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(MESSAGE_COLUMNS)
+    for message in export_messages(group):
+        record = message_record(message)
+        record["attachments"] = json.dumps(record["attachments"], cls=JSONEncoder)
+        yield writer.writerow([_csv_value(record[column]) for column in MESSAGE_COLUMNS])
+
+
+def stream_attachment_manifest(group) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(ATTACHMENT_COLUMNS)
+    for attachment in export_attachments(group):
+        record = attachment_record(attachment)
+        yield writer.writerow([record[column] for column in ATTACHMENT_COLUMNS])
+
+
+def stream_zip(entries: list[tuple[str, Iterator[str]]]) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly: each `(name, chunks)` entry is compressed
+    as its chunks arrive and the archive bytes are yielded as soon as
+    `zipfile` writes them.
+    """
+
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            with archive.open(name, mode="w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk.encode("utf-8"))
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+async def async_stream(chunks: Iterator[Chunk]) -> AsyncIterator[Chunk]:
+    """
+    Drive a blocking stream from the event loop: up to `CHUNK_SIZE` items are
+    produced per hop to the sync thread and sent on as one body chunk.
+    """
+
+    take = sync_to_async(lambda: list(islice(chunks, CHUNK_SIZE)), thread_sensitive=True)
+    while batch := await take():
+        yield batch[0][:0].join(batch)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose `write` returns the value, for `csv.writer`."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class _ZipSink:
+    """Unseekable write target for `zipfile` that hands back written bytes."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return iter(chunks)
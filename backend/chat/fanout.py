@@ -0,0 +1,258 @@
+"""
+Process-local fan-out for chat channel groups.
+
+Sockets do not join `group_chat_<id>` channel-layer groups themselves.
+Instead each process (event loop) runs one `LocalFanout` hub that joins a
+group once, on behalf of all of its local sockets, reads group events from
+a single hub channel and hands them to the local consumers in memory. A
+message to a group with 40 sockets on one process therefore costs one
+channel-layer delivery to that process, not 40.
+
+Hubs also record their subscriptions in a Redis set per group, so
+`send_group_event` can skip `group_send` altogether when no process is
+listening. Entries left behind by a crashed process only cost a wasted
+send; they never cause events to be skipped. Memberships are renewed every
+half `group_expiry`, because channel layers expire group members after it.
+
+The moderation firehose is one more stream on the same hubs: every group
+event is also published once to `chat_firehose` (only while some process
+has a firehose socket) and dispatched in memory to local firehose sockets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from channels.consumer import get_handler_name
+from redis.exceptions import RedisError
+
+from core.redis_client import get_redis_client
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pause before the hub reads again after a failed channel-layer receive.
+READ_RETRY_SECONDS = 1.0
+
+_hubs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LocalFanout]" = weakref.WeakKeyDictionary()
+
+# Hub key and channel-layer group of the cross-group moderation stream.
+FIREHOSE = "~firehose"
+FIREHOSE_CHANNEL = "chat_firehose"
+
+
+def get_group_channel_name(group_id) -> str:
+    if group_id == FIREHOSE:
+        return FIREHOSE_CHANNEL
+    return f"group_chat_{group_id}"
+
+
+def listeners_key(group_id) -> str:
+    return f"chat:fanout:{group_id}"
+
+
+def has_listeners(group_id) -> bool:
+    """Whether any process subscribes to the group (`True` when unknown)."""
+
+    client = get_redis_client()
+    if client is None:
+        return True
+    try:
+        return bool(client.exists(listeners_key(group_id)))
+    except RedisError:
+        logger.warning("Failed to read chat fan-out listeners for group %s", group_id, exc_info=True)
+        return True
+
+
+def listening(group_id) -> tuple[bool, bool]:
+    """
+    Whether the group and the firehose have listeners, read in one round
+    trip (`True` when unknown).
+    """
+
+    client = get_redis_client()
+    if client is None:
+        return True, True
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(listeners_key(group_id))
+        pipe.exists(listeners_key(FIREHOSE))
+        group, firehose = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to read chat fan-out listeners for group %s", group_id, exc_info=True)
+        return True, True
+    return bool(group), bool(firehose)
+
+
+async def publish_group_event(channel_layer, group_id, event: dict, *, listeners: tuple[bool, bool] | None = None):
+    """Send a group event to the group's hubs and, when watched, the firehose."""
+
+    if listeners is None:
+        listeners = await sync_to_async(listening)(group_id)
+    group_listening, firehose_listening = listeners
+    if group_listening:
+        await channel_layer.group_send(get_group_channel_name(group_id), event)
+    else:
+        metrics.increment("fanout.skipped_sends")
+    if firehose_listening:
+        await channel_layer.group_send(FIREHOSE_CHANNEL, {**event, "type": "chat.firehose", "stream": FIREHOSE})
+
+
+def refresh_interval(channel_layer) -> float:
+    """
+    How often hubs re-join their groups. Channel layers forget group members
+    after `group_expiry` (a day by default), so memberships are renewed at
+    half that age.
+    """
+
+    return getattr(channel_layer, "group_expiry", 86400) / 2
+
+
+def get_hub(channel_layer) -> "LocalFanout":
+    """Return the hub of the running event loop, creating it on first use."""
+
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LocalFanout(channel_layer)
+    return hub
+
+
+class LocalFanout:
+    """One channel-layer subscription per chat group, shared by local sockets."""
+
+    def __init__(self, channel_layer) -> None:
+        self.channel_layer = channel_layer
+        self.channel_name: str | None = None
+        self._members: dict[str, set[Any]] = {}
+        self._lock = asyncio.Lock()
+        self._reader: asyncio.Task | None = None
+        self._refresher: asyncio.Task | None = None
+
+    def local_count(self, group_id) -> int:
+        return len(self._members.get(str(group_id), ()))
+
+    async def subscribe(self, group_id, consumer) -> None:
+        group_id = str(group_id)
+        async with self._lock:
+            members = self._members.get(group_id)
+            if members is None:
+                if self.channel_name is None:
+                    self.channel_name = await self.channel_layer.new_channel("chat.fanout.")
+                await self.channel_layer.group_add(get_group_channel_name(group_id), self.channel_name)
+                await sync_to_async(self._register)(group_id)
+                members = self._members[group_id] = set()
+                if self._reader is None or self._reader.done():
+                    self._reader = asyncio.ensure_future(self._read())
+                if self._refresher is None or self._refresher.done():
+                    self._refresher = asyncio.ensure_future(self._refresh())
+            members.add(consumer)
+
+    async def unsubscribe(self, group_id, consumer) -> None:
+        group_id = str(group_id)
+        async with self._lock:
+            members = self._members.get(group_id)
+            if members is None or consumer not in members:
+                return
+            members.discard(consumer)
+            if members:
+                return
+            del self._members[group_id]
+            await sync_to_async(self._unregister)(group_id)
+            await self.channel_layer.group_discard(get_group_channel_name(group_id), self.channel_name)
+            if not self._members:
+                for task in (self._reader, self._refresher):
+                    if task is None:
+                        continue
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+                self._reader = self._refresher = None
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self.channel_layer.receive(self.channel_name)
+            except Exception:
+                # Keep the hub alive: every local socket depends on this task.
+                logger.exception("Chat fan-out receive on %s failed", self.channel_name)
+                metrics.increment("fanout.receive_errors")
+                await asyncio.sleep(READ_RETRY_SECONDS)
+                continue
+            key = message.get("stream") or str(message.get("group_id"))
+            consumers = list(self._members.get(key, ()))
+            metrics.increment("fanout.received")
+            metrics.increment("fanout.delivered", len(consumers))
+            for consumer in consumers:
+                try:
+                    await consumer.receive_local(message)
+                except Exception:
+                    logger.exception("Local chat fan-out to %s failed", getattr(consumer, "channel_name", consumer))
+
+    async def _refresh(self) -> None:
+        interval = refresh_interval(self.channel_layer)
+        while True:
+            await asyncio.sleep(interval)
+            for group_id in list(self._members):
+                try:
+                    await self.channel_layer.group_add(get_group_channel_name(group_id), self.channel_name)
+                    await sync_to_async(self._register)(group_id)
+                except Exception:
+                    logger.exception("Failed to renew chat fan-out membership for group %s", group_id)
+
+    def _register(self, group_id: str) -> None:
+        client = get_redis_client()
+        if client is None:
+            return
+        try:
+            client.sadd(listeners_key(group_id), self.channel_name)
+        except RedisError:
+            logger.warning("Failed to register chat fan-out for group %s", group_id, exc_info=True)
+
+    def _unregister(self, group_id: str) -> None:
+        client = get_redis_client()
+        if client is None:
+            return
+        try:
+            client.srem(listeners_key(group_id), self.channel_name)
+        except RedisError:
+            logger.warning("Failed to unregister chat fan-out for group %s", group_id, exc_info=True)
+
+
+class LocalFanoutMixin:
+    """
+    Consumer side of the hub. Group events are dispatched to the usual
+    `chat_message`-style handlers; while a consumer is between `hold_local`
+    and `release_local` (connecting, subscribing) they are buffered, so live
+    events still arrive after replayed ones, as they would from the
+    consumer's own channel.
+    """
+
+    _held: list[dict[str, Any]] | None = None
+
+    def hold_local(self) -> None:
+        if self._held is None:
+            self._held = []
+
+    async def release_local(self) -> None:
+        held, self._held = self._held or [], None
+        for message in held:
+            await self._dispatch_local(message)
+
+    async def receive_local(self, message: dict[str, Any]) -> None:
+        if self._held is not None:
+            self._held.append(message)
+            return
+        await self._dispatch_local(message)
+
+    async def _dispatch_local(self, message: dict[str, Any]) -> None:
+        handler = getattr(self, get_handler_name(message), None)
+        if handler is not None:
+            await handler(message)
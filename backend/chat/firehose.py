@@ -0,0 +1,90 @@
+"""
+Server-side filters for the moderation firehose socket.
+
+The firehose (`FirehoseChatConsumer`) receives every group event from the
+process hub; `FirehoseFilter` decides per socket which of them to forward.
+Empty criteria match everything. Track, group and moderation-status filters
+are exact matches; the keyword is a case-insensitive substring of the
+message text. Events that carry no message (reaction deltas, thread
+counters) only pass while no status or keyword filter is set.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any
+
+from rest_framework.exceptions import ValidationError
+
+from .models import Message
+
+MAX_KEYWORD_LENGTH = 100
+
+
+@dataclass
+class FirehoseFilter:
+    tracks: set[str] = field(default_factory=set)
+    group_ids: set[str] = field(default_factory=set)
+    statuses: set[str] = field(default_factory=set)
+    keyword: str = ""
+
+    @classmethod
+    def parse(cls, raw: dict[str, Any]) -> "FirehoseFilter":
+        """
+        Build a filter from a `filter` frame or the connect query string;
+        list criteria may be given as lists or comma-separated strings.
+        """
+
+        statuses = _as_set(raw.get("status"))
+        unknown = statuses - set(Message.ModerationStatus.values)
+        if unknown:
+            raise ValidationError({"status": f"Unknown moderation status: {', '.join(sorted(unknown))}."})
+        keyword = " ".join(str(raw.get("keyword") or "").split())
+        if len(keyword) > MAX_KEYWORD_LENGTH:
+            raise ValidationError({"keyword": f"Keyword must be at most {MAX_KEYWORD_LENGTH} characters."})
+        return cls(
+            tracks=_as_set(raw.get("track")),
+            group_ids=_as_set(raw.get("groupIds")),
+            statuses=statuses,
+            keyword=keyword.casefold(),
+        )
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "track": sorted(self.tracks),
+            "groupIds": sorted(self.group_ids),
+            "status": sorted(self.statuses),
+            "keyword": self.keyword,
+        }
+
+    def apply(self, group_id: str, track: str | None, payload: Any) -> Any:
+        """Return the payload to forward (possibly narrowed), or `None` to drop the event."""
+
+        if self.group_ids and group_id not in self.group_ids:
+            return None
+        if self.tracks and track not in self.tracks:
+            return None
+        if not self.statuses and not self.keyword:
+            return payload
+        if not isinstance(payload, dict):
+            return None
+        if isinstance(payload.get("messages"), list):
+            messages = [message for message in payload["messages"] if self._matches(message)]
+            return {**payload, "messages": messages} if messages else None
+        if "moderation" in payload:
+            return payload if self._matches(payload) else None
+        return None
+
+    def _matches(self, message: dict[str, Any]) -> bool:
+        if self.statuses and (message.get("moderation") or {}).get("status") not in self.statuses:
+            return False
+        return not self.keyword or self.keyword in str(message.get("text") or "").casefold()
+
+
+def _as_set(value) -> set[str]:
+    if value in (None, ""):
+        return set()
+    items = value.split(",") if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        raise ValidationError("Filters must be lists or comma-separated strings.")
+    return {str(item).strip() for item in items if str(item).strip()}
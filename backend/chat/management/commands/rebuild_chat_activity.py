@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chat.activity import refresh_group_activity
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalised chat activity summary (message count, last message) of groups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "group_ids",
+            nargs="*",
+            help="Group ids to repair (default: all groups).",
+        )
+
+    def handle(self, *args, **options):
+        group_ids = options["group_ids"] or None
+        updated = refresh_group_activity(group_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt chat activity for {updated} group(s)."))
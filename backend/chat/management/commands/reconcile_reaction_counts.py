@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from chat.reactions import reconcile_reaction_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the aggregate reaction counts of messages from their Reaction rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "message_ids",
+            nargs="*",
+            type=int,
+            help="Message ids to repair (default: all messages with reactions).",
+        )
+
+    def handle(self, *args, **options):
+        message_ids = options["message_ids"] or None
+        updated = reconcile_reaction_counts(message_ids)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled reaction counts of {updated} message(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chat.digest import BATCH_SIZE, send_digests
+
+
+class Command(BaseCommand):
+    help = "Email offline users a digest of unread chat activity since their last digest."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of emails handed to the SMTP connection at a time.",
+        )
+
+    def handle(self, *args, **options):
+        sent = send_digests(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} chat digest(s)."))
@@ -0,0 +1,49 @@
+"""
+Process-local counters and gauges for the chat WebSocket layer.
+
+Daphne serves both HTTP and WebSocket traffic from the same process, so the
+admin metrics endpoint reports the sockets handled by the process answering
+the request. Values reset when the process restarts.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import Counter
+from typing import Any
+
+_lock = threading.Lock()
+_counters: Counter[str] = Counter()
+_queues: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+
+def increment(name: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def track_queue(queue) -> None:
+    """Register a live outbound queue so its depth shows up in snapshots."""
+
+    with _lock:
+        _queues.add(queue)
+
+
+def snapshot() -> dict[str, Any]:
+    with _lock:
+        depths = [len(queue) for queue in _queues]
+        counters = dict(_counters)
+    return {
+        "counters": counters,
+        "sendQueues": {
+            "connections": len(depths),
+            "depthTotal": sum(depths),
+            "depthMax": max(depths, default=0),
+        },
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_message_deleted_at_message_deleted_by_and_more"),
+        ("groups", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["group", "created_at", "id"],
+                name="chat_msg_group_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# The search column/table, index and triggers are not part of the model; see
+# chat/search.py. The DDL is frozen here so the migration never depends on
+# application code.
+
+POSTGRES_INSTALL = [
+    "ALTER TABLE chat_message ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "UPDATE chat_message SET search_vector = to_tsvector('pg_catalog.english', text)",
+    "CREATE INDEX IF NOT EXISTS chat_msg_search_gin_idx ON chat_message USING gin (search_vector)",
+    "DROP TRIGGER IF EXISTS chat_message_search_update ON chat_message",
+    "CREATE TRIGGER chat_message_search_update BEFORE INSERT OR UPDATE OF text ON chat_message "
+    "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.english', text)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chat_message_search_update ON chat_message",
+    "DROP INDEX IF EXISTS chat_msg_search_gin_idx",
+    "ALTER TABLE chat_message DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "text, content='chat_message', content_rowid='id', tokenize='porter unicode61')",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF text ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO chat_message_fts(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+
+
+def install(apps, schema_editor):
+    statements = POSTGRES_INSTALL if schema_editor.connection.vendor == "postgresql" else SQLITE_INSTALL
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    statements = POSTGRES_UNINSTALL if schema_editor.connection.vendor == "postgresql" else SQLITE_UNINSTALL
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_readmarker"),
+    ]
+
+    operations = [
+        # Postgres tsvector column + GIN index + trigger, or an FTS5 table with
+        # sync triggers on SQLite.
+        migrations.RunPython(install, uninstall),
+    ]
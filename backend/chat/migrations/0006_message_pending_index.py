@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0005_message_search_index"),
+        ("groups", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("moderation_status", "pending")),
+                fields=["created_at", "id"],
+                name="chat_msg_pending_idx",
+            ),
+        ),
+    ]
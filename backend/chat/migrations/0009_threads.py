@@ -0,0 +1,80 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the SQLite statements of 0005_message_search_index.
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "text, content='chat_message', content_rowid='id', tokenize='porter unicode61')",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF text ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO chat_message_fts(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+
+def reinstall_search_index(apps, schema_editor):
+    # SQLite rebuilds chat_message for the new columns, dropping the FTS
+    # triggers; PostgreSQL alters the table in place.
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in SQLITE_INSTALL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0008_reactions"),
+        ("groups", "0002_group_chat_activity"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, reinstall_search_index),
+        migrations.AddField(
+            model_name="message",
+            name="last_reply_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="chat.message",
+            ),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="reply_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("parent__isnull", True)),
+                fields=["group", "created_at", "id"],
+                name="chat_msg_toplevel_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["parent", "created_at", "id"], name="chat_msg_thread_idx"
+            ),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
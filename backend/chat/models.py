@@ -47,9 +47,41 @@ class Message(models.Model):
         on_delete=models.SET_NULL,
         related_name="moderated_messages",
     )
+    # Aggregate reaction counts ({emoji: count}), maintained by `chat.reactions`.
+    reaction_counts = models.JSONField(default=dict, blank=True)
+    # Threads are one level deep; counters on the parent are maintained by
+    # `chat.threads`. `chat_msg_thread_idx` covers lookups by parent.
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="replies",
+        db_index=False,
+    )
+    reply_count = models.PositiveIntegerField(default=0)
+    last_reply_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["-created_at", "-id"]
+        indexes = [
+            # Serves keyset pagination over (created_at, id) within a group.
+            models.Index(fields=["group", "created_at", "id"], name="chat_msg_group_created_idx"),
+            # Main timeline: top-level messages only.
+            models.Index(
+                fields=["group", "created_at", "id"],
+                name="chat_msg_toplevel_idx",
+                condition=models.Q(parent__isnull=True),
+            ),
+            # Thread pages over (created_at, id) within a parent.
+            models.Index(fields=["parent", "created_at", "id"], name="chat_msg_thread_idx"),
+            # Moderation queue: only pending rows are indexed.
+            models.Index(
+                fields=["created_at", "id"],
+                name="chat_msg_pending_idx",
+                condition=models.Q(moderation_status="pending"),
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.author} @ {self.group}: {self.text[:50]}"
@@ -75,3 +107,70 @@ class MessageAttachment(models.Model):
 
     def __str__(self) -> str:
         return self.filename
+
+
+class Reaction(models.Model):
+    """
+    A user's emoji reaction to a message.
+    """
+
+    message = models.ForeignKey(
+        Message,
+        on_delete=models.CASCADE,
+        related_name="reactions",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chat_reactions",
+    )
+    emoji = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("message", "user", "emoji")
+
+    def __str__(self) -> str:
+        return f"{self.user} reacted {self.emoji} to #{self.message_id}"
+
+
+class ReadMarker(models.Model):
+    """
+    High-water mark of the newest message a user has read in a group.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chat_read_markers",
+    )
+    group = models.ForeignKey(
+        "groups.Group",
+        on_delete=models.CASCADE,
+        related_name="chat_read_markers",
+    )
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "group")
+
+    def __str__(self) -> str:
+        return f"{self.user} read {self.group} through #{self.last_read_message_id}"
+
+
+class DigestState(models.Model):
+    """
+    When a user was last sent a chat digest email; later digests only cover
+    messages created after it.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chat_digest_state",
+    )
+    last_sent_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"{self.user} digested at {self.last_sent_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,66 @@
+"""
+Cross-group moderation queue for admins, supervisors and staff.
+
+Pending messages (including ones held back automatically) are listed oldest
+first with keyset cursors over `(created_at, id)`, served by a partial index
+that only covers pending rows. Whenever a moderation action may have changed
+the queue, the new size is pushed to the moderators' channel group so open
+staff sockets update without polling.
+
+Held messages stay private until approved: only their author and moderators
+can list, search or receive them (`visible_messages`).
+"""
+
+from __future__ import annotations
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import Q, QuerySet
+
+from .models import Message
+from .pagination import MessageCursor
+
+MODERATORS_CHANNEL = "chat_moderators"
+
+
+def pending_messages() -> QuerySet[Message]:
+    return Message.objects.filter(moderation_status=Message.ModerationStatus.PENDING, is_deleted=False)
+
+
+def visible_messages(queryset: QuerySet[Message], viewer) -> QuerySet[Message]:
+    """Narrow `queryset` to the messages `viewer` may list."""
+
+    if viewer.can_moderate:
+        return queryset
+    return (
+        queryset.filter(is_deleted=False)
+        .exclude(moderation_status=Message.ModerationStatus.REJECTED)
+        .exclude(Q(moderation_status=Message.ModerationStatus.PENDING) & ~Q(author_id=viewer.user_id))
+    )
+
+
+def moderation_queue_page(*, page_size: int, after: MessageCursor | None = None) -> tuple[list[Message], bool]:
+    """Return `(messages oldest first, has_more)` for one page of the queue."""
+
+    queryset = (
+        pending_messages()
+        .select_related("author", "deleted_by", "moderated_by")
+        .prefetch_related("attachments")
+        .order_by("created_at", "id")
+    )
+    if after is not None:
+        queryset = queryset.filter(after.newer_q())
+    messages = list(queryset[: page_size + 1])
+    return messages[:page_size], len(messages) > page_size
+
+
+def notify_moderation_queue() -> None:
+    """Push the current queue size to every connected moderator socket."""
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        MODERATORS_CHANNEL,
+        {"type": "chat.moderation_queue", "pending": pending_messages().count()},
+    )
@@ -0,0 +1,75 @@
+"""
+Compact ("normalized") chat payloads.
+
+Opt-in via `?format=normalized` on HTTP pages and WebSocket connects: each
+message references its author by id and the author objects are emitted once
+in a `users` map keyed by id. Sockets additionally remember which authors
+they have already sent and only ship new ones.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import AuthorSerializer
+
+NORMALIZED = "normalized"
+
+
+class NormalizedJSONRenderer(JSONRenderer):
+    """Plain JSON; registering the format lets views honour `?format=normalized`."""
+
+    format = NORMALIZED
+
+
+def users_map(authors: Iterable) -> dict[str, dict[str, Any]]:
+    unique = {author.pk: author for author in authors}
+    return {str(data["id"]): data for data in AuthorSerializer(unique.values(), many=True).data}
+
+
+def compact_messages(payloads: Iterable[dict[str, Any]]) -> tuple[list[dict[str, Any]], dict[str, dict[str, Any]]]:
+    """Replace embedded author objects in rendered messages by their ids."""
+
+    users: dict[str, dict[str, Any]] = {}
+    messages = []
+    for payload in payloads:
+        author = payload.get("author")
+        if isinstance(author, dict):
+            users[str(author["id"])] = author
+            payload = {**payload, "author": author["id"]}
+        messages.append(payload)
+    return messages, users
+
+
+class SentUsers:
+    """Authors already delivered over one socket."""
+
+    def __init__(self) -> None:
+        self._ids: set[str] = set()
+
+    def compact(self, payload: Any) -> tuple[Any, dict[str, dict[str, Any]]]:
+        """
+        Compact a message event payload (a message, or `{"messages": [...]}`
+        for batches) and return it with the authors the client has not seen.
+        """
+
+        if not isinstance(payload, dict):
+            return payload, {}
+        if isinstance(payload.get("messages"), list):
+            messages, users = compact_messages(payload["messages"])
+            payload = {**payload, "messages": messages}
+        elif isinstance(payload.get("author"), dict):
+            (payload,), users = compact_messages([payload])
+        else:
+            return payload, {}
+
+        fresh = {user_id: user for user_id, user in users.items() if user_id not in self._ids}
+        self._ids.update(fresh)
+        return payload, fresh
+
+    def reset(self) -> None:
+        """Forget everything, e.g. after queued frames were dropped."""
+
+        self._ids.clear()
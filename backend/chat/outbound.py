@@ -0,0 +1,183 @@
+"""
+Bounded per-connection send queue for chat WebSockets.
+
+Channel-layer events are handed to an `OutboundQueue` instead of being sent
+inline, so one slow client can never stall the consumer's receive loop or
+let its channel-layer inbox overflow (where `channels_redis` would drop
+events silently). When the queue is full, the configured policy decides what
+happens:
+
+* ``coalesce`` – merge the event into a queued event for the same message
+  (the client only needs its latest state); falls back to ``resync``.
+* ``resync`` – drop everything queued and send a single ``sync.required``
+  frame carrying the cursor of the last delivered message, so the client can
+  catch up over HTTP with ``?after=``.
+* ``disconnect`` – close the socket after a ``connection.overloaded`` frame
+  with the same resume hint.
+
+A frame that fails to send (e.g. the transport is already gone) stops the
+writer: the error is logged and the socket is closed via `on_send_error`.
+
+Queue depth measures backpressure between the consumer and the ASGI server,
+not the client's socket: under daphne `send` returns as soon as the frame is
+handed to Twisted, which buffers it without limit. A client that stops
+reading therefore grows Twisted's transport buffer while this queue stays
+short; the idle deadline (`chat/connections.py`) is what eventually closes
+such sockets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+COALESCE = "coalesce"
+RESYNC = "resync"
+DISCONNECT = "disconnect"
+POLICIES = {COALESCE, RESYNC, DISCONNECT}
+
+DEFAULT_MAX_SIZE = getattr(settings, "CHAT_SEND_QUEUE_SIZE", 256)
+DEFAULT_POLICY = getattr(settings, "CHAT_SEND_OVERFLOW_POLICY", RESYNC)
+
+
+class OutboundQueue:
+    """Queue of outgoing frames drained by a single writer task."""
+
+    def __init__(
+        self,
+        send: Callable[[dict[str, Any]], Awaitable[None]],
+        *,
+        on_overflow_disconnect: Callable[[str | None], Awaitable[None]] | None = None,
+        on_drop: Callable[[], None] | None = None,
+        on_send_error: Callable[[], Awaitable[None]] | None = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        policy: str = DEFAULT_POLICY,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy!r}")
+        self._send = send
+        self._on_overflow_disconnect = on_overflow_disconnect
+        # Called whenever queued frames are discarded, so per-connection
+        # delivery state (e.g. authors already sent) can be reset.
+        self._on_drop = on_drop
+        self._on_send_error = on_send_error
+        self.max_size = max(1, max_size)
+        self.policy = policy
+        self._items: deque[tuple[Any, dict[str, Any]]] = deque()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        # Cursor of the newest message delivered to the client, overall and
+        # per group for frames tagged with a `groupId` (multiplexed sockets).
+        self.resume_cursor: str | None = None
+        self.group_cursors: dict[str, str] = {}
+        metrics.track_queue(self)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def stop(self) -> None:
+        self._closed = True
+        self._items.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def put(self, frame: dict[str, Any], *, key: Any = None) -> None:
+        """
+        Enqueue `frame` without blocking. `key` identifies the entity the frame
+        describes (e.g. a message id) and enables coalescing.
+        """
+
+        if self._closed:
+            return
+        metrics.increment("send_queue.enqueued")
+
+        if len(self._items) < self.max_size:
+            self._append(key, frame)
+            return
+
+        if self.policy == COALESCE and key is not None and self._coalesce(key, frame):
+            metrics.increment("send_queue.coalesced")
+            return
+
+        metrics.increment("send_queue.dropped", len(self._items) + 1)
+        self._items.clear()
+        if self._on_drop is not None:
+            self._on_drop()
+
+        if self.policy == DISCONNECT:
+            metrics.increment("send_queue.disconnects")
+            self._closed = True
+            if self._on_overflow_disconnect is not None:
+                asyncio.ensure_future(self._on_overflow_disconnect(self.resume_cursor))
+            return
+
+        metrics.increment("send_queue.resyncs")
+        frame = {"type": "sync.required", "reason": "backpressure", "after": self.resume_cursor}
+        if self.group_cursors:
+            frame["groups"] = dict(self.group_cursors)
+        self._append(None, frame)
+
+    def _append(self, key: Any, frame: dict[str, Any]) -> None:
+        self._items.append((key, frame))
+        self._ready.set()
+
+    def _coalesce(self, key: Any, frame: dict[str, Any]) -> bool:
+        for index, (queued_key, queued) in enumerate(self._items):
+            if queued_key == key:
+                # Keep the queued event type (e.g. "message.created") but ship
+                # the latest state of the entity; absorbed sequence numbers are
+                # listed so clients do not mistake them for gaps.
+                merged = {**queued, "payload": frame.get("payload")}
+                if frame.get("seq") is not None:
+                    merged["coalesced"] = [*queued.get("coalesced", []), frame["seq"]]
+                self._items[index] = (key, merged)
+                return True
+        return False
+
+    async def _drain(self) -> None:
+        while True:
+            if not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            _, frame = self._items.popleft()
+            try:
+                await self._send(frame)
+            except Exception:
+                logger.exception("Failed to send chat frame %r; closing the socket", frame.get("type"))
+                metrics.increment("send_queue.send_errors")
+                await self._fail()
+                return
+            payload = frame.get("payload")
+            if frame.get("type") == "message.created" and isinstance(payload, dict) and payload.get("cursor"):
+                self.resume_cursor = payload["cursor"]
+                if frame.get("groupId") is not None:
+                    self.group_cursors[frame["groupId"]] = payload["cursor"]
+
+    async def _fail(self) -> None:
+        self._closed = True
+        self._items.clear()
+        if self._on_send_error is None:
+            return
+        try:
+            await self._on_send_error()
+        except Exception:
+            logger.warning("Failed to close chat socket after a send error", exc_info=True)
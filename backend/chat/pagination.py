@@ -0,0 +1,109 @@
+"""Opaque keyset cursors for paging through group chat history."""
+
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Message
+
+
+@dataclass(frozen=True)
+class MessageCursor:
+    """Position of a message in the `(created_at, id)` ordering."""
+
+    created_at: datetime
+    id: int | None = None
+
+    @classmethod
+    def for_message(cls, message: Message) -> "MessageCursor":
+        return cls(created_at=message.created_at, id=message.pk)
+
+    def encode(self) -> str:
+        raw = json.dumps([self.created_at.isoformat(), self.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, value: str) -> "MessageCursor":
+        """
+        Parse an opaque cursor. Plain ISO timestamps are still accepted so that
+        clients using the legacy `before=<timestamp>` parameter keep working.
+        """
+
+        value = (value or "").strip()
+        if not value:
+            raise ValueError("Empty cursor.")
+
+        legacy = parse_datetime(value)
+        if legacy is not None:
+            return cls(created_at=_make_aware(legacy))
+
+        try:
+            padded = value + "=" * (-len(value) % 4)
+            created_raw, message_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            created_at = parse_datetime(created_raw)
+            message_id = int(message_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError("Malformed cursor.") from None
+        if created_at is None:
+            raise ValueError("Malformed cursor.")
+        return cls(created_at=_make_aware(created_at), id=message_id)
+
+    def older_q(self) -> Q:
+        """Rows strictly before this cursor in `(created_at, id)` order."""
+
+        if self.id is None:
+            return Q(created_at__lt=self.created_at)
+        return Q(created_at__lt=self.created_at) | Q(created_at=self.created_at, id__lt=self.id)
+
+    def newer_q(self) -> Q:
+        """Rows strictly after this cursor in `(created_at, id)` order."""
+
+        if self.id is None:
+            return Q(created_at__gt=self.created_at)
+        return Q(created_at__gt=self.created_at) | Q(created_at=self.created_at, id__gt=self.id)
+
+
+def paginate_messages(
+    queryset: QuerySet,
+    *,
+    page_size: int,
+    before: MessageCursor | None = None,
+    after: MessageCursor | None = None,
+) -> tuple[list[Message], bool]:
+    """
+    Return one page of messages (newest first) and whether more rows exist in
+    the direction of travel.
+
+    Without cursors, or with `before`, the page walks backwards from the newest
+    message. With `after`, the page holds the oldest messages newer than the
+    cursor so reconnecting clients can fetch exactly the gap they missed.
+    """
+
+    if before is not None:
+        queryset = queryset.filter(before.older_q())
+
+    if after is not None:
+        queryset = queryset.filter(after.newer_q()).order_by("created_at", "id")
+        messages = list(queryset[: page_size + 1])
+        has_more = len(messages) > page_size
+        messages = messages[:page_size]
+        messages.reverse()
+        return messages, has_more
+
+    queryset = queryset.order_by("-created_at", "-id")
+    messages = list(queryset[: page_size + 1])
+    has_more = len(messages) > page_size
+    return messages[:page_size], has_more
+
+
+def _make_aware(value: datetime) -> datetime:
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, timezone=dt_timezone.utc)
+    return value
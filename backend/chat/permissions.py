@@ -2,15 +2,24 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
+
 from django.contrib.auth.models import AnonymousUser
+from rest_framework.permissions import BasePermission
+
+
+def has_role_based_access(user) -> bool:
+    """Admins, supervisors and staff can access (and moderate) every group."""
+
+    role = getattr(user, "role", "")
+    return role in {"admin", "supervisor"} or getattr(user, "is_staff", False)
 
 
 def user_has_group_access(user, group) -> bool:
     if isinstance(user, AnonymousUser) or not getattr(user, "is_authenticated", False):
         return False
 
-    role = getattr(user, "role", "")
-    if role in {"admin", "supervisor"} or getattr(user, "is_staff", False):
+    if has_role_based_access(user):
         return True
 
     if getattr(group, "mentor_id", None) == getattr(user, "id", None):
@@ -23,8 +32,40 @@ def user_can_moderate_group_chat(user, group) -> bool:
     if isinstance(user, AnonymousUser) or not getattr(user, "is_authenticated", False):
         return False
 
-    role = getattr(user, "role", "")
-    if role in {"admin", "supervisor"} or getattr(user, "is_staff", False):
+    if has_role_based_access(user):
         return True
 
     return getattr(group, "mentor_id", None) == getattr(user, "id", None)
+
+
+class CanModerateAllChats(BasePermission):
+    """Admins, supervisors and staff: the users who moderate every group."""
+
+    def has_permission(self, request, view) -> bool:
+        user = request.user
+        return bool(user and user.is_authenticated and has_role_based_access(user))
+
+
+@dataclass(frozen=True)
+class ChatViewer:
+    """
+    Capabilities of the user a chat payload is rendered for. Resolved once per
+    request or broadcast so serializers never re-check permissions per row.
+    `group_id=None` means the capabilities apply to messages from any group.
+    """
+
+    user_id: int | None = None
+    can_moderate: bool = False
+    group_id: str | None = None
+
+    def applies_to(self, group_id) -> bool:
+        return self.group_id is None or str(self.group_id) == str(group_id)
+
+
+def resolve_chat_viewer(user, group) -> ChatViewer:
+    user_id = getattr(user, "id", None) if getattr(user, "is_authenticated", False) else None
+    return ChatViewer(
+        user_id=user_id,
+        can_moderate=user_can_moderate_group_chat(user, group),
+        group_id=str(group.pk),
+    )
@@ -0,0 +1,146 @@
+"""
+Group presence and typing state for chat WebSockets.
+
+Each group has a Redis sorted set of live connections (`<user_id>:<channel>`)
+scored by the time their heartbeat expires; expired entries are pruned on
+heartbeat, so a crashed process drops out after `PRESENCE_TTL_SECONDS`
+without any cleanup. A user is online while at least one of their
+connections is live, and `presence.changed` events are only broadcast on
+those transitions, never per heartbeat. The heartbeat that prunes a user's
+last connection reports them, so their offline event is broadcast even
+though their own socket never said goodbye.
+
+Typing notifications are coalesced across sockets and processes with a
+`SET NX EX` key per user and group: at most one `typing` event per user is
+broadcast per `TYPING_THROTTLE_SECONDS`.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL_SECONDS = getattr(settings, "CHAT_PRESENCE_TTL_SECONDS", 60)
+TYPING_THROTTLE_SECONDS = getattr(settings, "CHAT_TYPING_THROTTLE_SECONDS", 3)
+
+
+def presence_key(group_id) -> str:
+    return f"chat:presence:{group_id}"
+
+
+def typing_key(group_id, user_id) -> str:
+    return f"chat:typing:{group_id}:{user_id}"
+
+
+def touch(group_id, user_id, connection_id: str) -> tuple[bool, list[int]]:
+    """
+    Register or refresh a connection's heartbeat and prune expired ones.
+    Returns whether this made the user appear online in the group, and the
+    users the prune left without a live connection.
+    """
+
+    client = get_redis_client()
+    if client is None:
+        return False, []
+
+    now = time.time()
+    key = presence_key(group_id)
+    try:
+        pipe = client.pipeline()
+        pipe.zrangebyscore(key, "-inf", now)
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zrange(key, 0, -1)
+        pipe.zadd(key, {_member(user_id, connection_id): now + PRESENCE_TTL_SECONDS})
+        pipe.expire(key, PRESENCE_TTL_SECONDS)
+        expired, _, live, _, _ = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to refresh chat presence for group %s", group_id, exc_info=True)
+        return False, []
+    # The transaction hands each expired entry to exactly one pruning heartbeat.
+    live_ids = _user_ids(live)
+    gone = _user_ids(expired) - live_ids - {str(user_id)}
+    return str(user_id) not in live_ids, sorted(int(gone_id) for gone_id in gone)
+
+
+def leave(group_id, user_id, connection_id: str) -> bool:
+    """Drop a connection. Returns `True` when the user has no live connection left."""
+
+    client = get_redis_client()
+    if client is None:
+        return False
+
+    key = presence_key(group_id)
+    try:
+        pipe = client.pipeline()
+        pipe.zrem(key, _member(user_id, connection_id))
+        pipe.zrangebyscore(key, time.time(), "+inf")
+        removed, live = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to clear chat presence for group %s", group_id, exc_info=True)
+        return False
+    return bool(removed) and str(user_id) not in _user_ids(live)
+
+
+def online_user_ids(group_id) -> list[int]:
+    client = get_redis_client()
+    if client is None:
+        return []
+    try:
+        live = client.zrangebyscore(presence_key(group_id), time.time(), "+inf")
+    except RedisError:
+        logger.warning("Failed to read chat presence for group %s", group_id, exc_info=True)
+        return []
+    return sorted(int(user_id) for user_id in _user_ids(live))
+
+
+def online_user_ids_by_group(group_ids) -> dict[str, set[int]]:
+    """Online users of several groups, read in one pipelined round trip."""
+
+    group_ids = [str(group_id) for group_id in group_ids]
+    client = get_redis_client()
+    if client is None or not group_ids:
+        return {}
+    now = time.time()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for group_id in group_ids:
+            pipe.zrangebyscore(presence_key(group_id), now, "+inf")
+        results = pipe.execute()
+    except RedisError:
+        logger.warning("Failed to read chat presence for %d group(s)", len(group_ids), exc_info=True)
+        return {}
+    return {
+        group_id: {int(user_id) for user_id in _user_ids(live)}
+        for group_id, live in zip(group_ids, results)
+    }
+
+
+def start_typing(group_id, user_id) -> bool:
+    """Return `True` when a `typing` event should be broadcast for the user."""
+
+    client = get_redis_client()
+    if client is None:
+        return True
+    try:
+        return bool(client.set(typing_key(group_id, user_id), 1, nx=True, ex=TYPING_THROTTLE_SECONDS))
+    except RedisError:
+        logger.warning("Failed to throttle typing for group %s", group_id, exc_info=True)
+        return False
+
+
+def _member(user_id, connection_id: str) -> str:
+    return f"{user_id}:{connection_id}"
+
+
+def _user_ids(members) -> set[str]:
+    return {
+        (member.decode("utf-8") if isinstance(member, bytes) else member).split(":", 1)[0]
+        for member in members
+    }
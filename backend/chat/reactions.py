@@ -0,0 +1,268 @@
+"""
+Message reactions.
+
+Each reaction is stored as a raw `Reaction` row (one per user, message and
+emoji). Toggles are broadcast as compact `reaction.delta` events, never as
+re-rendered messages. The aggregate `Message.reaction_counts` that list
+responses read is updated in batches: committed deltas are buffered
+in-process per (message, emoji) and applied with a constant number of
+queries per flush, however many reactions arrived in between. Flushes
+only ever run on a timer: per event loop for sockets, on a timer thread for
+HTTP workers, so a burst of HTTP reactions is one flush too.
+
+Deltas buffered by a process that dies are lost; `reconcile_reaction_counts`
+(the `reconcile_reaction_counts` command) recomputes the counts from the
+`Reaction` rows.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Iterable
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .cache import replace_messages
+from .models import Message, Reaction
+from .services import build_group_event
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = getattr(settings, "CHAT_REACTION_FLUSH_SECONDS", 1.0)
+MAX_EMOJI_LENGTH = Reaction._meta.get_field("emoji").max_length
+# Distinct emoji one message can collect; `reaction_counts` is on every page.
+MAX_EMOJI_PER_MESSAGE = getattr(settings, "CHAT_MAX_REACTION_EMOJI", 20)
+
+# Pictographic code points an emoji sequence must contain at least one of.
+_EMOJI_RANGES = (
+    (0x00A9, 0x00A9),
+    (0x00AE, 0x00AE),
+    (0x203C, 0x203C),
+    (0x2049, 0x2049),
+    (0x2122, 0x2122),
+    (0x2139, 0x2139),
+    (0x2194, 0x21AA),
+    (0x231A, 0x23FF),
+    (0x24C2, 0x24C2),
+    (0x25AA, 0x27BF),
+    (0x2934, 0x2935),
+    (0x2B05, 0x2B55),
+    (0x3030, 0x3030),
+    (0x303D, 0x303D),
+    (0x3297, 0x3299),
+    (0x1F000, 0x1FAFF),
+)
+# Code points that only join or modify pictographs: ZWJ, variation
+# selectors, the keycap mark and the tags of subdivision flags.
+_EMOJI_JOINERS = ((0x200D, 0x200D), (0xFE0E, 0xFE0F), (0x20E3, 0x20E3), (0xE0020, 0xE007F))
+_KEYCAP_BASES = frozenset("0123456789#*")
+
+_lock = threading.Lock()
+_pending: Counter[tuple[int, str]] = Counter()
+_flush_task: asyncio.Task | None = None
+_flush_timer: threading.Timer | None = None
+
+
+def normalize_emoji(value) -> str:
+    emoji = str(value or "").strip()
+    if not emoji or len(emoji) > MAX_EMOJI_LENGTH or not _is_emoji(emoji):
+        raise ValidationError({"emoji": f"Provide a single emoji of at most {MAX_EMOJI_LENGTH} characters."})
+    return emoji
+
+
+def _in_ranges(char: str, ranges) -> bool:
+    code = ord(char)
+    return any(low <= code <= high for low, high in ranges)
+
+
+def _is_emoji(value: str) -> bool:
+    """Whether `value` only holds emoji code points (pictographs, modifiers, joiners, keycaps)."""
+
+    if value[0] in _KEYCAP_BASES:
+        return value[1:] in ("\u20e3", "\ufe0f\u20e3")
+    return _in_ranges(value[0], _EMOJI_RANGES) and all(
+        _in_ranges(char, _EMOJI_RANGES) or _in_ranges(char, _EMOJI_JOINERS) for char in value[1:]
+    )
+
+
+def set_reaction(group_id, message_id, user, emoji, *, add: bool) -> dict | None:
+    """
+    Add or remove the user's reaction and return the `reaction.delta` event
+    to broadcast, or `None` when nothing changed (toggles are idempotent).
+    """
+
+    emoji = normalize_emoji(emoji)
+    message = (
+        Message.objects.filter(
+            pk=message_id,
+            group_id=group_id,
+            is_deleted=False,
+            moderation_status=Message.ModerationStatus.APPROVED,
+        )
+        .only("id")
+        .first()
+    )
+    if message is None:
+        raise NotFound("Message not found.")
+
+    if add:
+        used = set(Reaction.objects.filter(message=message).order_by().values_list("emoji", flat=True).distinct())
+        if emoji not in used and len(used) >= MAX_EMOJI_PER_MESSAGE:
+            raise ValidationError({"emoji": f"Messages can collect at most {MAX_EMOJI_PER_MESSAGE} different emoji."})
+        try:
+            with transaction.atomic():
+                Reaction.objects.create(message=message, user=user, emoji=emoji)
+        except IntegrityError:
+            return None
+        delta = 1
+    else:
+        deleted, _ = Reaction.objects.filter(message=message, user=user, emoji=emoji).delete()
+        if not deleted:
+            return None
+        delta = -1
+
+    transaction.on_commit(lambda: _buffer(message.pk, emoji, delta))
+    return build_group_event(
+        group_id,
+        "reaction.delta",
+        {"messageId": message.pk, "emoji": emoji, "userId": user.pk, "delta": delta},
+    )
+
+
+def _buffer(message_id: int, emoji: str, delta: int) -> None:
+    with _lock:
+        _pending[(message_id, emoji)] += delta
+
+
+async def schedule_flush() -> None:
+    """Ensure a flush runs within `FLUSH_INTERVAL_SECONDS` on this event loop."""
+
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.ensure_future(_flush_later())
+
+
+async def _flush_later() -> None:
+    await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+    await database_sync_to_async(flush_reaction_counts)()
+
+
+def schedule_threaded_flush() -> None:
+    """Sync callers (HTTP views): ensure a flush runs within `FLUSH_INTERVAL_SECONDS` on a timer thread."""
+
+    global _flush_timer
+    with _lock:
+        if _flush_timer is not None:
+            return
+        _flush_timer = threading.Timer(FLUSH_INTERVAL_SECONDS, _flush_on_timer)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _flush_on_timer() -> None:
+    global _flush_timer
+    with _lock:
+        # Deltas buffered from here on schedule the next timer.
+        _flush_timer = None
+    try:
+        flush_reaction_counts()
+    except Exception:
+        # The deltas are back in the buffer; try again on the next tick.
+        logger.exception("Failed to flush buffered reaction counts")
+        schedule_threaded_flush()
+    finally:
+        close_old_connections()
+
+
+def flush_reaction_counts() -> int:
+    """
+    Apply buffered deltas to `Message.reaction_counts` with one locking read
+    and one `bulk_update`. Returns the number of messages updated. Deltas go
+    back into the buffer if the write fails.
+    """
+
+    with _lock:
+        pending = {key: delta for key, delta in _pending.items() if delta}
+        _pending.clear()
+    if not pending:
+        return 0
+
+    by_message: dict[int, dict[str, int]] = {}
+    for (message_id, emoji), delta in pending.items():
+        by_message.setdefault(message_id, {})[emoji] = delta
+
+    try:
+        with transaction.atomic():
+            messages = list(
+                Message.objects.select_for_update(of=("self",))
+                .select_related("author", "deleted_by", "moderated_by")
+                .prefetch_related("attachments")
+                .filter(pk__in=by_message)
+            )
+            for message in messages:
+                counts = dict(message.reaction_counts or {})
+                for emoji, delta in by_message[message.pk].items():
+                    counts[emoji] = counts.get(emoji, 0) + delta
+                message.reaction_counts = {emoji: count for emoji, count in counts.items() if count > 0}
+            Message.objects.bulk_update(messages, ["reaction_counts"])
+            transaction.on_commit(lambda: replace_messages(messages))
+    except Exception:
+        with _lock:
+            _pending.update(pending)
+        raise
+    return len(messages)
+
+
+def reconcile_reaction_counts(message_ids: Iterable[int] | None = None, batch_size: int = 500) -> int:
+    """
+    Recompute `Message.reaction_counts` from the `Reaction` rows of the given
+    messages (all messages with reactions or counts when `None`) and fix the
+    ones that drifted. Returns the number of messages updated.
+
+    Deltas still buffered in other processes are applied on top of the
+    recomputed counts, so run this when reactions are quiet (e.g. nightly).
+    """
+
+    flush_reaction_counts()
+
+    if message_ids is None:
+        candidates = set(Reaction.objects.order_by().values_list("message_id", flat=True).distinct())
+        candidates.update(Message.objects.exclude(reaction_counts={}).values_list("id", flat=True))
+    else:
+        candidates = set(message_ids)
+    candidates = sorted(candidates)
+
+    updated = 0
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start : start + batch_size]
+        with transaction.atomic():
+            messages = list(
+                Message.objects.select_for_update(of=("self",))
+                .select_related("author", "deleted_by", "moderated_by")
+                .prefetch_related("attachments")
+                .filter(pk__in=batch)
+            )
+            actual: dict[int, dict[str, int]] = {}
+            for message_id, emoji, count in (
+                Reaction.objects.filter(message_id__in=batch)
+                .order_by()
+                .values("message_id", "emoji")
+                .annotate(count=Count("id"))
+                .values_list("message_id", "emoji", "count")
+            ):
+                actual.setdefault(message_id, {})[emoji] = count
+            drifted = [message for message in messages if (message.reaction_counts or {}) != actual.get(message.pk, {})]
+            for message in drifted:
+                message.reaction_counts = actual.get(message.pk, {})
+            if drifted:
+                Message.objects.bulk_update(drifted, ["reaction_counts"])
+                transaction.on_commit(lambda drifted=drifted: replace_messages(drifted))
+        updated += len(drifted)
+    return updated
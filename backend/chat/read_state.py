@@ -0,0 +1,138 @@
+"""
+Per-(user, group) read markers and unread counts.
+
+WebSocket `mark_read` frames only touch an in-process buffer that keeps the
+highest message id per (user, group). The buffer is flushed to `ReadMarker`
+rows on a short timer with two queries (newest message per group, then one
+upsert), however many clients are acknowledging messages.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from groups.models import Group
+
+from .models import Message, ReadMarker
+
+FLUSH_INTERVAL_SECONDS = getattr(settings, "CHAT_READ_MARKER_FLUSH_SECONDS", 2.0)
+
+_lock = threading.Lock()
+_pending: dict[tuple[int, str], int] = {}
+_flush_task: asyncio.Task | None = None
+
+
+def mark_read(user_id: int, group_id: str, message_id: int) -> None:
+    """Record that the user has read the group up to `message_id` (buffered)."""
+
+    key = (user_id, str(group_id))
+    with _lock:
+        if message_id > _pending.get(key, 0):
+            _pending[key] = message_id
+
+
+async def schedule_flush() -> None:
+    """Ensure a flush runs within `FLUSH_INTERVAL_SECONDS` on this event loop."""
+
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.ensure_future(_flush_later())
+
+
+async def _flush_later() -> None:
+    await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+    await database_sync_to_async(flush_read_markers)()
+
+
+def flush_read_markers() -> int:
+    """
+    Persist buffered marks with one upsert that keeps the higher of the
+    stored and buffered ids, so concurrent flushes from other processes can
+    never move a marker backwards. Marks past a group's newest message are
+    clamped to it. Entries leave the buffer only once written.
+    """
+
+    with _lock:
+        pending = dict(_pending)
+    if not pending:
+        return 0
+
+    newest = dict(
+        Message.objects.filter(group_id__in={group_id for _, group_id in pending})
+        .order_by()
+        .values("group_id")
+        .annotate(newest=Max("id"))
+        .values_list("group_id", "newest")
+    )
+    rows = [
+        (user_id, group_id, min(message_id, newest[group_id]))
+        for (user_id, group_id), message_id in pending.items()
+        if group_id in newest
+    ]
+    if rows:
+        _upsert_markers(rows)
+
+    with _lock:
+        for key, message_id in pending.items():
+            if _pending.get(key) == message_id:
+                del _pending[key]
+    return len(rows)
+
+
+def _upsert_markers(rows: list[tuple[int, str, int]]) -> None:
+    # `bulk_create(update_conflicts=True)` can only copy the incoming value;
+    # keeping the higher id needs GREATEST (MAX on SQLite) in the update.
+    greatest = "MAX" if connection.vendor == "sqlite" else "GREATEST"
+    table = connection.ops.quote_name(ReadMarker._meta.db_table)
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+    now = timezone.now()
+    params = [value for row in rows for value in (*row, now)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, group_id, last_read_message_id, updated_at) VALUES {values} "
+            "ON CONFLICT (user_id, group_id) DO UPDATE SET "
+            f"updated_at = CASE WHEN excluded.last_read_message_id > {table}.last_read_message_id "
+            f"THEN excluded.updated_at ELSE {table}.updated_at END, "
+            f"last_read_message_id = {greatest}({table}.last_read_message_id, excluded.last_read_message_id)",
+            params,
+        )
+
+
+def unread_counts_for_user(user):
+    """
+    Return the caller's groups annotated with `unread` and `last_read_id`,
+    computed in a single query.
+    """
+
+    last_read = ReadMarker.objects.filter(user=user, group=OuterRef("group_id")).values(
+        "last_read_message_id"
+    )[:1]
+    unread = (
+        Message.objects.filter(
+            group=OuterRef("pk"), is_deleted=False, moderation_status=Message.ModerationStatus.APPROVED
+        )
+        .exclude(author=user)
+        .filter(id__gt=Coalesce(Subquery(last_read), Value(0)))
+        .order_by()
+        .values("group")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    own_marker = ReadMarker.objects.filter(user=user, group=OuterRef("pk")).values("last_read_message_id")[:1]
+    return (
+        Group.objects.filter(Q(members__user=user) | Q(mentor=user))
+        .distinct()
+        .annotate(
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+            last_read_id=Coalesce(Subquery(own_marker), Value(0)),
+        )
+        .values("id", "unread", "last_read_id")
+    )
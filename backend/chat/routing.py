@@ -2,9 +2,11 @@
 
 from django.urls import path
 
-from .consumers import GroupChatConsumer
+from .consumers import FirehoseChatConsumer, GroupChatConsumer, MultiplexChatConsumer
 
 
 websocket_urlpatterns = [
+    path("ws/chat/", MultiplexChatConsumer.as_asgi(), name="chat-multiplex"),
+    path("ws/chat/firehose/", FirehoseChatConsumer.as_asgi(), name="chat-firehose"),
     path("ws/chat/groups/<str:group_id>/", GroupChatConsumer.as_asgi(), name="group-chat"),
 ]
@@ -0,0 +1,97 @@
+"""
+Full-text search over chat history.
+
+On PostgreSQL `chat_message` carries a `search_vector` tsvector column with a
+GIN index, kept current by a trigger on insert and on updates of `text`. On
+SQLite (the test settings) an external-content FTS5 table,
+`chat_message_fts`, is kept in sync by triggers instead. Neither is part of
+the model, so the ORM never reads or writes them; search predicates and
+snippets are emitted as raw SQL for the active backend.
+
+The column, table, index and triggers are created by migration 0005. SQLite
+drops a table's triggers whenever Django rebuilds it, so migrations that
+alter `Message` re-create the FTS5 triggers afterwards (0008, 0009).
+"""
+
+from __future__ import annotations
+
+import html
+
+from django.db import connection
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+SEARCH_CONFIG = "pg_catalog.english"
+MAX_QUERY_LENGTH = 200
+
+# Control characters mark matches in raw snippets; the text around them is
+# escaped before they are swapped for <mark> tags.
+_START, _STOP = "\x02", "\x03"
+
+
+def normalize_query(query: str | None) -> str:
+    return " ".join((query or "").split())[:MAX_QUERY_LENGTH]
+
+
+def filter_matching(queryset: QuerySet[Message], query: str) -> QuerySet[Message]:
+    """Restrict `queryset` to messages whose text matches `query`."""
+
+    if connection.vendor == "postgresql":
+        match = RawSQL(
+            f'"chat_message"."search_vector" @@ websearch_to_tsquery(\'{SEARCH_CONFIG}\', %s)',
+            [query],
+            output_field=BooleanField(),
+        )
+        return queryset.filter(match)
+
+    return queryset.filter(
+        pk__in=RawSQL(
+            "SELECT rowid FROM chat_message_fts WHERE chat_message_fts MATCH %s",
+            [_fts5_query(query)],
+        )
+    )
+
+
+def highlight_snippets(message_ids: list[int], query: str) -> dict[int, str]:
+    """
+    Return an HTML-escaped excerpt per message with matched terms wrapped in
+    `<mark>`. Only called for the rows of a single page.
+    """
+
+    if not message_ids:
+        return {}
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"SELECT id, ts_headline('{SEARCH_CONFIG}', text, websearch_to_tsquery('{SEARCH_CONFIG}', %s), %s) "
+                "FROM chat_message WHERE id = ANY(%s)",
+                [
+                    query,
+                    f'StartSel="{_START}", StopSel="{_STOP}", MaxWords=30, MinWords=10, '
+                    'MaxFragments=2, FragmentDelimiter=" … "',
+                    list(message_ids),
+                ],
+            )
+        else:
+            placeholders = ", ".join(["%s"] * len(message_ids))
+            cursor.execute(
+                "SELECT rowid, snippet(chat_message_fts, 0, %s, %s, '…', 24) FROM chat_message_fts "
+                f"WHERE chat_message_fts MATCH %s AND rowid IN ({placeholders})",
+                [_START, _STOP, _fts5_query(query), *message_ids],
+            )
+        rows = cursor.fetchall()
+
+    return {message_id: _render_snippet(raw or "") for message_id, raw in rows}
+
+
+def _fts5_query(query: str) -> str:
+    # Quote every term so user input is never parsed as FTS5 syntax; quoted
+    # terms are ANDed, matching websearch_to_tsquery for plain input.
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _render_snippet(raw: str) -> str:
+    return html.escape(raw, quote=False).replace(_START, "<mark>").replace(_STOP, "</mark>")
@@ -5,7 +5,8 @@ from rest_framework import serializers
 from users.models import User
 
 from .models import Message, MessageAttachment
-from .permissions import user_can_moderate_group_chat
+from .pagination import MessageCursor
+from .permissions import ChatViewer, resolve_chat_viewer
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -38,12 +39,17 @@ class MessageAttachmentSerializer(serializers.ModelSerializer):
 class MessageSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     attachments = serializers.SerializerMethodField()
+    reactions = serializers.JSONField(source="reaction_counts", read_only=True)
+    parentId = serializers.IntegerField(source="parent_id", read_only=True)
+    replyCount = serializers.IntegerField(source="reply_count", read_only=True)
+    lastReplyAt = serializers.DateTimeField(source="last_reply_at", read_only=True)
     timestamp = serializers.DateTimeField(source="created_at", read_only=True)
     text = serializers.SerializerMethodField()
     isDeleted = serializers.SerializerMethodField()
     deletedAt = serializers.DateTimeField(source="deleted_at", read_only=True)
     deletedBy = serializers.IntegerField(source="deleted_by_id", read_only=True)
     moderation = serializers.SerializerMethodField()
+    cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -53,10 +59,15 @@ class MessageSerializer(serializers.ModelSerializer):
             "text",
             "timestamp",
             "attachments",
+            "reactions",
+            "parentId",
+            "replyCount",
+            "lastReplyAt",
             "isDeleted",
             "deletedAt",
             "deletedBy",
             "moderation",
+            "cursor",
         ]
 
     def get_text(self, obj: Message) -> str:
@@ -67,23 +78,25 @@ class MessageSerializer(serializers.ModelSerializer):
     def get_attachments(self, obj: Message) -> list[dict]:
         if not self._can_view_content(obj):
             return []
-        return MessageAttachmentSerializer(obj.attachments.all(), many=True).data
+        # `create_message` hands over the rows it inserted as a plain list, the
+        # way `Prefetch(..., to_attr=...)` would, so they are not read back.
+        attachments = getattr(obj, "attachment_list", None)
+        if attachments is None:
+            attachments = obj.attachments.all()
+        return MessageAttachmentSerializer(attachments, many=True).data
 
     def get_isDeleted(self, obj: Message) -> bool:
-        return obj.is_deleted or obj.moderation_status == Message.ModerationStatus.REJECTED
+        if obj.is_deleted or obj.moderation_status == Message.ModerationStatus.REJECTED:
+            return True
+        # Held messages are hidden from everyone but their author and moderators.
+        return obj.moderation_status == Message.ModerationStatus.PENDING and not self._is_moderator_or_author(obj)
 
     def get_moderation(self, obj: Message) -> dict | None:
         data = {
             "status": obj.moderation_status,
         }
 
-        user = self._context_user
-        include_sensitive = False
-        if user is not None:
-            if user_can_moderate_group_chat(user, obj.group) or obj.author_id == getattr(user, "id", None):
-                include_sensitive = True
-
-        if include_sensitive and obj.moderation_note:
+        if obj.moderation_note and self._is_moderator_or_author(obj):
             data["note"] = obj.moderation_note
         if obj.moderated_at:
             data["moderatedAt"] = obj.moderated_at
@@ -91,6 +104,9 @@ class MessageSerializer(serializers.ModelSerializer):
             data["moderatedBy"] = obj.moderated_by_id
         return data
 
+    def get_cursor(self, obj: Message) -> str:
+        return MessageCursor.for_message(obj).encode()
+
     @property
     def _context_user(self):
         user = self.context.get("user")
@@ -101,11 +117,32 @@ class MessageSerializer(serializers.ModelSerializer):
             return getattr(request, "user", None)
         return None
 
-    def _can_view_content(self, obj: Message) -> bool:
-        if not obj.is_deleted and obj.moderation_status != Message.ModerationStatus.REJECTED:
-            return True
+    def _viewer_for(self, obj: Message) -> ChatViewer:
+        viewer = self.context.get("viewer")
+        if viewer is not None and viewer.applies_to(obj.group_id):
+            return viewer
 
+        # Callers that only supplied a user: resolve once per group and memoise
+        # on the (shared) serializer context.
         user = self._context_user
         if user is None:
-            return not (obj.is_deleted or obj.moderation_status == Message.ModerationStatus.REJECTED)
-        return user_can_moderate_group_chat(user, obj.group)
+            return ChatViewer()
+        resolved = self.context.setdefault("_resolved_viewers", {})
+        if obj.group_id not in resolved:
+            resolved[obj.group_id] = resolve_chat_viewer(user, obj.group)
+        return resolved[obj.group_id]
+
+    def _can_view_content(self, obj: Message) -> bool:
+        if obj.is_deleted or obj.moderation_status == Message.ModerationStatus.REJECTED:
+            return self._viewer_for(obj).can_moderate
+        return obj.moderation_status != Message.ModerationStatus.PENDING or self._is_moderator_or_author(obj)
+
+    def _is_moderator_or_author(self, obj: Message) -> bool:
+        viewer = self._viewer_for(obj)
+        return viewer.can_moderate or (viewer.user_id is not None and obj.author_id == viewer.user_id)
+
+
+class NormalizedMessageSerializer(MessageSerializer):
+    """`MessageSerializer` that references the author by id (`?format=normalized`)."""
+
+    author = serializers.IntegerField(source="author_id", read_only=True)
@@ -9,12 +9,31 @@ from channels.layers import get_channel_layer
 from django.db import transaction
 from rest_framework.exceptions import ValidationError
 
+from . import metrics
+from .acl import get_user_channel_name
+from .activity import record_new_message
+from .automod import find_blocked_terms
+from .cache import hold_message, push_message
+from .events import record_group_event
+from .fanout import FIREHOSE, FIREHOSE_CHANNEL, listening, publish_group_event
 from .models import Message, MessageAttachment
+from .moderation import notify_moderation_queue
+from .permissions import ChatViewer, resolve_chat_viewer
 from .serializers import MessageSerializer
+from .threads import record_reply, resolve_parent
 
 
-def create_message(group, author, text: str, attachments_payload: Iterable[dict] | None = None) -> Message:
-    """Create a message with optional attachments after validating payload."""
+def create_message(
+    group,
+    author,
+    text: str,
+    attachments_payload: Iterable[dict] | None = None,
+    parent_id=None,
+) -> Message:
+    """
+    Create a message with optional attachments after validating payload.
+    `parent_id` makes it a reply in that message's thread.
+    """
 
     normalized_text = (text or "").strip()
     attachments_payload = list(attachments_payload or [])
@@ -52,11 +71,23 @@ def create_message(group, author, text: str, attachments_payload: Iterable[dict]
             )
         )
 
+    parent = resolve_parent(group, parent_id, author)
+
+    # Pre-moderation: blocklisted messages are held for review.
+    blocked_terms = find_blocked_terms(normalized_text)
+
     with transaction.atomic():
+        # INSERT ... RETURNING fills in the id; every other field, the author
+        # and the group are already on the instance, so nothing is re-read.
         message = Message.objects.create(
             group=group,
             author=author,
+            parent=parent,
             text=normalized_text,
+            moderation_status=(
+                Message.ModerationStatus.PENDING if blocked_terms else Message.ModerationStatus.APPROVED
+            ),
+            moderation_note=f"Auto-held: matched {', '.join(blocked_terms)}" if blocked_terms else "",
         )
 
         if attachments_to_create:
@@ -64,32 +95,104 @@ def create_message(group, author, text: str, attachments_payload: Iterable[dict]
                 attachment.message = message
             MessageAttachment.objects.bulk_create(attachments_to_create)
 
-    return (
-        Message.objects.select_related("author", "deleted_by", "moderated_by")
-        .prefetch_related("attachments")
-        .get(pk=message.pk)
-    )
+        if not blocked_terms:
+            # Held messages are counted once released (`refresh_group_activity`, `sync_threads`).
+            record_new_message(message)
+            if parent is not None:
+                record_reply(message)
 
+    message.attachment_list = attachments_to_create
+    if blocked_terms:
+        transaction.on_commit(lambda: hold_message(message))
+        transaction.on_commit(notify_moderation_queue)
+    else:
+        transaction.on_commit(lambda: push_message(message))
+    return message
 
-def serialize_message(message: Message, for_user=None) -> dict:
-    serializer = MessageSerializer(message, context={"user": for_user})
-    return serializer.data
 
+def post_message(group, author, text: str, attachments_payload: Iterable[dict] | None = None, parent_id=None):
+    """
+    Fused send path shared by HTTP and WebSocket: validate and insert the
+    message, render its public payload once and stamp the `message.created`
+    event. Returns `(message, payload, event)` where `payload` is the
+    author's view; callers run it in a single sync call and hand `event` to
+    `send_group_event`.
+
+    Held messages get no group event (`event` is `None`): once committed they
+    are only delivered to their author's sockets and the moderation firehose.
+
+    `group` only needs a primary key, so sockets can pass the reference they
+    authorised at connect time.
+    """
+
+    message = create_message(group, author, text, attachments_payload, parent_id)
+    if message.moderation_status == Message.ModerationStatus.PENDING:
+        payload = serialize_message(message, viewer=ChatViewer(user_id=author.pk))
+        transaction.on_commit(lambda: send_held_message(message, payload))
+        return message, payload, None
+    payload = serialize_message(message)
+    return message, payload, build_group_event(group.pk, "message.created", payload)
+
+
+def send_held_message(message: Message, author_payload: dict) -> None:
+    """Deliver a held message to its author's sockets and, when watched, the firehose."""
 
-def broadcast_message_event(group_id: str, event_type: str, payload: dict) -> None:
     channel_layer = get_channel_layer()
     if channel_layer is None:
         return
-
+    group_id = str(message.group_id)
+    event = {"group_id": group_id, "event": "message.created", "seq": None}
     async_to_sync(channel_layer.group_send)(
-        get_group_channel_name(group_id),
-        {
-            "type": "chat.message",
-            "event": event_type,
-            "payload": payload,
-        },
+        get_user_channel_name(message.author_id), {**event, "type": "chat.held", "payload": author_payload}
     )
+    if listening(group_id)[1]:
+        async_to_sync(channel_layer.group_send)(
+            FIREHOSE_CHANNEL,
+            {
+                **event,
+                "type": "chat.firehose",
+                "stream": FIREHOSE,
+                "payload": serialize_message(message, viewer=ChatViewer(can_moderate=True)),
+            },
+        )
+
+
+def serialize_message(message: Message, for_user=None, *, viewer: ChatViewer | None = None) -> dict:
+    """
+    Render a message for `viewer`. Broadcasts pass neither argument and get
+    the public view, which needs no permission lookups at all.
+    """
 
+    if viewer is None:
+        viewer = resolve_chat_viewer(for_user, message.group) if for_user is not None else ChatViewer()
+    serializer = MessageSerializer(message, context={"viewer": viewer})
+    return serializer.data
+
+
+def build_group_event(group_id: str, event_type: str, payload: dict) -> dict:
+    """Stamp a chat event with its group sequence number for the channel layer."""
+
+    return {
+        "type": "chat.message",
+        "group_id": str(group_id),
+        "event": event_type,
+        "payload": payload,
+        "seq": record_group_event(group_id, event_type, payload),
+    }
+
+
+def broadcast_message_event(group_id: str, event_type: str, payload: dict) -> None:
+    send_group_event(group_id, build_group_event(group_id, event_type, payload))
+
+
+def send_group_event(group_id: str, event: dict) -> None:
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    listeners = listening(group_id)
+    if not any(listeners):
+        # No process has a socket on the group; the event log still has it.
+        metrics.increment("fanout.skipped_sends")
+        return
 
-def get_group_channel_name(group_id: str) -> str:
-    return f"group_chat_{group_id}"
+    async_to_sync(publish_group_event)(channel_layer, group_id, event, listeners=listeners)
@@ -0,0 +1,69 @@
+"""Keep the chat ACL index in sync with group membership changes."""
+
+from __future__ import annotations
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from groups.models import Group, GroupMember
+
+from .acl import grant_group_access, revoke_group_access
+
+
+@receiver(post_save, sender=GroupMember, dispatch_uid="chat_acl_member_saved")
+def member_saved(sender, instance: GroupMember, created: bool, **kwargs) -> None:
+    if created:
+        transaction.on_commit(lambda: grant_group_access(instance.user_id, instance.group_id))
+
+
+@receiver(post_delete, sender=GroupMember, dispatch_uid="chat_acl_member_deleted")
+def member_deleted(sender, instance: GroupMember, **kwargs) -> None:
+    user_id, group_id = instance.user_id, instance.group_id
+
+    def revoke() -> None:
+        # Mentors keep access through the group itself.
+        if not Group.objects.filter(pk=group_id, mentor_id=user_id).exists():
+            revoke_group_access(user_id, group_id)
+
+    transaction.on_commit(revoke)
+
+
+@receiver(pre_save, sender=Group, dispatch_uid="chat_acl_group_pre_save")
+def remember_previous_mentor(sender, instance: Group, **kwargs) -> None:
+    if instance._state.adding:
+        instance._previous_mentor_id = None
+        return
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not {"mentor", "mentor_id"} & set(update_fields):
+        instance._previous_mentor_id = instance.mentor_id
+        return
+    instance._previous_mentor_id = (
+        Group.objects.filter(pk=instance.pk).values_list("mentor_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Group, dispatch_uid="chat_acl_group_saved")
+def group_saved(sender, instance: Group, **kwargs) -> None:
+    previous_mentor_id = getattr(instance, "_previous_mentor_id", None)
+    mentor_id, group_id = instance.mentor_id, instance.pk
+    if previous_mentor_id == mentor_id:
+        return
+
+    def sync() -> None:
+        if mentor_id is not None:
+            grant_group_access(mentor_id, group_id)
+        if previous_mentor_id is not None and not GroupMember.objects.filter(
+            group_id=group_id, user_id=previous_mentor_id
+        ).exists():
+            revoke_group_access(previous_mentor_id, group_id)
+
+    transaction.on_commit(sync)
+
+
+@receiver(post_delete, sender=Group, dispatch_uid="chat_acl_group_deleted")
+def group_deleted(sender, instance: Group, **kwargs) -> None:
+    # Members are removed by the cascade (and revoked by `member_deleted`).
+    if instance.mentor_id is not None:
+        mentor_id, group_id = instance.mentor_id, instance.pk
+        transaction.on_commit(lambda: revoke_group_access(mentor_id, group_id))
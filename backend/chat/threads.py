@@ -0,0 +1,120 @@
+"""
+Threaded replies.
+
+A reply is a `Message` whose `parent` is a top-level message of the same
+group; threads are one level deep. The parent carries denormalised
+`reply_count` and `last_reply_at` columns so the main timeline, which only
+lists top-level messages, never has to look at replies. Sending a reply
+bumps the counters with a single conditional UPDATE inside the send
+transaction. Moderating replies recomputes them from visible replies (not
+deleted, not rejected) and announces the new values as `thread.updated`.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .cache import patch_messages
+from .models import Message
+from .permissions import user_can_moderate_group_chat
+
+# Renders timestamps exactly as `MessageSerializer` does.
+_DATETIME = serializers.DateTimeField()
+
+
+def resolve_parent(group, parent_id, author) -> Message | None:
+    """
+    Validate a `parentId` from a send request and return the parent message.
+    Held parents only accept replies from their author and moderators, the
+    users who can see them.
+    """
+
+    if parent_id in (None, ""):
+        return None
+    try:
+        parent_id = int(parent_id)
+    except (TypeError, ValueError) as exc:
+        raise ValidationError({"parentId": "parentId must be a message id."}) from exc
+
+    parent = (
+        Message.objects.filter(pk=parent_id, group=group)
+        .only("id", "group_id", "author_id", "parent_id", "is_deleted", "moderation_status")
+        .first()
+    )
+    if parent is None or parent.is_deleted or parent.moderation_status == Message.ModerationStatus.REJECTED:
+        raise ValidationError({"parentId": "Parent message not found."})
+    if (
+        parent.moderation_status == Message.ModerationStatus.PENDING
+        and parent.author_id != author.pk
+        # Sockets pass a bare group reference; the parent loads the real one.
+        and not user_can_moderate_group_chat(author, parent.group)
+    ):
+        raise ValidationError({"parentId": "Parent message not found."})
+    if parent.parent_id is not None:
+        raise ValidationError({"parentId": "Replies cannot be replied to; reply to the thread's first message."})
+    return parent
+
+
+def record_reply(reply: Message) -> None:
+    """Count a freshly created reply on its parent."""
+
+    newer = Q(last_reply_at__isnull=True) | Q(last_reply_at__lte=reply.created_at)
+    Message.objects.filter(pk=reply.parent_id).update(
+        reply_count=F("reply_count") + 1,
+        last_reply_at=Case(When(newer, then=Value(reply.created_at)), default=F("last_reply_at")),
+    )
+
+    def bump(payload: dict) -> None:
+        payload["replyCount"] = (payload.get("replyCount") or 0) + 1
+        payload["lastReplyAt"] = max(filter(None, [payload.get("lastReplyAt"), _isoformat(reply.created_at)]))
+
+    transaction.on_commit(lambda: patch_messages(reply.group_id, {reply.parent_id: bump}))
+
+
+def sync_threads(messages: Iterable[Message]) -> list[dict]:
+    """
+    Recompute the counters of the threads the given (moderated) messages
+    reply to, and return `thread.updated` entries for them.
+    """
+
+    messages = list(messages)
+    parent_ids = {message.parent_id for message in messages if message.parent_id is not None}
+    if not parent_ids:
+        return []
+
+    # Held replies stay out of the counters until they are approved.
+    visible = Message.objects.filter(
+        parent=OuterRef("pk"), is_deleted=False, moderation_status=Message.ModerationStatus.APPROVED
+    )
+    count = visible.order_by().values("parent").annotate(total=Count("id")).values("total")
+    Message.objects.filter(pk__in=parent_ids).update(
+        reply_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+        last_reply_at=Subquery(visible.order_by("-created_at", "-id").values("created_at")[:1]),
+    )
+
+    threads = [
+        {"messageId": row["id"], "replyCount": row["reply_count"], "lastReplyAt": _isoformat(row["last_reply_at"])}
+        for row in Message.objects.filter(pk__in=parent_ids).values("id", "reply_count", "last_reply_at")
+    ]
+    group_id = messages[0].group_id
+    patches = {thread["messageId"]: _setter(thread) for thread in threads}
+    transaction.on_commit(lambda: patch_messages(group_id, patches))
+    return threads
+
+
+def _setter(thread: dict):
+    def apply(payload: dict) -> None:
+        payload["replyCount"] = thread["replyCount"]
+        payload["lastReplyAt"] = thread["lastReplyAt"]
+
+    return apply
+
+
+def _isoformat(value) -> str | None:
+    return _DATETIME.to_representation(value) if value is not None else None
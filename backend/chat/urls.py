@@ -1,6 +1,12 @@
 from django.urls import path
 
-from .views import MessageViewSet
+from .views import (
+    MessageViewSet,
+    chat_metrics,
+    export_group_messages,
+    moderation_queue,
+    unread_counts,
+)
 
 app_name = "chat"
 
@@ -18,11 +24,52 @@ message_detail = MessageViewSet.as_view(
     }
 )
 
+message_reactions = MessageViewSet.as_view(
+    {
+        "post": "react",
+        "delete": "unreact",
+    }
+)
+
+message_thread = MessageViewSet.as_view({"get": "thread"})
+
+message_search = MessageViewSet.as_view({"get": "search"})
+
+message_bulk_moderation = MessageViewSet.as_view({"post": "bulk_moderate"})
+
 urlpatterns = [
+    path("chat/metrics", chat_metrics, name="chat-metrics"),
+    path("chat/unread", unread_counts, name="chat-unread"),
+    path("chat/moderation-queue", moderation_queue, name="chat-moderation-queue"),
     path("groups/<str:group_id>/messages", message_list, name="group-messages"),
+    path(
+        "groups/<str:group_id>/messages/search",
+        message_search,
+        name="group-message-search",
+    ),
+    path(
+        "groups/<str:group_id>/messages/export",
+        export_group_messages,
+        name="group-message-export",
+    ),
+    path(
+        "groups/<str:group_id>/messages/moderate",
+        message_bulk_moderation,
+        name="group-message-bulk-moderation",
+    ),
     path(
         "groups/<str:group_id>/messages/<int:pk>",
         message_detail,
         name="group-message-detail",
     ),
+    path(
+        "groups/<str:group_id>/messages/<int:pk>/thread",
+        message_thread,
+        name="group-message-thread",
+    ),
+    path(
+        "groups/<str:group_id>/messages/<int:pk>/reactions",
+        message_reactions,
+        name="group-message-reactions",
+    ),
 ]
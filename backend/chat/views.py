@@ -1,19 +1,44 @@
 from __future__ import annotations
 
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 from rest_framework import status, viewsets
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from core.permissions import IsPlatformAdmin
 from groups.models import Group
 
+from . import metrics
+from .activity import refresh_group_activity
+from .cache import get_recent_messages, replace_messages
+from .export import (
+    CSVRenderer,
+    NDJSONRenderer,
+    async_stream,
+    stream_attachment_manifest,
+    stream_csv,
+    stream_ndjson,
+    stream_zip,
+)
 from .models import Message
-from .permissions import user_can_moderate_group_chat, user_has_group_access
-from .serializers import MessageSerializer
-from .services import broadcast_message_event, create_message, serialize_message
+from .moderation import moderation_queue_page, notify_moderation_queue, pending_messages, visible_messages
+from .normalize import NORMALIZED, NormalizedJSONRenderer, compact_messages, users_map
+from .pagination import MessageCursor, paginate_messages
+from .permissions import CanModerateAllChats, ChatViewer, resolve_chat_viewer, user_has_group_access
+from .reactions import normalize_emoji, schedule_threaded_flush, set_reaction
+from .read_state import unread_counts_for_user
+from .search import filter_matching, highlight_snippets, normalize_query
+from .serializers import MessageSerializer, NormalizedMessageSerializer
+from .services import broadcast_message_event, post_message, send_group_event, serialize_message
+from .threads import sync_threads
 
 
 class MessageViewSet(viewsets.ViewSet):
@@ -22,51 +47,125 @@ class MessageViewSet(viewsets.ViewSet):
     """
 
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NormalizedJSONRenderer]
     max_page_size = 100
     default_page_size = 50
+    max_bulk_size = 500
+    bulk_actions = {
+        "approve": Message.ModerationStatus.APPROVED,
+        "reject": Message.ModerationStatus.REJECTED,
+        "pending": Message.ModerationStatus.PENDING,
+        "delete": None,
+        "restore": None,
+    }
 
     def list(self, request, group_id: str) -> Response:
         group = self._get_group_or_403(group_id, request.user)
-        queryset = (
-            Message.objects.filter(group=group)
-            .select_related("author", "deleted_by", "moderated_by")
-            .prefetch_related("attachments")
-            .order_by("-created_at", "-id")
+        viewer = resolve_chat_viewer(request.user, group)
+
+        before = _parse_cursor(request, "before")
+        after = _parse_cursor(request, "after")
+        if before is not None and after is not None:
+            raise ValidationError("Use either 'before' or 'after', not both.")
+
+        page_size = self._parse_page_size(request)
+        normalized = request.accepted_renderer.format == NORMALIZED
+
+        if before is None and after is None:
+            # The first page is served from the hot-tail cache when possible.
+            cached = get_recent_messages(
+                group,
+                limit=page_size,
+                viewer=viewer,
+            )
+            if cached is not None:
+                payloads, has_more = cached
+                users = None
+                if normalized:
+                    payloads, users = compact_messages(payloads)
+                return self._page_response(
+                    payloads,
+                    has_more,
+                    before_cursor=payloads[-1]["cursor"] if payloads else None,
+                    after_cursor=payloads[0]["cursor"] if payloads else None,
+                    users=users,
+                )
+
+        # Replies are loaded per thread; the timeline only lists top-level messages.
+        queryset = Message.objects.filter(group=group, parent__isnull=True)
+        return self._paginated_response(
+            queryset, viewer, page_size=page_size, before=before, after=after, normalized=normalized
         )
 
-        can_moderate = user_can_moderate_group_chat(request.user, group)
-        if not can_moderate:
-            queryset = queryset.filter(is_deleted=False).exclude(
-                moderation_status=Message.ModerationStatus.REJECTED
-            )
+    def thread(self, request, group_id: str, pk: str | None = None) -> Response:
+        """Cursor-paginated replies of one top-level message, loaded on demand."""
 
-        before_param = request.query_params.get("before")
-        if before_param:
-            before_dt = parse_datetime(before_param)
-            if before_dt is None:
-                raise ValidationError({"before": "Invalid datetime format."})
-            if timezone.is_naive(before_dt):
-                before_dt = timezone.make_aware(before_dt, timezone=timezone.utc)
-            queryset = queryset.filter(created_at__lt=before_dt)
+        group = self._get_group_or_403(group_id, request.user)
+        viewer = resolve_chat_viewer(request.user, group)
+        # Hidden parents 404 for members, as they do in lists and search.
+        parent = self._get_message_or_404(group, pk, viewer)
+        if parent.parent_id is not None:
+            raise ValidationError({"id": "Threads are opened from their top-level message."})
+
+        before = _parse_cursor(request, "before")
+        after = _parse_cursor(request, "after")
+        if before is not None and after is not None:
+            raise ValidationError("Use either 'before' or 'after', not both.")
+        normalized = request.accepted_renderer.format == NORMALIZED
+
+        response = self._paginated_response(
+            Message.objects.filter(parent=parent),
+            viewer,
+            page_size=self._parse_page_size(request),
+            before=before,
+            after=after,
+            normalized=normalized,
+        )
+        serializer_class = NormalizedMessageSerializer if normalized else MessageSerializer
+        response.data["parent"] = serializer_class(parent, context={"viewer": viewer}).data
+        if normalized:
+            response.data["users"].update(users_map([parent.author]))
+        return response
+
+    def search(self, request, group_id: str) -> Response:
+        """
+        Full-text search within a group, newest matches first. Pages are keyed
+        by the `before` cursor and each message carries a highlighted
+        `snippet`. Hidden messages only match for moderators.
+        """
 
-        limit = request.query_params.get("limit")
-        try:
-            page_size = int(limit) if limit is not None else self.default_page_size
-        except (TypeError, ValueError):
-            raise ValidationError({"limit": "Limit must be an integer."})
-        page_size = max(1, min(page_size, self.max_page_size))
+        group = self._get_group_or_403(group_id, request.user)
+        viewer = resolve_chat_viewer(request.user, group)
 
-        messages = list(queryset[: page_size + 1])
-        has_more = len(messages) > page_size
-        messages = messages[:page_size]
+        query = normalize_query(request.query_params.get("q"))
+        if not query:
+            raise ValidationError({"q": "Search query is required."})
+        before = _parse_cursor(request, "before")
+        page_size = self._parse_page_size(request)
 
-        serializer = MessageSerializer(messages, many=True, context={"user": request.user})
-        return Response(
-            {
-                "messages": serializer.data,
-                "hasMore": has_more,
-            },
-            status=status.HTTP_200_OK,
+        queryset = visible_messages(
+            Message.objects.filter(group=group)
+            .select_related("author", "deleted_by", "moderated_by")
+            .prefetch_related("attachments"),
+            viewer,
+        )
+
+        messages, has_more = paginate_messages(
+            filter_matching(queryset, query),
+            page_size=page_size,
+            before=before,
+        )
+
+        snippets = highlight_snippets([message.pk for message in messages], query)
+        payloads = MessageSerializer(messages, many=True, context={"viewer": viewer}).data
+        for payload in payloads:
+            payload["snippet"] = snippets.get(payload["id"], "")
+
+        return self._page_response(
+            payloads,
+            has_more,
+            before_cursor=MessageCursor.for_message(messages[-1]).encode() if messages else None,
+            after_cursor=None,
         )
 
     def create(self, request, group_id: str) -> Response:
@@ -74,30 +173,27 @@ class MessageViewSet(viewsets.ViewSet):
 
         text = request.data.get("text", "")
         attachments_payload = request.data.get("attachments") or []
+        parent_id = request.data.get("parentId")
 
-        message = create_message(group, request.user, text, attachments_payload)
+        _, payload, event = post_message(group, request.user, text, attachments_payload, parent_id)
+        if event is not None:
+            send_group_event(str(group.pk), event)
 
-        response_serializer = MessageSerializer(message, context={"user": request.user})
-
-        broadcast_message_event(
-            str(group.pk),
-            "message.created",
-            serialize_message(message, for_user=None),
-        )
-
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(payload, status=status.HTTP_201_CREATED)
 
     def partial_update(self, request, group_id: str, pk: str | None = None) -> Response:
         group = self._get_group_or_403(group_id, request.user)
         message = self._get_message_or_404(group, pk)
 
-        if not user_can_moderate_group_chat(request.user, group):
+        viewer = resolve_chat_viewer(request.user, group)
+        if not viewer.can_moderate:
             raise PermissionDenied("You do not have permission to moderate messages.")
 
         moderation_status = request.data.get("moderationStatus")
         moderation_note = request.data.get("moderationNote")
         restore_flag = request.data.get("restore")
 
+        was_held = message.moderation_status == Message.ModerationStatus.PENDING
         updates: list[str] = []
 
         if moderation_status is not None:
@@ -123,13 +219,18 @@ class MessageViewSet(viewsets.ViewSet):
 
         message.save(update_fields=list(set(updates)))
         message.refresh_from_db()
+        refresh_group_activity([group.pk])
+        threads = sync_threads([message])
+        transaction.on_commit(lambda: replace_messages([message]))
+        transaction.on_commit(notify_moderation_queue)
 
-        response_serializer = MessageSerializer(message, context={"user": request.user})
+        response_serializer = MessageSerializer(message, context={"viewer": viewer})
         broadcast_message_event(
             str(group.pk),
-            "message.updated",
+            "message.created" if was_held and _is_released(message) else "message.updated",
             serialize_message(message, for_user=None),
         )
+        self._broadcast_threads(group, threads)
 
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
@@ -137,7 +238,8 @@ class MessageViewSet(viewsets.ViewSet):
         group = self._get_group_or_403(group_id, request.user)
         message = self._get_message_or_404(group, pk)
 
-        if not user_can_moderate_group_chat(request.user, group):
+        viewer = resolve_chat_viewer(request.user, group)
+        if not viewer.can_moderate:
             raise PermissionDenied("You do not have permission to delete messages.")
 
         if not message.is_deleted:
@@ -145,29 +247,328 @@ class MessageViewSet(viewsets.ViewSet):
             message.deleted_at = timezone.now()
             message.deleted_by = request.user
             message.save(update_fields=["is_deleted", "deleted_at", "deleted_by"])
+            refresh_group_activity([group.pk])
+            threads = sync_threads([message])
+        else:
+            threads = []
 
         message.refresh_from_db()
+        transaction.on_commit(lambda: replace_messages([message]))
+        transaction.on_commit(notify_moderation_queue)
 
-        serializer = MessageSerializer(message, context={"user": request.user})
+        serializer = MessageSerializer(message, context={"viewer": viewer})
         broadcast_message_event(
             str(group.pk),
             "message.deleted",
             serialize_message(message, for_user=None),
         )
+        self._broadcast_threads(group, threads)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def react(self, request, group_id: str, pk: str | None = None) -> Response:
+        return self._set_reaction(request, group_id, pk, add=True)
+
+    def unreact(self, request, group_id: str, pk: str | None = None) -> Response:
+        return self._set_reaction(request, group_id, pk, add=False)
+
+    def _set_reaction(self, request, group_id: str, pk: str | None, *, add: bool) -> Response:
+        group = self._get_group_or_403(group_id, request.user)
+        emoji = normalize_emoji(request.data.get("emoji") or request.query_params.get("emoji"))
+
+        event = set_reaction(group.pk, pk, request.user, emoji, add=add)
+        # Counts are applied in batches: the committed delta waits in the
+        # buffer for the next timed flush of this process.
+        transaction.on_commit(schedule_threaded_flush)
+        if event is not None:
+            send_group_event(str(group.pk), event)
+
+        data = {"messageId": int(pk), "emoji": emoji, "reacted": add}
+        created = add and event is not None
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def bulk_moderate(self, request, group_id: str) -> Response:
+        """
+        Apply one moderation action to many messages of a group with a single
+        `bulk_update`, then broadcast the whole batch as one `messages.updated`
+        event. Held messages the action releases are new to members and go out
+        as one `messages.created` event instead.
+        """
+
+        group = self._get_group_or_403(group_id, request.user)
+        viewer = resolve_chat_viewer(request.user, group)
+        if not viewer.can_moderate:
+            raise PermissionDenied("You do not have permission to moderate messages.")
+
+        action = request.data.get("action")
+        if action not in self.bulk_actions:
+            raise ValidationError({"action": f"Action must be one of: {', '.join(self.bulk_actions)}."})
+        ids = self._parse_bulk_ids(request.data.get("ids"))
+        moderation_note = request.data.get("moderationNote")
+
+        now = timezone.now()
+        with transaction.atomic():
+            messages = list(
+                Message.objects.select_for_update(of=("self",))
+                .filter(group=group, pk__in=ids)
+                .select_related("author", "deleted_by", "moderated_by")
+                .order_by("created_at", "id")
+            )
+            held = {message.pk for message in messages if message.moderation_status == Message.ModerationStatus.PENDING}
+            fields: set[str] = set()
+            for message in messages:
+                if action == "delete":
+                    if not message.is_deleted:
+                        message.is_deleted = True
+                        message.deleted_at = now
+                        message.deleted_by = request.user
+                    fields.update({"is_deleted", "deleted_at", "deleted_by"})
+                elif action == "restore":
+                    message.is_deleted = False
+                    message.deleted_at = None
+                    message.deleted_by = None
+                    fields.update({"is_deleted", "deleted_at", "deleted_by"})
+                else:
+                    message.moderation_status = self.bulk_actions[action]
+                    message.moderated_at = now
+                    message.moderated_by = request.user
+                    fields.update({"moderation_status", "moderated_at", "moderated_by"})
+                if moderation_note is not None:
+                    message.moderation_note = str(moderation_note or "").strip()
+                    fields.add("moderation_note")
+            if messages:
+                Message.objects.bulk_update(messages, sorted(fields))
+                refresh_group_activity([group.pk])
+            threads = sync_threads(messages)
+            prefetch_related_objects(messages, "attachments")
+            transaction.on_commit(lambda: replace_messages(messages))
+            transaction.on_commit(notify_moderation_queue)
+
+        released = [message for message in messages if message.pk in held and _is_released(message)]
+        updated = [message for message in messages if message not in released]
+        if released:
+            # Members never received held messages; they arrive as new ones.
+            broadcast_message_event(
+                str(group.pk),
+                "messages.created",
+                {"messages": [serialize_message(message) for message in released]},
+            )
+        if updated:
+            broadcast_message_event(
+                str(group.pk),
+                "messages.updated",
+                {"messages": [serialize_message(message) for message in updated]},
+            )
+        self._broadcast_threads(group, threads)
+
+        found = {message.pk for message in messages}
+        return Response(
+            {
+                "messages": MessageSerializer(messages, many=True, context={"viewer": viewer}).data,
+                "missing": [message_id for message_id in ids if message_id not in found],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def _broadcast_threads(self, group: Group, threads: list[dict]) -> None:
+        if threads:
+            broadcast_message_event(str(group.pk), "thread.updated", {"threads": threads})
+
+    def _parse_bulk_ids(self, raw) -> list[int]:
+        if not isinstance(raw, list) or not raw:
+            raise ValidationError({"ids": "Provide a non-empty list of message ids."})
+        if len(raw) > self.max_bulk_size:
+            raise ValidationError({"ids": f"At most {self.max_bulk_size} messages per request."})
+        try:
+            return list(dict.fromkeys(int(value) for value in raw))
+        except (TypeError, ValueError):
+            raise ValidationError({"ids": "Message ids must be integers."})
+
+    def _paginated_response(self, queryset, viewer: ChatViewer, *, page_size, before, after, normalized) -> Response:
+        queryset = visible_messages(
+            queryset.select_related("author", "deleted_by", "moderated_by").prefetch_related("attachments"),
+            viewer,
+        )
+
+        messages, has_more = paginate_messages(
+            queryset,
+            page_size=page_size,
+            before=before,
+            after=after,
+        )
+
+        serializer_class = NormalizedMessageSerializer if normalized else MessageSerializer
+        serializer = serializer_class(messages, many=True, context={"viewer": viewer})
+        return self._page_response(
+            serializer.data,
+            has_more,
+            before_cursor=MessageCursor.for_message(messages[-1]).encode() if messages else None,
+            after_cursor=MessageCursor.for_message(messages[0]).encode() if messages else None,
+            users=users_map(message.author for message in messages) if normalized else None,
+        )
+
+    def _page_response(self, messages, has_more: bool, *, before_cursor, after_cursor, users=None) -> Response:
+        data = {
+            "messages": messages,
+            "hasMore": has_more,
+            "cursors": {
+                "before": before_cursor,
+                "after": after_cursor,
+            },
+        }
+        if users is not None:
+            data["users"] = users
+        return Response(data, status=status.HTTP_200_OK)
+
+    def _parse_page_size(self, request) -> int:
+        return _parse_page_size(request, default=self.default_page_size, maximum=self.max_page_size)
+
     def _get_group_or_403(self, group_id: str, user) -> Group:
         group = get_object_or_404(Group.objects.select_related("mentor"), pk=group_id)
         if not user_has_group_access(user, group):
             raise PermissionDenied("You do not have access to this group.")
         return group
 
-    def _get_message_or_404(self, group: Group, pk: str | None) -> Message:
+    def _get_message_or_404(self, group: Group, pk: str | None, viewer: ChatViewer | None = None) -> Message:
+        """Look up a message of the group; with a `viewer`, only among the messages they may list."""
+
         if pk is None:
             raise ValidationError({"id": "Message id is required."})
-        return get_object_or_404(
-            Message.objects.select_related("author", "deleted_by", "moderated_by").prefetch_related("attachments"),
-            pk=pk,
-            group=group,
+        queryset = Message.objects.select_related("author", "deleted_by", "moderated_by").prefetch_related(
+            "attachments"
         )
+        if viewer is not None:
+            queryset = visible_messages(queryset, viewer)
+        return get_object_or_404(queryset, pk=pk, group=group)
+
+
+@api_view(["GET"])
+@permission_classes([IsPlatformAdmin])
+def chat_metrics(request) -> Response:
+    """
+    Report WebSocket send-queue depth and drop counters for this process.
+    """
+
+    return Response(metrics.snapshot(), status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsPlatformAdmin])
+@renderer_classes([NDJSONRenderer, CSVRenderer])
+def export_group_messages(request, group_id: str) -> StreamingHttpResponse:
+    """
+    Stream a group's full chat history, moderation metadata and attachments
+    included, as NDJSON (default) or CSV (`?format=csv`). `?manifest=1` wraps
+    the transcript and a CSV attachment manifest in a ZIP archive.
+    """
+
+    group = get_object_or_404(Group, pk=group_id)
+    file_format = request.accepted_renderer.format
+    stream = stream_csv(group) if file_format == "csv" else stream_ndjson(group)
+    basename = f"chat-{group.pk}-{timezone.now().strftime('%Y%m%d-%H%M%S')}"
+
+    if request.query_params.get("manifest") in {"1", "true", "zip"}:
+        response = StreamingHttpResponse(
+            _streaming_body(
+                request,
+                stream_zip(
+                    [
+                        (f"messages.{file_format}", stream),
+                        ("attachments.csv", stream_attachment_manifest(group)),
+                    ]
+                ),
+            ),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{basename}.zip"'
+        return response
+
+    response = StreamingHttpResponse(
+        _streaming_body(request, stream), content_type=request.accepted_renderer.media_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="{basename}.{file_format}"'
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([CanModerateAllChats])
+def moderation_queue(request) -> Response:
+    """
+    Page through pending messages across all groups, oldest first, using the
+    `after` cursor of the previous page.
+    """
+
+    after = _parse_cursor(request, "after")
+    page_size = _parse_page_size(
+        request,
+        default=MessageViewSet.default_page_size,
+        maximum=MessageViewSet.max_page_size,
+    )
+    messages, has_more = moderation_queue_page(page_size=page_size, after=after)
+
+    viewer = ChatViewer(user_id=request.user.pk, can_moderate=True)
+    payloads = MessageSerializer(messages, many=True, context={"viewer": viewer}).data
+    for message, payload in zip(messages, payloads):
+        payload["groupId"] = message.group_id
+
+    data = {
+        "messages": payloads,
+        "hasMore": has_more,
+        "cursors": {"after": MessageCursor.for_message(messages[-1]).encode() if messages else None},
+    }
+    if after is None:
+        # Later pages rely on the `moderation.queue` pushes for the count.
+        data["pendingCount"] = pending_messages().count()
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def unread_counts(request) -> Response:
+    """
+    Return unread message counts for every group the caller belongs to or
+    mentors, computed in one aggregated query.
+    """
+
+    rows = unread_counts_for_user(request.user)
+    return Response(
+        {
+            "groups": [
+                {
+                    "groupId": row["id"],
+                    "unread": row["unread"],
+                    "lastReadMessageId": row["last_read_id"],
+                }
+                for row in rows
+            ]
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+def _streaming_body(request, chunks):
+    # Under ASGI a sync iterator would be buffered in full before sending.
+    return async_stream(chunks) if isinstance(request._request, ASGIRequest) else chunks
+
+
+def _is_released(message: Message) -> bool:
+    return message.moderation_status == Message.ModerationStatus.APPROVED and not message.is_deleted
+
+
+def _parse_page_size(request, *, default: int, maximum: int) -> int:
+    limit = request.query_params.get("limit")
+    try:
+        page_size = int(limit) if limit is not None else default
+    except (TypeError, ValueError):
+        raise ValidationError({"limit": "Limit must be an integer."})
+    return max(1, min(page_size, maximum))
+
+
+def _parse_cursor(request, param: str) -> MessageCursor | None:
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        return MessageCursor.decode(value)
+    except ValueError:
+        raise ValidationError({param: "Invalid cursor."})
@@ -0,0 +1,192 @@
+"""
+Wire formats for chat WebSockets.
+
+JSON text frames are the default. Clients that offer the `msgpack`
+subprotocol at connect get binary MessagePack frames instead: known field
+names are shortened (`KEYS`) and timestamps are sent as MessagePack
+timestamps rather than ISO strings. Frames from the client keep their full
+field names in either format.
+
+Live group events are wrapped in a `SharedFrame` when every local socket
+would send the same bytes, so a broadcast is encoded once per process and
+format instead of once per recipient.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any
+
+import msgpack
+
+from . import metrics
+
+MSGPACK = "msgpack"
+
+# Outbound field name -> MessagePack key.
+KEYS = {
+    "type": "t",
+    "groupId": "g",
+    "payload": "p",
+    "seq": "s",
+    "users": "u",
+    "coalesced": "c",
+    "messages": "ms",
+    "id": "i",
+    "author": "a",
+    "name": "n",
+    "text": "x",
+    "timestamp": "ts",
+    "attachments": "at",
+    "file_url": "fu",
+    "filename": "fn",
+    "file_size": "fs",
+    "mime_type": "mt",
+    "reactions": "r",
+    "parentId": "pi",
+    "replyCount": "rc",
+    "lastReplyAt": "lr",
+    "isDeleted": "d",
+    "deletedAt": "da",
+    "deletedBy": "db",
+    "moderation": "m",
+    "status": "st",
+    "note": "no",
+    "moderatedAt": "ma",
+    "moderatedBy": "mb",
+    "cursor": "cu",
+    "messageId": "mi",
+    "userId": "ui",
+    "emoji": "e",
+    "delta": "dl",
+    "threads": "th",
+    "online": "o",
+}
+TIMESTAMP_FIELDS = {"timestamp", "lastReplyAt", "deletedAt", "moderatedAt"}
+
+_SHARED_FRAMES = "_shared_frames"
+
+
+class SharedFrame(dict):
+    """A frame sent unchanged to several sockets; encoded at most once per format."""
+
+    __slots__ = ("encoded",)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.encoded: dict[str, str | bytes] = {}
+
+
+def shared_frame(event: dict[str, Any], frame: dict[str, Any]) -> SharedFrame:
+    """
+    Return the `SharedFrame` another local socket already built from the same
+    hub event with the same fields, or register `frame` as that frame.
+    Callers must only share frames whose values depend on the event alone.
+    """
+
+    frames = event.setdefault(_SHARED_FRAMES, {})
+    shape = tuple(frame)
+    shared = frames.get(shape)
+    if shared is None:
+        shared = frames[shape] = SharedFrame(frame)
+    return shared
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+
+    def dumps(self, content: Any) -> str:
+        return json.dumps(content)
+
+    def loads(self, data: str | bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    name = MSGPACK
+    binary = True
+
+    def dumps(self, content: Any) -> bytes:
+        return msgpack.packb(_compact(content), datetime=True)
+
+    def loads(self, data: str | bytes) -> Any:
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ValueError("Invalid MessagePack frame.") from exc
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec()
+
+
+def encode(codec: JsonCodec | MsgpackCodec, frame: Any) -> str | bytes:
+    if not isinstance(frame, SharedFrame):
+        return codec.dumps(frame)
+    data = frame.encoded.get(codec.name)
+    if data is None:
+        data = frame.encoded[codec.name] = codec.dumps(frame)
+        metrics.increment("wire.encoded")
+    else:
+        metrics.increment("wire.reused")
+    return data
+
+
+class WireFormatMixin:
+    """
+    Consumer side: negotiates the format at connect and routes `send_json`
+    and incoming frames through its codec.
+    """
+
+    codec: JsonCodec | MsgpackCodec = JSON_CODEC
+
+    def select_subprotocol(self) -> str | None:
+        """Pick the wire format from the offered subprotocols; pass the result to `accept`."""
+
+        if MSGPACK in (self.scope.get("subprotocols") or ()):
+            self.codec = MSGPACK_CODEC
+            return MSGPACK
+        return None
+
+    async def send_json(self, content: Any, close: bool = False) -> None:
+        data = encode(self.codec, content)
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data, close=close)
+        else:
+            await self.send(text_data=data, close=close)
+
+    async def receive(self, text_data: str | None = None, bytes_data: bytes | None = None, **kwargs: Any) -> None:
+        if text_data is None and bytes_data is not None and self.codec.binary:
+            try:
+                content = self.codec.loads(bytes_data)
+            except ValueError:
+                content = None
+            if not isinstance(content, dict):
+                await self.send_json({"type": "error", "error": "invalid_frame"})
+                return
+            await self.receive_json(content, **kwargs)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+
+def _compact(value: Any, field: str | None = None) -> Any:
+    if isinstance(value, dict):
+        return {KEYS.get(key, key): _compact(item, key) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    if field in TIMESTAMP_FIELDS:
+        return _timestamp(value)
+    return value
+
+
+def _timestamp(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return msgpack.Timestamp.from_datetime(value)
+    return value
@@ -0,0 +1,18 @@
+"""Access to the raw Redis client behind the default cache."""
+
+from __future__ import annotations
+
+
+def get_redis_client():
+    """
+    Return the redis-py client used by the default django-redis cache, or
+    `None` when the cache is backed by something other than Redis (e.g. local
+    overrides). Callers treat `None` as "run without the Redis fast path".
+    """
+
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("groups", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="last_message_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="last_message_author",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="last_message_preview",
+            field=models.CharField(blank=True, max_length=140),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
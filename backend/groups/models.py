@@ -20,6 +20,17 @@ class Group(models.Model):
         related_name="mentored_groups",
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalised chat activity, maintained by `chat.activity`.
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_message_preview = models.CharField(max_length=140, blank=True)
+    last_message_author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
 
     class Meta:
         ordering = ["id"]
@@ -30,6 +30,8 @@ class GroupSummarySerializer(serializers.ModelSerializer, UserNameMixin):
 
     members = serializers.SerializerMethodField()
     mentor = serializers.SerializerMethodField()
+    messageCount = serializers.IntegerField(source="message_count", read_only=True)
+    lastMessage = serializers.SerializerMethodField()
 
     class Meta:
         model = Group
@@ -40,6 +42,8 @@ class GroupSummarySerializer(serializers.ModelSerializer, UserNameMixin):
             "status",
             "mentor",
             "track",
+            "messageCount",
+            "lastMessage",
         ]
 
     def get_members(self, obj: Group) -> int:
@@ -57,6 +61,16 @@ class GroupSummarySerializer(serializers.ModelSerializer, UserNameMixin):
             "name": self.get_display_name(mentor),
         }
 
+    def get_lastMessage(self, obj: Group) -> dict[str, Any] | None:
+        if obj.last_message_at is None:
+            return None
+        author = obj.last_message_author
+        return {
+            "timestamp": obj.last_message_at,
+            "preview": obj.last_message_preview,
+            "author": {"id": author.id, "name": self.get_display_name(author)} if author else None,
+        }
+
 
 class GroupMemberSerializer(serializers.ModelSerializer, UserNameMixin):
     """
@@ -1,5 +1,5 @@
 from django.db import transaction
-from django.db.models import Count, Q, Max
+from django.db.models import Count, F, Q, Max
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -33,7 +33,7 @@ class GroupViewSet(viewsets.GenericViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        base_queryset = Group.objects.select_related("mentor").prefetch_related(
+        base_queryset = Group.objects.select_related("mentor", "last_message_author").prefetch_related(
             "members__user",
             "milestones__tasks",
         )
@@ -73,6 +73,7 @@ class GroupViewSet(viewsets.GenericViewSet):
         if status_param:
             queryset = queryset.filter(status__iexact=status_param)
 
+        queryset = self._apply_sort(queryset, request)
         serializer = self.get_serializer(queryset, many=True)
         return Response({"groups": serializer.data}, status=status.HTTP_200_OK)
 
@@ -87,9 +88,17 @@ class GroupViewSet(viewsets.GenericViewSet):
             .annotate(member_count=Count("members", distinct=True))
             .distinct()
         )
+        queryset = self._apply_sort(queryset, request)
         serializer = self.get_serializer(queryset, many=True)
         return Response({"groups": serializer.data}, status=status.HTTP_200_OK)
 
+    def _apply_sort(self, queryset, request):
+        """`?sort=activity` lists the most recently active conversations first."""
+
+        if (request.query_params.get("sort") or "").strip().lower() == "activity":
+            return queryset.order_by(F("last_message_at").desc(nulls_last=True), "id")
+        return queryset
+
     def retrieve(self, request, *args, **kwargs):
         """
         Return the detail for a specific group, including members and milestones.
@@ -67,6 +67,16 @@ PY
 )"
 wait_for_tcp "${REDIS_HOST}" "${REDIS_PORT}" "Redis"
 
+# The drain has to finish (window + 2s) before Docker's stop grace period
+# (docker-compose passes CHAT_STOP_GRACE_SECONDS, which also sets
+# stop_grace_period) ends in SIGKILL.
+DRAIN_WINDOW="${CHAT_DRAIN_WINDOW_SECONDS:-20}"
+STOP_GRACE="${CHAT_STOP_GRACE_SECONDS:-30}"
+if [ "$(( DRAIN_WINDOW + 2 ))" -gt "${STOP_GRACE}" ]; then
+  echo "[entrypoint] CHAT_DRAIN_WINDOW_SECONDS=${DRAIN_WINDOW} must be at most CHAT_STOP_GRACE_SECONDS - 2 ($(( STOP_GRACE - 2 )))." >&2
+  exit 1
+fi
+
 echo "[entrypoint] Applying migrations..."
 python manage.py migrate --noinput
 
@@ -76,4 +86,26 @@ if [[ "${SEED_DEMO_DATA:-false}" == "true" ]]; then
 fi
 
 echo "[entrypoint] Starting ASGI server..."
-exec daphne -b 0.0.0.0 -p 8000 btf_backend.asgi:application
+daphne -b 0.0.0.0 -p 8000 btf_backend.asgi:application &
+server_pid=$!
+
+# On SIGTERM, let the server drain chat sockets (SIGUSR1, see chat/drain.py)
+# for CHAT_DRAIN_WINDOW_SECONDS before stopping it.
+draining=false
+drain() {
+  draining=true
+  echo "[entrypoint] Draining chat connections..."
+  kill -USR1 "${server_pid}" 2>/dev/null || true
+  sleep "$(( DRAIN_WINDOW + 2 ))"
+  kill -TERM "${server_pid}" 2>/dev/null || true
+}
+trap drain TERM INT
+
+status=0
+wait "${server_pid}" || status=$?
+if [ "${draining}" = "true" ]; then
+  # The first `wait` was interrupted by the signal; collect the real status.
+  status=0
+  wait "${server_pid}" || status=$?
+fi
+exit "${status}"
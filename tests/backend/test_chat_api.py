@@ -1,8 +1,30 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 
-from chat.models import Message
-from groups.models import Group
+from chat import reactions
+from chat.automod import get_matcher
+from chat.cache import push_message
+from chat.digest import collect_digests
+from chat.models import Message, MessageAttachment, Reaction, ReadMarker
+from chat.read_state import flush_read_markers, mark_read
+from chat.services import create_message
+from groups.models import Group, GroupMember
 
 from .base import AuthenticatedAPITestCase
 
@@ -10,6 +32,7 @@ from .base import AuthenticatedAPITestCase
 class ChatEndpointsTests(AuthenticatedAPITestCase):
     def setUp(self):
         super().setUp()
+        cache.clear()
         self.student = self.create_student("chat.student@example.com")
         self.mentor = self.create_user("chat.mentor@example.com", role="mentor", status="active")
         self.group = self.create_group(
@@ -60,3 +83,703 @@ class ChatEndpointsTests(AuthenticatedAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.json()["attachments"][0]["filename"], "diagram.png")
 
+    def test_create_message_never_rereads_the_message(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url,
+                {"text": "Fresh", "attachments": [{"url": "https://cdn.example.com/a.png", "filename": "a.png"}]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["attachments"][0]["filename"], "a.png")
+        selects = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertFalse([sql for sql in selects if '"chat_message' in sql])
+
+    def test_cursor_pagination_handles_shared_timestamps(self):
+        shared = timezone.now()
+        for index in range(4):
+            Message.objects.create(group=self.group, author=self.student.user, text=f"Burst {index}")
+        Message.objects.filter(group=self.group).update(created_at=shared)
+
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+
+        seen = []
+        params = {"limit": 2}
+        while True:
+            payload = self.client.get(url, params).json()
+            seen.extend(message["id"] for message in payload["messages"])
+            if not payload["hasMore"]:
+                break
+            params = {"limit": 2, "before": payload["cursors"]["before"]}
+
+        expected = list(
+            Message.objects.filter(group=self.group).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_after_cursor_returns_only_newer_messages(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        latest = self.client.get(url).json()["cursors"]["after"]
+
+        newer = [
+            Message.objects.create(group=self.group, author=self.student.user, text=f"Missed {index}")
+            for index in range(3)
+        ]
+
+        response = self.client.get(url, {"after": latest, "limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payload = response.json()
+        self.assertEqual([m["id"] for m in payload["messages"]], [newer[1].id, newer[0].id])
+        self.assertTrue(payload["hasMore"])
+
+        payload = self.client.get(url, {"after": payload["cursors"]["after"]}).json()
+        self.assertEqual([m["id"] for m in payload["messages"]], [newer[2].id])
+        self.assertFalse(payload["hasMore"])
+
+    def test_invalid_cursor_returns_validation_error(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        response = self.client.get(url, {"after": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("after", response.json())
+
+    def test_first_page_is_served_from_hot_tail_cache(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.json()["messages"][0]["text"], "Hello team")
+        self.assertFalse(any("chat_message" in query["sql"] for query in queries.captured_queries))
+
+    def test_hot_tail_cache_tracks_creates_and_deletes(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post(url, {"text": "Spam"}, format="json").json()
+        self.assertEqual(self.client.get(url).json()["messages"][0]["id"], created["id"])
+
+        self.authenticate(self.mentor.user)
+        detail_url = reverse(
+            "chat:group-message-detail",
+            kwargs={"group_id": self.group.pk, "pk": created["id"]},
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url)
+
+        moderator_view = self.client.get(url).json()["messages"]
+        self.assertEqual(moderator_view[0]["id"], created["id"])
+        self.assertTrue(moderator_view[0]["isDeleted"])
+        self.assertEqual(moderator_view[0]["text"], "Spam")
+
+        self.authenticate(self.student.user)
+        member_view = self.client.get(url).json()["messages"]
+        self.assertNotIn(created["id"], [message["id"] for message in member_view])
+
+    def test_pushing_a_message_the_tail_was_primed_with_is_a_no_op(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        # Committed, but its on-commit push has not run yet.
+        late = Message.objects.create(group=self.group, author=self.student.user, text="Late push")
+        self.authenticate(self.student.user)
+        self.client.get(url)
+
+        push_message(late)
+        newer = Message.objects.create(group=self.group, author=self.mentor.user, text="Newer")
+        push_message(newer)
+
+        ids = [message["id"] for message in self.client.get(url).json()["messages"]]
+        self.assertEqual(ids[:2], [newer.pk, late.pk])
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_serializing_a_page_uses_constant_queries(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.mentor.user)
+
+        def count_queries(total):
+            Message.objects.filter(group=self.group).delete()
+            for index in range(total):
+                Message.objects.create(
+                    group=self.group,
+                    author=self.student.user,
+                    text=f"Message {index}",
+                    is_deleted=index % 2 == 0,
+                )
+            far_future = (timezone.now() + timedelta(days=1)).isoformat()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"before": far_future, "limit": 100})
+            self.assertEqual(len(response.json()["messages"]), total)
+            return len(queries.captured_queries)
+
+        self.assertEqual(count_queries(5), count_queries(40))
+
+    def test_unread_counts_use_read_markers_in_one_query(self):
+        other_group = self.create_group(group_id="BTF011", members=[self.student.user])
+        first = Message.objects.get(group=self.group)
+        Message.objects.create(group=self.group, author=self.mentor.user, text="Update")
+        Message.objects.create(group=other_group, author=self.mentor.user, text="Hi")
+        Message.objects.create(group=self.group, author=self.student.user, text="Own message")
+
+        mark_read(self.student.user.pk, self.group.pk, first.pk)
+        self.assertEqual(flush_read_markers(), 1)
+
+        self.authenticate(self.student.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("chat:chat-unread"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries.captured_queries), 1)
+        counts = {row["groupId"]: row for row in response.json()["groups"]}
+        self.assertEqual(counts[self.group.pk]["unread"], 1)
+        self.assertEqual(counts[self.group.pk]["lastReadMessageId"], first.pk)
+        self.assertEqual(counts[other_group.pk]["unread"], 1)
+
+    def test_read_markers_never_move_backwards(self):
+        older = Message.objects.create(group=self.group, author=self.mentor.user, text="Older")
+        newer = Message.objects.create(group=self.group, author=self.mentor.user, text="Newer")
+        mark_read(self.student.user.pk, self.group.pk, newer.pk)
+        flush_read_markers()
+        mark_read(self.student.user.pk, self.group.pk, older.pk)
+        flush_read_markers()
+
+        marker = ReadMarker.objects.get(user=self.student.user, group=self.group)
+        self.assertEqual(marker.last_read_message_id, newer.pk)
+
+    def test_read_markers_are_clamped_and_kept_until_written(self):
+        newest = Message.objects.create(group=self.group, author=self.mentor.user, text="Newest")
+        mark_read(self.student.user.pk, self.group.pk, newest.pk + 1000)
+        with patch("chat.read_state._upsert_markers", side_effect=DatabaseError("down")):
+            with self.assertRaises(DatabaseError):
+                flush_read_markers()
+        self.assertFalse(ReadMarker.objects.exists())
+
+        self.assertEqual(flush_read_markers(), 1)
+        marker = ReadMarker.objects.get(user=self.student.user, group=self.group)
+        self.assertEqual(marker.last_read_message_id, newest.pk)
+        self.assertEqual(flush_read_markers(), 0)
+
+    def test_search_highlights_matches_and_follows_edits(self):
+        message = Message.objects.create(
+            group=self.group, author=self.student.user, text="Deploying the <b>scheduler</b> tonight"
+        )
+        Message.objects.create(group=self.group, author=self.student.user, text="Unrelated chatter")
+
+        url = reverse("chat:group-message-search", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        response = self.client.get(url, {"q": "scheduler"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["messages"]
+        self.assertEqual([item["id"] for item in results], [message.pk])
+        self.assertIn("<mark>scheduler</mark>", results[0]["snippet"])
+        self.assertIn("&lt;b&gt;", results[0]["snippet"])
+
+        message.text = "Rollout moved to Friday"
+        message.save(update_fields=["text"])
+        self.assertEqual(self.client.get(url, {"q": "scheduler"}).json()["messages"], [])
+        self.assertEqual(len(self.client.get(url, {"q": "friday"}).json()["messages"]), 1)
+
+    def test_search_respects_moderation_visibility_and_pages_by_cursor(self):
+        for index in range(3):
+            Message.objects.create(group=self.group, author=self.student.user, text=f"Budget draft {index}")
+        hidden = Message.objects.create(
+            group=self.group,
+            author=self.student.user,
+            text="Budget leak",
+            moderation_status=Message.ModerationStatus.REJECTED,
+        )
+        url = reverse("chat:group-message-search", kwargs={"group_id": self.group.pk})
+
+        self.authenticate(self.student.user)
+        first = self.client.get(url, {"q": "budget", "limit": 2}).json()
+        self.assertTrue(first["hasMore"])
+        second = self.client.get(url, {"q": "budget", "limit": 2, "before": first["cursors"]["before"]}).json()
+        self.assertFalse(second["hasMore"])
+        seen = [item["id"] for item in first["messages"] + second["messages"]]
+        self.assertEqual(len(seen), 3)
+        self.assertNotIn(hidden.pk, seen)
+
+        self.authenticate(self.mentor.user)
+        response = self.client.get(url, {"q": "budget leak"})
+        self.assertEqual([item["id"] for item in response.json()["messages"]], [hidden.pk])
+
+    def test_search_requires_query(self):
+        url = reverse("chat:group-message-search", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+        response = self.client.get(url, {"q": "   "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("q", response.json())
+
+    def test_bulk_moderation_updates_batch_with_one_broadcast(self):
+        spam = [
+            Message.objects.create(group=self.group, author=self.student.user, text=f"Spam {index}")
+            for index in range(5)
+        ]
+        url = reverse("chat:group-message-bulk-moderation", kwargs={"group_id": self.group.pk})
+        payload = {"ids": [message.pk for message in spam] + [999999], "action": "reject", "moderationNote": "Spam"}
+
+        self.authenticate(self.student.user)
+        self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_403_FORBIDDEN)
+
+        self.authenticate(self.mentor.user)
+        with patch("chat.views.broadcast_message_event") as broadcast:
+            response = self.client.post(url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(body["missing"], [999999])
+        self.assertEqual(len(body["messages"]), 5)
+        broadcast.assert_called_once()
+        group_id, event_type, event_payload = broadcast.call_args.args
+        self.assertEqual(event_type, "messages.updated")
+        self.assertEqual(len(event_payload["messages"]), 5)
+        self.assertEqual(
+            Message.objects.filter(pk__in=[m.pk for m in spam], moderation_status="rejected").count(), 5
+        )
+
+    def test_bulk_approval_releases_held_messages_in_one_broadcast(self):
+        held = [
+            Message.objects.create(
+                group=self.group,
+                author=self.student.user,
+                text=f"Held {index}",
+                moderation_status=Message.ModerationStatus.PENDING,
+            )
+            for index in range(3)
+        ]
+        url = reverse("chat:group-message-bulk-moderation", kwargs={"group_id": self.group.pk})
+
+        self.authenticate(self.mentor.user)
+        with patch("chat.views.broadcast_message_event") as broadcast:
+            response = self.client.post(
+                url, {"ids": [message.pk for message in held], "action": "approve"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        broadcast.assert_called_once()
+        _, event_type, event_payload = broadcast.call_args.args
+        self.assertEqual(event_type, "messages.created")
+        self.assertEqual([item["id"] for item in event_payload["messages"]], [message.pk for message in held])
+
+    def test_bulk_moderation_rejects_unknown_action(self):
+        url = reverse("chat:group-message-bulk-moderation", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.mentor.user)
+        response = self.client.post(url, {"ids": [1], "action": "purge"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("action", response.json())
+
+    def test_moderation_queue_pages_pending_messages_across_groups(self):
+        other_group = self.create_group(group_id="BTF011", members=[self.student.user])
+        pending = [
+            Message.objects.create(
+                group=group,
+                author=self.student.user,
+                text=f"Held {index}",
+                moderation_status=Message.ModerationStatus.PENDING,
+            )
+            for index, group in enumerate([self.group, other_group, self.group])
+        ]
+        url = reverse("chat:chat-moderation-queue")
+
+        self.authenticate(self.mentor.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        supervisor = self.create_user("chat.supervisor@example.com", role="supervisor")
+        self.authenticate(supervisor.user)
+        first = self.client.get(url, {"limit": 2}).json()
+        self.assertEqual(first["pendingCount"], 3)
+        self.assertTrue(first["hasMore"])
+        second = self.client.get(url, {"limit": 2, "after": first["cursors"]["after"]}).json()
+        self.assertFalse(second["hasMore"])
+        self.assertNotIn("pendingCount", second)
+        self.assertEqual(
+            [(item["id"], item["groupId"]) for item in first["messages"] + second["messages"]],
+            [(message.pk, message.group_id) for message in pending],
+        )
+
+    def test_export_streams_history_as_ndjson_csv_and_zip(self):
+        message = Message.objects.create(
+            group=self.group,
+            author=self.student.user,
+            text="With file, and a comma",
+            moderation_status=Message.ModerationStatus.REJECTED,
+            moderation_note="Off topic",
+        )
+        MessageAttachment.objects.create(
+            message=message,
+            file_url="https://cdn.example.com/a.pdf",
+            filename="a.pdf",
+            file_size=10,
+            mime_type="application/pdf",
+        )
+        url = reverse("chat:group-message-export", kwargs={"group_id": self.group.pk})
+
+        self.authenticate(self.mentor.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = self.create_user("chat.admin@example.com", role="admin")
+        self.authenticate(admin.user)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([line["text"] for line in lines], ["Hello team", "With file, and a comma"])
+        self.assertEqual(lines[1]["moderation_note"], "Off topic")
+        self.assertEqual(lines[1]["attachments"][0]["filename"], "a.pdf")
+
+        response = self.client.get(url, {"format": "csv"})
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(rows[1]["text"], "With file, and a comma")
+        self.assertEqual(rows[1]["moderation_status"], "rejected")
+
+        response = self.client.get(url, {"manifest": "1"})
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ["messages.ndjson", "attachments.csv"])
+            manifest = archive.read("attachments.csv").decode("utf-8").splitlines()
+        self.assertEqual(manifest[1].split(",")[0], str(message.pk))
+
+    def test_export_streams_incrementally_under_asgi(self):
+        for index in range(4):
+            Message.objects.create(group=self.group, author=self.student.user, text=f"Line {index}")
+        admin = self.create_user("chat.admin@example.com", role="admin")
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(admin.user)}"}
+        url = reverse("chat:group-message-export", kwargs={"group_id": self.group.pk})
+
+        async def scenario():
+            response = await AsyncClient().get(url, headers=headers)
+            self.assertTrue(response.is_async)
+            chunks = []
+            async for chunk in response.streaming_content:
+                chunks.append(chunk)
+            return chunks
+
+        with patch("chat.export.CHUNK_SIZE", 2):
+            chunks = async_to_sync(scenario)()
+        # Five rows, fetched two per hop to the sync thread.
+        self.assertEqual([chunk.count(b"\n") for chunk in chunks], [2, 2, 1])
+
+    @override_settings(CHAT_BLOCKLIST=["free crypto", "scam"])
+    def test_blocklisted_messages_are_held_for_review(self):
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+
+        held = self.client.post(url, {"text": "Get FREE   crypto, total scam"}, format="json").json()
+        self.assertEqual(held["moderation"]["status"], "pending")
+        self.assertEqual(held["moderation"]["note"], "Auto-held: matched free crypto, scam")
+
+        clean = self.client.post(url, {"text": "Scammers are rare here"}, format="json").json()
+        self.assertEqual(clean["moderation"], {"status": "approved"})
+
+    @override_settings(CHAT_BLOCKLIST=["scam"])
+    def test_held_messages_stay_private_until_approved(self):
+        peer = self.create_student("chat.peer@example.com")
+        group = self.create_group(group_id="BTF011", mentor=self.mentor.user, members=[self.student.user, peer.user])
+        url = reverse("chat:group-messages", kwargs={"group_id": group.pk})
+        search_url = reverse("chat:group-message-search", kwargs={"group_id": group.pk})
+
+        def listed(user, page_url=url, **params):
+            self.authenticate(user)
+            return [message["id"] for message in self.client.get(page_url, params).json()["messages"]]
+
+        listed(peer.user)  # primes the hot-tail cache
+        self.authenticate(self.student.user)
+        with patch("chat.views.send_group_event") as send_event, self.captureOnCommitCallbacks(execute=True):
+            held = self.client.post(url, {"text": "total scam"}, format="json").json()
+        send_event.assert_not_called()
+
+        self.assertEqual(listed(peer.user), [])
+        self.assertEqual(listed(peer.user, search_url, q="scam"), [])
+        self.assertEqual(listed(self.student.user), [held["id"]])
+        self.assertEqual(listed(self.mentor.user), [held["id"]])
+
+        detail_url = reverse("chat:group-message-detail", kwargs={"group_id": group.pk, "pk": held["id"]})
+        with patch("chat.views.broadcast_message_event") as broadcast, self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url, {"moderationStatus": "approved"}, format="json")
+        self.assertEqual(broadcast.call_args.args[1], "message.created")
+        self.assertEqual(listed(peer.user), [held["id"]])
+
+    def test_blocklist_automaton_is_rebuilt_only_on_change(self):
+        with override_settings(CHAT_BLOCKLIST=["spam"]):
+            matcher = get_matcher()
+            self.assertIs(get_matcher(), matcher)
+            self.assertEqual(matcher.find("No SPAM please"), ["spam"])
+        with override_settings(CHAT_BLOCKLIST=["spam", "junk"]):
+            self.assertIsNot(get_matcher(), matcher)
+
+    def test_normalized_format_emits_each_author_once(self):
+        for index in range(3):
+            Message.objects.create(group=self.group, author=self.mentor.user, text=f"Mentor note {index}")
+        url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        self.authenticate(self.student.user)
+
+        # The first page comes from the hot-tail cache, older pages from the database.
+        first_page = self.client.get(url, {"format": "normalized", "limit": 2})
+        self.assertEqual(first_page.status_code, status.HTTP_200_OK)
+        older_page = self.client.get(
+            url, {"format": "normalized", "limit": 2, "before": first_page.json()["cursors"]["before"]}
+        )
+
+        for payload in (first_page.json(), older_page.json()):
+            authors = {message["author"] for message in payload["messages"]}
+            self.assertEqual(set(payload["users"]), {str(author_id) for author_id in authors})
+            self.assertTrue(all(isinstance(author_id, int) for author_id in authors))
+        self.assertEqual(
+            first_page.json()["users"][str(self.mentor.user.pk)]["id"],
+            self.mentor.user.pk,
+        )
+        self.assertNotIn("users", self.client.get(url).json())
+
+    def test_group_activity_follows_sends_and_moderation(self):
+        first = create_message(self.group, self.student.user, "First")
+        second = create_message(self.group, self.mentor.user, "Second")
+        self.group.refresh_from_db()
+        self.assertEqual((self.group.message_count, self.group.last_message_preview), (2, "Second"))
+
+        self.authenticate(self.mentor.user)
+        url = reverse("chat:group-message-detail", kwargs={"group_id": self.group.pk, "pk": second.pk})
+        self.client.delete(url)
+        self.group.refresh_from_db()
+        # Recomputed from visible messages, which includes the one created
+        # directly in setUp (bypassing the send path).
+        self.assertEqual((self.group.message_count, self.group.last_message_preview), (2, "First"))
+        self.assertEqual(self.group.last_message_author_id, first.author_id)
+
+        Group.objects.filter(pk=self.group.pk).update(message_count=0, last_message_preview="")
+        call_command("rebuild_chat_activity", self.group.pk, stdout=io.StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual((self.group.message_count, self.group.last_message_preview), (2, "First"))
+
+    @override_settings(CHAT_BLOCKLIST=["scam"])
+    def test_group_activity_counts_held_messages_once_approved(self):
+        create_message(self.group, self.mentor.user, "Welcome")
+        held = create_message(self.group, self.student.user, "Total scam")
+        self.group.refresh_from_db()
+        self.assertEqual((self.group.message_count, self.group.last_message_preview), (1, "Welcome"))
+
+        self.authenticate(self.mentor.user)
+        url = reverse("chat:group-message-detail", kwargs={"group_id": self.group.pk, "pk": held.pk})
+        self.client.patch(url, {"moderationStatus": "approved"}, format="json")
+        self.group.refresh_from_db()
+        # setUp's message bypassed the send path; the recomputation includes it.
+        self.assertEqual((self.group.message_count, self.group.last_message_preview), (3, "Total scam"))
+        self.assertEqual(self.group.last_message_author_id, self.student.user.pk)
+
+    def test_digest_emails_offline_members_once(self):
+        create_message(self.group, self.mentor.user, "Draft the protocol")
+        create_message(self.group, self.mentor.user, "Review the protocol")
+        online = {self.group.pk: {self.mentor.user.id}}
+
+        with patch("chat.digest.presence.online_user_ids_by_group", return_value=online):
+            with self.assertNumQueries(1):
+                digests = collect_digests(timezone.now())
+            self.assertEqual([digest.user_id for digest in digests], [self.student.user.id])
+
+            call_command("send_chat_digests", stdout=io.StringIO())
+            self.assertEqual(len(mail.outbox), 1)
+            self.assertEqual(mail.outbox[0].to, [self.student.user.email])
+            self.assertIn(f"{self.group.name}: 2 new", mail.outbox[0].body)
+            self.assertIn("Latest: Review the protocol", mail.outbox[0].body)
+
+            call_command("send_chat_digests", stdout=io.StringIO())
+            self.assertEqual(len(mail.outbox), 1)
+
+        # Once offline, the mentor is sent the student's message.
+        call_command("send_chat_digests", stdout=io.StringIO())
+        self.assertEqual([message.to for message in mail.outbox[1:]], [[self.mentor.user.email]])
+        self.assertIn(f"{self.group.name}: 1 new", mail.outbox[1].body)
+
+    def test_reactions_update_aggregate_counts_in_batches(self):
+        message = Message.objects.get(group=self.group)
+        url = reverse("chat:group-message-reactions", kwargs={"group_id": self.group.pk, "pk": message.pk})
+
+        with (
+            patch("chat.views.send_group_event") as send_event,
+            patch("chat.views.schedule_threaded_flush") as schedule,
+        ):
+            for user in (self.student.user, self.mentor.user, self.mentor.user):
+                self.authenticate(user)
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(url, {"emoji": "👍"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(send_event.call_count, 2)
+            self.assertEqual(
+                send_event.call_args.args[1]["payload"],
+                {"messageId": message.pk, "emoji": "👍", "userId": self.mentor.user.pk, "delta": 1},
+            )
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f"{url}?emoji=👍")
+            self.assertEqual(response.json(), {"messageId": message.pk, "emoji": "👍", "reacted": False})
+
+        self.assertEqual(self.client.post(url, {"emoji": "not one"}, format="json").status_code, 400)
+
+        # Requests only schedule the timed flush; the counts move once it runs.
+        self.assertEqual(schedule.call_count, 4)
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_counts, {})
+        self.assertEqual(reactions.flush_reaction_counts(), 1)
+
+        cache.clear()
+        list_url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        with CaptureQueriesContext(connection) as queries:
+            payload = self.client.get(list_url).json()
+        self.assertEqual(payload["messages"][0]["reactions"], {"👍": 1})
+        self.assertFalse(any("chat_reaction" in query["sql"] for query in queries.captured_queries))
+
+    def test_reactions_only_accept_a_bounded_set_of_emoji(self):
+        message = Message.objects.get(group=self.group)
+        url = reverse("chat:group-message-reactions", kwargs={"group_id": self.group.pk, "pk": message.pk})
+
+        self.authenticate(self.student.user)
+        for text in ("spam", "<b>", "1", "👍x"):
+            response = self.client.post(url, {"emoji": text}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, text)
+
+        with (
+            patch("chat.reactions.MAX_EMOJI_PER_MESSAGE", 2),
+            patch("chat.views.send_group_event"),
+            patch("chat.views.schedule_threaded_flush"),
+        ):
+            for emoji in ("👍🏽", "🇦🇺"):
+                self.assertEqual(self.client.post(url, {"emoji": emoji}, format="json").status_code, 201)
+            response = self.client.post(url, {"emoji": "1️⃣"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("emoji", response.json())
+
+            # Emoji the message already has stay open to everyone.
+            self.authenticate(self.mentor.user)
+            self.assertEqual(self.client.post(url, {"emoji": "🇦🇺"}, format="json").status_code, 201)
+
+    def test_threaded_flush_runs_once_per_interval(self):
+        with (
+            patch("chat.reactions.FLUSH_INTERVAL_SECONDS", 0.05),
+            patch("chat.reactions.flush_reaction_counts") as flush,
+        ):
+            reactions.schedule_threaded_flush()
+            timer = reactions._flush_timer
+            reactions.schedule_threaded_flush()
+            timer.join(timeout=5)
+        flush.assert_called_once_with()
+
+    def test_failed_reaction_flush_keeps_the_deltas(self):
+        message = Message.objects.get(group=self.group)
+        reactions._buffer(message.pk, "👍", 2)
+
+        with patch.object(Message.objects, "bulk_update", side_effect=DatabaseError("lock timeout")):
+            with self.assertRaises(DatabaseError):
+                reactions.flush_reaction_counts()
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_counts, {})
+
+        self.assertEqual(reactions.flush_reaction_counts(), 1)
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_counts, {"👍": 2})
+
+    def test_reconcile_reaction_counts_from_rows(self):
+        message = Message.objects.get(group=self.group)
+        Reaction.objects.create(message=message, user=self.student.user, emoji="👍")
+        Reaction.objects.create(message=message, user=self.mentor.user, emoji="👍")
+        stale = Message.objects.create(
+            group=self.group, author=self.mentor.user, text="Stale", reaction_counts={"🎉": 2}
+        )
+        Message.objects.filter(pk=message.pk).update(reaction_counts={"👍": 1, "🎉": 1})
+
+        output = io.StringIO()
+        call_command("reconcile_reaction_counts", stdout=output)
+        self.assertIn("2 message(s)", output.getvalue())
+        message.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual((message.reaction_counts, stale.reaction_counts), ({"👍": 2}, {}))
+
+        call_command("reconcile_reaction_counts", message.pk, stdout=output)
+        self.assertIn("0 message(s)", output.getvalue())
+
+    def test_replies_stay_out_of_the_timeline_and_load_per_thread(self):
+        parent = Message.objects.get(group=self.group)
+        list_url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        thread_url = reverse("chat:group-message-thread", kwargs={"group_id": self.group.pk, "pk": parent.pk})
+        self.authenticate(self.mentor.user)
+        self.client.get(list_url)  # primes the hot-tail cache
+
+        replies = []
+        for text in ("Reply one", "Reply two"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(list_url, {"text": text, "parentId": parent.pk}, format="json")
+            self.assertEqual(response.json()["parentId"], parent.pk)
+            replies.append(response.json())
+        response = self.client.post(list_url, {"text": "Nested", "parentId": replies[0]["id"]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        timeline = self.client.get(list_url).json()["messages"]
+        self.assertEqual([message["text"] for message in timeline], ["Hello team"])
+        self.assertEqual(timeline[0]["replyCount"], 2)
+        self.assertEqual(timeline[0]["lastReplyAt"], replies[1]["timestamp"])
+
+        page = self.client.get(thread_url, {"limit": 1}).json()
+        self.assertEqual(page["parent"]["id"], parent.pk)
+        self.assertEqual([message["text"] for message in page["messages"]], ["Reply two"])
+        self.assertTrue(page["hasMore"])
+        older = self.client.get(thread_url, {"before": page["cursors"]["before"]}).json()
+        self.assertEqual([message["text"] for message in older["messages"]], ["Reply one"])
+
+        detail_url = reverse("chat:group-message-detail", kwargs={"group_id": self.group.pk, "pk": replies[1]["id"]})
+        with patch("chat.views.broadcast_message_event") as broadcast:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(detail_url)
+        self.assertEqual(broadcast.call_args.args[1], "thread.updated")
+        self.assertEqual(
+            broadcast.call_args.args[2],
+            {"threads": [{"messageId": parent.pk, "replyCount": 1, "lastReplyAt": replies[0]["timestamp"]}]},
+        )
+        self.assertEqual(self.client.get(list_url).json()["messages"][0]["replyCount"], 1)
+
+    def test_held_parents_only_accept_replies_from_author_and_moderators(self):
+        held = Message.objects.create(
+            group=self.group,
+            author=self.student.user,
+            text="Held parent",
+            moderation_status=Message.ModerationStatus.PENDING,
+        )
+        other = self.create_student("chat.other@example.com")
+        GroupMember.objects.create(group=self.group, user=other.user, role="student")
+        list_url = reverse("chat:group-messages", kwargs={"group_id": self.group.pk})
+        payload = {"text": "Reply", "parentId": held.pk}
+
+        self.authenticate(other.user)
+        response = self.client.post(list_url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parentId", response.json())
+
+        for user in (self.student.user, self.mentor.user):
+            self.authenticate(user)
+            response = self.client.post(list_url, payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.json()["parentId"], held.pk)
+
+    def test_threads_of_hidden_parents_are_not_found(self):
+        statuses = Message.ModerationStatus
+        hidden = [
+            Message.objects.create(
+                group=self.group, author=self.mentor.user, text="Held", moderation_status=statuses.PENDING
+            ),
+            Message.objects.create(
+                group=self.group, author=self.mentor.user, text="Rejected", moderation_status=statuses.REJECTED
+            ),
+            Message.objects.create(group=self.group, author=self.mentor.user, text="Deleted", is_deleted=True),
+        ]
+
+        for parent in hidden:
+            url = reverse("chat:group-message-thread", kwargs={"group_id": self.group.pk, "pk": parent.pk})
+            self.authenticate(self.student.user)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+            self.authenticate(self.mentor.user)
+            self.assertEqual(self.client.get(url).json()["parent"]["id"], parent.pk)
@@ -0,0 +1,820 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+
+from chat import drain, metrics
+from chat.models import Message, ReadMarker
+from chat.connections import IdleSweeper, sockets_key
+from chat.fanout import FIREHOSE, LocalFanout, get_group_channel_name, has_listeners
+from chat.moderation import notify_moderation_queue
+from chat.outbound import COALESCE, RESYNC, OutboundQueue
+from chat.presence import presence_key
+from chat.reactions import flush_reaction_counts
+from chat.read_state import flush_read_markers
+from chat.routing import websocket_urlpatterns
+from chat.consumers import _group_tracks
+from chat.services import broadcast_message_event
+from core.redis_client import get_redis_client
+from groups.models import GroupMember
+
+from .base import AuthenticatedAPITestCase
+
+
+class GroupChatConsumerTests(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.student = self.create_student("ws.student@example.com")
+        self.mentor = self.create_user("ws.mentor@example.com", role="mentor", status="active")
+        self.group = self.create_group(
+            group_id="BTF020",
+            mentor=self.mentor.user,
+            members=[self.student.user],
+        )
+
+    def open_socket(self, user, group_id=None, query="", subprotocols=None):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/chat/groups/{group_id or self.group.pk}/" + (f"?{query}" if query else ""),
+            subprotocols=subprotocols,
+        )
+        communicator.scope["user"] = user
+        return communicator
+
+    async def handshake(self, communicator):
+        """Connect and consume `connection.established` and `presence.snapshot`."""
+
+        await communicator.connect()
+        return [await communicator.receive_json_from() for _ in range(2)]
+
+    def test_connect_rejects_outsiders(self):
+        outsider = self.create_student("ws.outsider@example.com")
+
+        async def scenario():
+            communicator = self.open_socket(outsider.user)
+            connected, code = await communicator.connect()
+            return connected, code
+
+        connected, code = async_to_sync(scenario)()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4403)
+
+    def test_repeat_connects_are_authorised_from_the_acl_cache(self):
+        async def connect_once():
+            communicator = self.open_socket(self.student.user)
+            connected, _ = await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected
+
+        self.assertTrue(async_to_sync(connect_once)())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(async_to_sync(connect_once)())
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_removing_membership_closes_open_socket(self):
+        def remove_membership():
+            with self.captureOnCommitCallbacks(execute=True):
+                GroupMember.objects.filter(group=self.group, user=self.student.user).delete()
+
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+
+            await sync_to_async(remove_membership)()
+            frame = await communicator.receive_json_from()
+            closed = await communicator.receive_output()
+
+            reconnect = self.open_socket(self.student.user)
+            return frame, closed, await reconnect.connect()
+
+        frame, closed, (connected, code) = async_to_sync(scenario)()
+        self.assertEqual(frame, {"type": "access.revoked", "groupId": self.group.pk})
+        self.assertEqual(closed, {"type": "websocket.close", "code": 4403})
+        self.assertFalse(connected)
+        self.assertEqual(code, 4403)
+
+    def test_group_events_are_delivered_through_send_queue(self):
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+            await get_channel_layer().group_send(
+                get_group_channel_name(self.group.pk),
+                {"type": "chat.message", "group_id": self.group.pk, "event": "message.created", "payload": {"id": 1}},
+            )
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame
+
+        self.assertEqual(
+            async_to_sync(scenario)(),
+            {"type": "message.created", "payload": {"id": 1}, "seq": None},
+        )
+
+    def test_local_sockets_share_one_group_subscription(self):
+        group_name = get_group_channel_name(self.group.pk)
+
+        async def scenario():
+            layer = get_channel_layer()
+            sockets = [self.open_socket(self.student.user) for _ in range(2)]
+            for communicator in sockets:
+                await self.handshake(communicator)
+            subscribers = len(layer.groups[group_name])
+            await layer.group_send(
+                group_name,
+                {"type": "chat.message", "group_id": self.group.pk, "event": "message.created", "payload": {"id": 1}},
+            )
+            frames = [await communicator.receive_json_from() for communicator in sockets]
+            for communicator in sockets:
+                await communicator.disconnect()
+            return subscribers, frames, layer.groups.get(group_name)
+
+        subscribers, frames, remaining = async_to_sync(scenario)()
+        self.assertEqual(subscribers, 1)
+        self.assertEqual([frame["payload"] for frame in frames], [{"id": 1}, {"id": 1}])
+        self.assertFalse(remaining)
+        self.assertFalse(has_listeners(self.group.pk))
+
+        # Nobody is listening any more, so broadcasts skip the channel layer.
+        with patch("chat.services.async_to_sync") as group_send:
+            broadcast_message_event(self.group.pk, "message.created", {"id": 2})
+        group_send.assert_not_called()
+
+    def test_msgpack_sockets_share_one_compact_encoding(self):
+        metrics.reset()
+        payload = {"id": 1, "text": "hi", "timestamp": "2026-01-01T09:30:00Z"}
+
+        async def scenario():
+            sockets = [self.open_socket(self.student.user, subprotocols=["msgpack", "json"]) for _ in range(2)]
+            accepted = []
+            for communicator in sockets:
+                accepted.append(await communicator.connect())
+                for _ in range(2):  # connection.established, presence.snapshot
+                    await communicator.receive_from()
+            await sync_to_async(broadcast_message_event)(self.group.pk, "message.created", payload)
+            frames = [await communicator.receive_from() for communicator in sockets]
+            await sockets[0].send_to(bytes_data=msgpack.packb({"action": "ping"}))
+            pong = await sockets[0].receive_from()
+            for communicator in sockets:
+                await communicator.disconnect()
+            return accepted, frames, pong
+
+        accepted, frames, pong = async_to_sync(scenario)()
+        self.assertEqual(accepted, [(True, "msgpack")] * 2)
+        self.assertEqual(frames[0], frames[1])
+        frame = msgpack.unpackb(frames[0], timestamp=3)
+        self.assertEqual((frame["t"], frame["p"]["i"], frame["p"]["x"]), ("message.created", 1, "hi"))
+        self.assertEqual(frame["p"]["ts"], datetime(2026, 1, 1, 9, 30, tzinfo=timezone.utc))
+        self.assertEqual(msgpack.unpackb(pong), {"t": "pong"})
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual((counters["wire.encoded"], counters["wire.reused"]), (1, 1))
+
+    def test_oldest_socket_is_closed_beyond_the_per_user_cap(self):
+        async def scenario():
+            sockets = [self.open_socket(self.student.user) for _ in range(3)]
+            for communicator in sockets[:2]:
+                await self.handshake(communicator)
+            with patch("chat.connections.MAX_SOCKETS_PER_USER", 2):
+                await self.handshake(sockets[2])
+            evicted = await sockets[0].receive_json_from()
+            closed = await sockets[0].receive_output()
+            registered = await sync_to_async(get_redis_client().zcard)(sockets_key(self.student.user.pk))
+            for communicator in sockets[1:]:
+                await communicator.disconnect()
+            return evicted, closed, registered
+
+        evicted, closed, registered = async_to_sync(scenario)()
+        self.assertEqual(evicted, {"type": "connection.evicted", "reason": "socket_limit"})
+        self.assertEqual(closed, {"type": "websocket.close", "code": 4409})
+        self.assertEqual(registered, 2)
+
+    def test_silent_sockets_are_evicted_after_the_heartbeat_deadline(self):
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+            evicted = await communicator.receive_json_from(timeout=2)
+            closed = await communicator.receive_output()
+            await communicator.disconnect()
+            return evicted, closed
+
+        with patch("chat.connections.HEARTBEAT_DEADLINE_SECONDS", 0.2):
+            evicted, closed = async_to_sync(scenario)()
+        self.assertEqual(evicted, {"type": "connection.evicted", "reason": "idle"})
+        self.assertEqual(closed, {"type": "websocket.close", "code": 4408})
+
+    def test_drain_announces_resume_tokens_and_closes_sockets_gradually(self):
+        async def scenario():
+            sockets = [self.open_socket(self.student.user) for _ in range(2)]
+            for communicator in sockets:
+                await self.handshake(communicator)
+            await sync_to_async(broadcast_message_event)(self.group.pk, "message.created", {"id": 1})
+            for communicator in sockets:
+                await communicator.receive_json_from()
+
+            drain.begin_drain()
+            announced = [await communicator.receive_json_from() for communicator in sockets]
+            closed = [await communicator.receive_output() for communicator in sockets]
+            refused = await WebsocketCommunicator(
+                drain.RejectWhileDraining(URLRouter(websocket_urlpatterns)), f"/ws/chat/groups/{self.group.pk}/"
+            ).connect()
+            for communicator in sockets:
+                await communicator.disconnect()
+            return announced, closed, refused
+
+        with (
+            patch.object(drain, "_draining", False),
+            patch.object(drain, "DRAIN_WINDOW_SECONDS", 0.2),
+            patch.object(drain, "RECONNECT_JITTER_SECONDS", 1),
+        ):
+            announced, closed, refused = async_to_sync(scenario)()
+
+        self.assertEqual([frame["type"] for frame in announced], ["server.draining"] * 2)
+        self.assertTrue(all(0 <= frame["reconnectInMs"] <= 1000 for frame in announced))
+        self.assertEqual(closed, [{"type": "websocket.close", "code": 1012}] * 2)
+        self.assertEqual(refused, (False, 1012))
+        token = announced[0]["resume"]
+        self.assertEqual(drain.read_resume_token(token, self.student.user.pk), {self.group.pk: 1})
+        self.assertIsNone(drain.read_resume_token(token, self.mentor.user.pk))
+
+        broadcast_message_event(self.group.pk, "message.created", {"id": 2})
+
+        async def reconnect():
+            communicator = self.open_socket(self.student.user, query=f"resume={token}")
+            await communicator.connect()
+            frames = [await communicator.receive_json_from() for _ in range(3)]
+            await communicator.disconnect()
+            return frames
+
+        established, _, replayed = async_to_sync(reconnect)()
+        self.assertTrue(established["resumed"])
+        self.assertEqual((replayed["seq"], replayed["payload"]["id"]), (2, 2))
+
+    def test_since_seq_replays_missed_events_before_live_delivery(self):
+        for index in range(3):
+            broadcast_message_event(self.group.pk, "message.created", {"id": index})
+
+        async def scenario():
+            communicator = self.open_socket(self.student.user, query="since_seq=1")
+            frames = await self.handshake(communicator)
+            frames += [await communicator.receive_json_from() for _ in range(2)]
+            await sync_to_async(broadcast_message_event)(self.group.pk, "message.deleted", {"id": 2})
+            frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return frames
+
+        established, snapshot, *events = async_to_sync(scenario)()
+        self.assertEqual(snapshot["type"], "presence.snapshot")
+        self.assertEqual(established["seq"], 3)
+        self.assertTrue(established["resumed"])
+        self.assertEqual(
+            [(event["type"], event["payload"]["id"], event["seq"]) for event in events],
+            [("message.created", 1, 2), ("message.created", 2, 3), ("message.deleted", 2, 4)],
+        )
+
+    def test_since_seq_beyond_event_log_requests_resync(self):
+        async def scenario():
+            communicator = self.open_socket(self.student.user, query="since_seq=42")
+            await communicator.connect()
+            frames = [await communicator.receive_json_from() for _ in range(2)]
+            await communicator.disconnect()
+            return frames
+
+        established, resync = async_to_sync(scenario)()
+        self.assertFalse(established["resumed"])
+        self.assertEqual(resync["type"], "sync.required")
+
+    def test_mark_read_is_buffered_until_flush(self):
+        older, newer = [Message.objects.create(group=self.group, author=self.mentor.user, text="Hi") for _ in range(2)]
+
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+            await communicator.send_json_to({"action": "mark_read", "messageId": newer.pk})
+            await communicator.send_json_to({"action": "mark_read", "messageId": older.pk})
+            await communicator.send_json_to({"action": "ping"})
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertFalse(ReadMarker.objects.exists())
+        flush_read_markers()
+        marker = ReadMarker.objects.get(user=self.student.user, group=self.group)
+        self.assertEqual(marker.last_read_message_id, newer.pk)
+
+
+
+    def test_reactions_broadcast_deltas_and_flush_counts_later(self):
+        message = Message.objects.create(group=self.group, author=self.mentor.user, text="React to me")
+
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+            for _ in range(2):
+                await communicator.send_json_to({"action": "react", "messageId": message.pk, "emoji": "🎉"})
+            await communicator.send_json_to({"action": "ping"})
+            frames = [await communicator.receive_json_from() for _ in range(2)]
+            await communicator.disconnect()
+            return frames
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delta, pong = async_to_sync(scenario)()
+        self.assertEqual(delta["type"], "reaction.delta")
+        self.assertEqual(
+            delta["payload"],
+            {"messageId": message.pk, "emoji": "🎉", "userId": self.student.user.pk, "delta": 1},
+        )
+        self.assertEqual(pong["type"], "pong")
+
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_counts, {})
+        flush_reaction_counts()
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_counts, {"🎉": 1})
+
+    def test_send_message_only_inserts(self):
+        async def scenario():
+            communicator = self.open_socket(self.student.user)
+            await self.handshake(communicator)
+            await communicator.send_json_to({"action": "send_message", "text": "Over the socket"})
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame
+
+        with CaptureQueriesContext(connection) as queries:
+            frame = async_to_sync(scenario)()
+
+        self.assertEqual(frame["type"], "message.created")
+        self.assertEqual(frame["payload"]["text"], "Over the socket")
+        self.assertEqual(
+            [query["sql"].split()[0] for query in queries.captured_queries if '"chat_message' in query["sql"]],
+            ["INSERT"],
+        )
+
+    def test_normalized_sockets_send_each_author_once(self):
+        async def scenario():
+            communicator = self.open_socket(self.student.user, query="format=normalized")
+            await self.handshake(communicator)
+            frames = []
+            for text in ("First", "Second"):
+                await communicator.send_json_to({"action": "send_message", "text": text})
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return frames
+
+        first, second = async_to_sync(scenario)()
+        author_id = self.student.user.pk
+        self.assertEqual(first["payload"]["author"], author_id)
+        self.assertEqual(list(first["users"]), [str(author_id)])
+        self.assertEqual(second["payload"]["author"], author_id)
+        self.assertNotIn("users", second)
+
+    def test_presence_snapshot_transitions_and_coalesced_typing(self):
+        async def scenario():
+            watcher = self.open_socket(self.mentor.user)
+            _, watcher_snapshot = await self.handshake(watcher)
+
+            student = self.open_socket(self.student.user)
+            _, student_snapshot = await self.handshake(student)
+            online = await watcher.receive_json_from()
+
+            for _ in range(3):
+                await student.send_json_to({"action": "typing"})
+            await student.send_json_to({"action": "ping"})
+            await student.receive_json_from()
+            typing = await watcher.receive_json_from()
+
+            await student.disconnect()
+            offline = await watcher.receive_json_from()
+            await watcher.disconnect()
+            return watcher_snapshot, student_snapshot, online, typing, offline
+
+        watcher_snapshot, student_snapshot, online, typing, offline = async_to_sync(scenario)()
+        student_id, mentor_id = self.student.user.pk, self.mentor.user.pk
+        self.assertEqual(watcher_snapshot["userIds"], [mentor_id])
+        self.assertEqual(student_snapshot["userIds"], sorted([student_id, mentor_id]))
+        self.assertEqual(online, {"type": "presence.changed", "payload": {"userId": student_id, "online": True}})
+        self.assertEqual(typing, {"type": "typing", "payload": {"userId": student_id}})
+        self.assertEqual(offline, {"type": "presence.changed", "payload": {"userId": student_id, "online": False}})
+
+    def test_pruned_presence_entries_broadcast_offline(self):
+        # A connection of a crashed process: its heartbeat has expired.
+        get_redis_client().zadd(presence_key(self.group.pk), {f"{self.student.user.pk}:gone": time.time() - 1})
+
+        async def scenario():
+            watcher = self.open_socket(self.mentor.user)
+            _, snapshot = await self.handshake(watcher)
+            offline = await watcher.receive_json_from()
+            await watcher.disconnect()
+            return snapshot, offline
+
+        snapshot, offline = async_to_sync(scenario)()
+        self.assertEqual(snapshot["userIds"], [self.mentor.user.pk])
+        self.assertEqual(
+            offline, {"type": "presence.changed", "payload": {"userId": self.student.user.pk, "online": False}}
+        )
+
+
+class MultiplexChatConsumerTests(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.mentor = self.create_user("mux.mentor@example.com", role="mentor", status="active")
+        self.first = self.create_group(group_id="BTF030", mentor=self.mentor.user)
+        self.second = self.create_group(group_id="BTF031", mentor=self.mentor.user)
+        self.foreign = self.create_group(group_id="BTF032")
+
+    def open_socket(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/")
+        communicator.scope["user"] = user
+        return communicator
+
+    def test_subscribe_checks_access_in_one_query_and_tags_events(self):
+        async def scenario():
+            communicator = self.open_socket(self.mentor.user)
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to(
+                {"action": "subscribe", "groupIds": ["BTF030", "BTF031", "BTF032", "NOPE"]}
+            )
+            subscribed = await communicator.receive_json_from()
+
+            await sync_to_async(broadcast_message_event)("BTF031", "message.created", {"id": 5})
+            first_event = await communicator.receive_json_from()
+
+            await communicator.send_json_to({"action": "unsubscribe", "groupIds": ["BTF031"]})
+            unsubscribed = await communicator.receive_json_from()
+            await sync_to_async(broadcast_message_event)("BTF031", "message.created", {"id": 6})
+            await sync_to_async(broadcast_message_event)("BTF030", "message.created", {"id": 7})
+            second_event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return subscribed, first_event, unsubscribed, second_event
+
+        with CaptureQueriesContext(connection) as queries:
+            subscribed, first_event, unsubscribed, second_event = async_to_sync(scenario)()
+
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual([item["groupId"] for item in subscribed["groups"]], ["BTF030", "BTF031"])
+        self.assertEqual(subscribed["denied"], ["BTF032", "NOPE"])
+        self.assertEqual((first_event["groupId"], first_event["payload"]["id"]), ("BTF031", 5))
+        self.assertEqual(unsubscribed["groupIds"], ["BTF031"])
+        self.assertEqual((second_event["groupId"], second_event["payload"]["id"]), ("BTF030", 7))
+
+    def test_revocation_ends_only_that_subscription(self):
+        def reassign_mentor():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.second.mentor = self.create_user("mux.other@example.com", role="mentor").user
+                self.second.save()
+
+        async def scenario():
+            communicator = self.open_socket(self.mentor.user)
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "subscribe", "groupIds": ["BTF030", "BTF031"]})
+            await communicator.receive_json_from()
+
+            await sync_to_async(reassign_mentor)()
+            revoked = await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "ping"})
+            pong = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return revoked, pong
+
+        revoked, pong = async_to_sync(scenario)()
+        self.assertEqual(revoked, {"type": "access.revoked", "groupId": "BTF031"})
+        self.assertEqual(pong["type"], "pong")
+
+    def test_moderators_receive_queue_size_updates(self):
+        supervisor = self.create_user("mux.supervisor@example.com", role="supervisor")
+
+        async def scenario():
+            communicator = self.open_socket(supervisor.user)
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await sync_to_async(notify_moderation_queue)()
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame
+
+        Message.objects.create(
+            group=self.first,
+            author=self.mentor.user,
+            text="Held",
+            moderation_status=Message.ModerationStatus.PENDING,
+        )
+        self.assertEqual(async_to_sync(scenario)(), {"type": "moderation.queue", "payload": {"pending": 1}})
+
+class FirehoseChatConsumerTests(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.admin = self.create_admin("firehose.admin@example.com")
+        self.create_group(group_id="BTF040", track="AUS-NSW")
+        self.create_group(group_id="BTF041", track="AUS-VIC")
+
+    def open_socket(self, user, query=""):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), "/ws/chat/firehose/" + (f"?{query}" if query else "")
+        )
+        communicator.scope["user"] = user
+        return communicator
+
+    @staticmethod
+    def message(message_id, text, status="approved"):
+        return {"id": message_id, "text": text, "moderation": {"status": status}}
+
+    def test_streams_events_of_every_group_from_one_subscription(self):
+        async def scenario():
+            communicator = self.open_socket(self.admin.user)
+            await communicator.connect()
+            established = await communicator.receive_json_from()
+            listening = await sync_to_async(has_listeners)(FIREHOSE)
+            await sync_to_async(broadcast_message_event)("BTF040", "message.created", self.message(1, "hi"))
+            await sync_to_async(broadcast_message_event)("BTF041", "message.created", self.message(2, "yo"))
+            frames = [await communicator.receive_json_from() for _ in range(2)]
+            await communicator.disconnect()
+            return established, listening, frames
+
+        established, listening, frames = async_to_sync(scenario)()
+        self.assertEqual(established["type"], "connection.established")
+        self.assertTrue(listening)
+        self.assertEqual(
+            [(frame["groupId"], frame["payload"]["id"]) for frame in frames], [("BTF040", 1), ("BTF041", 2)]
+        )
+        self.assertFalse(has_listeners(FIREHOSE))
+
+    def test_filters_by_track_status_and_keyword(self):
+        async def scenario():
+            communicator = self.open_socket(self.admin.user, "track=AUS-VIC")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await sync_to_async(broadcast_message_event)("BTF040", "message.created", self.message(1, "other track"))
+            await sync_to_async(broadcast_message_event)("BTF041", "message.created", self.message(2, "in track"))
+            by_track = await communicator.receive_json_from()
+
+            await communicator.send_json_to({"action": "filter", "status": ["pending"], "keyword": "Spam"})
+            updated = await communicator.receive_json_from()
+            await sync_to_async(broadcast_message_event)("BTF041", "message.created", self.message(3, "spam"))
+            await sync_to_async(broadcast_message_event)(
+                "BTF041", "message.created", self.message(4, "more SPAM", status="pending")
+            )
+            await sync_to_async(broadcast_message_event)(
+                "BTF040",
+                "messages.updated",
+                {"messages": [self.message(5, "spam", status="pending"), self.message(6, "fine", status="pending")]},
+            )
+            by_content = [await communicator.receive_json_from() for _ in range(2)]
+            await communicator.send_json_to({"action": "filter", "status": ["unknown"]})
+            error = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return by_track, updated, by_content, error
+
+        by_track, updated, by_content, error = async_to_sync(scenario)()
+        self.assertEqual(by_track["payload"]["id"], 2)
+        self.assertEqual(updated["filter"], {"track": [], "groupIds": [], "status": ["pending"], "keyword": "spam"})
+        self.assertEqual(by_content[0]["payload"]["id"], 4)
+        self.assertEqual([message["id"] for message in by_content[1]["payload"]["messages"]], [5])
+        self.assertEqual(error["error"], "validation_error")
+
+    def test_resolves_tracks_of_new_groups_off_the_hub_loop(self):
+        async def scenario():
+            communicator = self.open_socket(self.admin.user, "track=AUS-VIC")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await sync_to_async(self.create_group)(group_id="BTF042", track="AUS-VIC")
+            await sync_to_async(self.create_group)(group_id="BTF043", track="AUS-NSW")
+            with patch("chat.consumers._group_tracks", wraps=_group_tracks) as lookup:
+                for group_id, message_id in (("BTF043", 1), ("BTF042", 2), ("BTF042", 3), ("BTF041", 4)):
+                    await sync_to_async(broadcast_message_event)(
+                        group_id, "message.created", self.message(message_id, "new group")
+                    )
+                frames = [await communicator.receive_json_from() for _ in range(3)]
+            await communicator.disconnect()
+            return frames, lookup.call_count
+
+        frames, lookups = async_to_sync(scenario)()
+        ids = [frame["payload"]["id"] for frame in frames]
+        self.assertEqual(sorted(ids), [2, 3, 4])
+        self.assertLess(ids.index(2), ids.index(3))
+        # One lookup per new group, however many of its events arrive.
+        self.assertEqual(lookups, 2)
+
+    def test_rejects_users_without_moderation_access(self):
+        student = self.create_student("firehose.student@example.com")
+
+        async def scenario():
+            communicator = self.open_socket(student.user)
+            return await communicator.connect()
+
+        self.assertEqual(async_to_sync(scenario)(), (False, 4403))
+
+
+class LocalFanoutTests(SimpleTestCase):
+    class Listener:
+        def __init__(self):
+            self.received = []
+
+        async def receive_local(self, message):
+            self.received.append(message)
+
+    def test_group_memberships_are_renewed_before_they_expire(self):
+        async def scenario():
+            layer = InMemoryChannelLayer(group_expiry=0.4)
+            hub = LocalFanout(layer)
+            listener = self.Listener()
+            await hub.subscribe("BTF090", listener)
+            joined = layer.groups["group_chat_BTF090"][hub.channel_name]
+            await asyncio.sleep(0.3)
+            renewed = layer.groups["group_chat_BTF090"][hub.channel_name]
+            await hub.unsubscribe("BTF090", listener)
+            return joined, renewed
+
+        joined, renewed = async_to_sync(scenario)()
+        self.assertGreater(renewed, joined)
+
+    def test_reader_survives_a_failed_receive(self):
+        class FlakyLayer(InMemoryChannelLayer):
+            failed = False
+
+            async def receive(self, channel):
+                if not self.failed:
+                    self.failed = True
+                    raise ConnectionError("layer unavailable")
+                return await super().receive(channel)
+
+        async def scenario():
+            layer = FlakyLayer()
+            hub = LocalFanout(layer)
+            listener = self.Listener()
+            with patch("chat.fanout.READ_RETRY_SECONDS", 0):
+                await hub.subscribe("BTF091", listener)
+                await layer.group_send("group_chat_BTF091", {"type": "chat.message", "group_id": "BTF091"})
+                for _ in range(50):
+                    if listener.received:
+                        break
+                    await asyncio.sleep(0.01)
+                await hub.unsubscribe("BTF091", listener)
+            return listener.received
+
+        with self.assertLogs("chat.fanout", level="ERROR"):
+            received = async_to_sync(scenario)()
+        self.assertEqual(len(received), 1)
+
+
+class DrainTests(SimpleTestCase):
+    class Socket:
+        def __init__(self, broken=False):
+            self.broken = broken
+            self.closed_with = None
+
+        async def announce_drain(self, reconnect_in):
+            if self.broken:
+                raise RuntimeError("transport gone")
+
+        async def close(self, code=None):
+            self.closed_with = code
+
+    def test_failed_announcement_does_not_stop_the_drain(self):
+        sockets = [self.Socket(broken=True), self.Socket()]
+
+        async def scenario():
+            for socket in sockets:
+                drain.track(socket)
+            drained = await drain.drain_local_sockets()
+            for socket in sockets:
+                drain.untrack(socket)
+            return drained
+
+        with patch.object(drain, "DRAIN_WINDOW_SECONDS", 0), self.assertLogs("chat.drain", level="ERROR"):
+            self.assertEqual(async_to_sync(scenario)(), 2)
+        self.assertEqual([socket.closed_with for socket in sockets], [drain.SERVICE_RESTART] * 2)
+
+
+class IdleSweeperTests(SimpleTestCase):
+    def test_sockets_leaving_during_an_eviction_are_skipped(self):
+        async def scenario():
+            sweeper = IdleSweeper()
+            log = []
+
+            class Consumer:
+                def __init__(self, name):
+                    self.name = name
+                    self.also_leaving = []
+
+                async def evict(self, reason, code):
+                    log.append(f"{self.name} evicted")
+                    await asyncio.sleep(0)
+                    # Closing disconnects the socket, and others may leave meanwhile.
+                    for consumer in [self, *self.also_leaving]:
+                        sweeper.forget(consumer)
+                    await asyncio.sleep(0)
+                    log.append(f"{self.name} closed")
+
+            first, second, third = Consumer("first"), Consumer("second"), Consumer("third")
+            first.also_leaving.append(second)
+            for consumer in (first, second, third):
+                sweeper.watch(consumer)
+            task = sweeper._task
+            await asyncio.sleep(0.3)
+            sweeper.watch(Consumer("late"))
+            await asyncio.sleep(0.3)
+            return log, task
+
+        with patch("chat.connections.HEARTBEAT_DEADLINE_SECONDS", 0.1):
+            log, task = async_to_sync(scenario)()
+        self.assertEqual(
+            log, ["first evicted", "first closed", "third evicted", "third closed", "late evicted", "late closed"]
+        )
+        self.assertTrue(task.done())
+        self.assertFalse(task.cancelled())
+        self.assertIsNone(task.exception())
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def run_queue(self, policy, frames, *, max_size=2):
+        """Fill a queue whose client is stalled, then let it drain."""
+
+        async def scenario():
+            sent = []
+            release = asyncio.Event()
+
+            async def slow_send(frame):
+                await release.wait()
+                sent.append(frame)
+
+            queue = OutboundQueue(slow_send, max_size=max_size, policy=policy)
+            queue.start()
+            queue.put(frames[0], key=frames[0]["payload"]["id"])
+            await asyncio.sleep(0)  # writer picks up the first frame and stalls
+            for frame in frames[1:]:
+                queue.put(frame, key=frame["payload"]["id"])
+            release.set()
+            while len(queue):
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            await queue.stop()
+            return sent
+
+        return async_to_sync(scenario)()
+
+    @staticmethod
+    def frame(event, message_id, text=""):
+        return {"type": event, "payload": {"id": message_id, "text": text, "cursor": f"c{message_id}"}}
+
+    def test_resync_policy_replaces_backlog_with_marker(self):
+        frames = [self.frame("message.created", index) for index in range(5)]
+        sent = self.run_queue(RESYNC, frames)
+
+        self.assertEqual(sent[0], frames[0])
+        self.assertEqual(sent[1]["type"], "sync.required")
+        self.assertEqual(sent[2:], frames[4:])
+        self.assertEqual(metrics.snapshot()["counters"]["send_queue.resyncs"], 1)
+
+    def test_coalesce_policy_merges_updates_for_queued_message(self):
+        frames = [
+            self.frame("message.created", 1),
+            self.frame("message.created", 2, "draft"),
+            self.frame("message.created", 3),
+            self.frame("message.updated", 2, "final"),
+        ]
+        sent = self.run_queue(COALESCE, frames)
+
+        self.assertEqual([frame["payload"]["id"] for frame in sent], [1, 2, 3])
+        self.assertEqual(sent[1]["type"], "message.created")
+        self.assertEqual(sent[1]["payload"]["text"], "final")
+        self.assertEqual(metrics.snapshot()["counters"]["send_queue.coalesced"], 1)
+
+    def test_send_error_closes_the_socket(self):
+        async def scenario():
+            closed = asyncio.Event()
+
+            async def broken_send(frame):
+                raise ConnectionResetError("gone")
+
+            async def close():
+                closed.set()
+
+            queue = OutboundQueue(broken_send, on_send_error=close)
+            queue.start()
+            queue.put(self.frame("message.created", 1))
+            await asyncio.wait_for(closed.wait(), 1)
+            queue.put(self.frame("message.created", 2))
+            return len(queue)
+
+        with self.assertLogs("chat.outbound", level="ERROR"):
+            self.assertEqual(async_to_sync(scenario)(), 0)
+        self.assertEqual(metrics.snapshot()["counters"]["send_queue.send_errors"], 1)
@@ -1,6 +1,7 @@
 from django.urls import reverse
 from rest_framework import status
 
+from chat.services import create_message
 from groups.models import Group, Milestone, Task
 
 from .base import AuthenticatedAPITestCase
@@ -47,6 +48,20 @@ class GroupEndpointsTests(AuthenticatedAPITestCase):
         self.assertEqual(len(payload["groups"]), 1)
         self.assertEqual(payload["groups"][0]["id"], self.group.id)
 
+    def test_my_groups_sorts_by_chat_activity_with_last_message_preview(self):
+        quiet = self.create_group(group_id="BTF001", name="Quiet", members=[self.student.user])
+        create_message(self.group, self.student.user, "Latest update on the assay")
+
+        url = reverse("groups:group-my-groups")
+        self.authenticate(self.student.user)
+        groups = self.client.get(url, {"sort": "activity"}).json()["groups"]
+
+        self.assertEqual([group["id"] for group in groups], [self.group.id, quiet.id])
+        self.assertEqual(groups[0]["messageCount"], 1)
+        self.assertEqual(groups[0]["lastMessage"]["preview"], "Latest update on the assay")
+        self.assertEqual(groups[0]["lastMessage"]["author"]["id"], self.student.user.id)
+        self.assertIsNone(groups[1]["lastMessage"])
+
     def test_retrieve_group_returns_members_and_milestones(self):
         url = reverse("groups:group-detail", kwargs={"pk": self.group.pk})
         self.authenticate(self.student.user)